@@ -0,0 +1,592 @@
+"""
+Benchmark di youtrack-mcp.py contro un YouTrack e un endpoint chat/completions finti,
+in locale e con latenza configurabile: nessun servizio reale viene contattato.
+
+Ogni workload viene ripetuto --runs volte; per ciascuno si riportano le richieste
+per azione (metodo + endpoint) e il tempo di esecuzione (media e percentili).
+Con --json il report viene salvato e può essere usato come --baseline di un
+run successivo: se richieste o p50 peggiorano oltre --max-regression lo script
+esce con codice 1.
+
+Esempio:
+    python youtrack-bench.py --yt-latency 20 --llm-latency 300 --runs 5
+    python youtrack-bench.py --json bench.json
+    python youtrack-bench.py --baseline bench.json --max-regression 20
+"""
+
+import os
+import sys
+import io
+import json
+import re
+import time
+import random
+import argparse
+import threading
+import importlib.util
+from collections import Counter
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeServer:
+    """
+    YouTrack REST + chat/completions finti sulla stessa porta locale.
+
+    Gli issue vivono in memoria; ogni richiesta viene contata per "metodo endpoint"
+    (gli ID nel path sono normalizzati, es. POST /api/issues/{id}) e ritardata di
+    yt_latency o llm_latency secondi (± jitter).
+
+    Le risposte LLM vengono generate a pezzi di CHUNK_CHARS caratteri, ciascuno dopo
+    llm_chunk_latency secondi: in streaming (stream=true) i pezzi arrivano come
+    eventi SSE man mano, altrimenti la risposta arriva tutta alla fine.
+    """
+
+    CHUNK_CHARS = 24
+
+    PROJECT = {"id": "0-1", "shortName": "BENCH", "name": "Benchmark"}
+    USERS = [
+        {"id": "1-1", "login": "admin", "fullName": "Admin User"},
+        {"id": "1-2", "login": "mario", "fullName": "Mario Rossi"},
+    ]
+    LINK_TYPES = [
+        {"id": "lt-sub", "name": "Subtask", "sourceToTarget": "parent for", "targetToSource": "subtask of"},
+        {"id": "lt-rel", "name": "Relates", "sourceToTarget": "relates to", "targetToSource": "relates to"},
+    ]
+
+    def __init__(self, yt_latency: float = 0.0, llm_latency: float = 0.0, jitter: float = 0.0,
+                 llm_chunk_latency: float = 0.0):
+        self.yt_latency = yt_latency
+        self.llm_latency = llm_latency
+        self.llm_chunk_latency = llm_chunk_latency
+        self.jitter = jitter
+        self.issues = {}
+        self.users = list(self.USERS)
+        self.counter = 0
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counts(self) -> Counter:
+        with self.lock:
+            counts, self.requests = self.requests, Counter()
+        return counts
+
+    # --- stato ---
+
+    def add_issue(self, summary: str, fields: dict | None = None, parents: list | None = None) -> dict:
+        with self.lock:
+            self.counter += 1
+            number = self.counter
+        issue = {
+            "number": number,
+            "id": f"2-{number}",
+            "idReadable": f"BENCH-{number}",
+            "summary": summary,
+            "description": "",
+            "customFields": [
+                {"name": name, "value": {"name": value}} for name, value in (fields or {}).items()
+            ],
+            "parents": list(parents or []),
+        }
+        self.issues[issue["idReadable"]] = issue
+        return issue
+
+    def seed(self, count: int):
+        """Popola il progetto con 'count' issue con stato/priorità/assegnatario vari."""
+        states = ["Open", "In Progress", "Fixed", "Verified"]
+        priorities = ["Critical", "Major", "Normal", "Minor"]
+        rnd = random.Random(count)
+        for n in range(count):
+            self.add_issue(
+                f"Issue di benchmark numero {n} con un titolo di lunghezza realistica",
+                {"State": rnd.choice(states), "Priority": rnd.choice(priorities),
+                 "Type": "Task", "Assignee": rnd.choice(self.USERS)["login"]},
+            )
+
+    def seed_users(self, count: int):
+        """Rubrica di 'count' utenti oltre a quelli di USERS."""
+        self.users = list(self.USERS) + [
+            {"id": f"1-{n + 100}", "login": f"utente{n}", "fullName": f"Utente Benchmark {n}"}
+            for n in range(count)
+        ]
+
+    def _find(self, key: str) -> dict | None:
+        if key in self.issues:
+            return self.issues[key]
+        for issue in self.issues.values():
+            if issue["id"] == key:
+                return issue
+        return None
+
+    def _issue_json(self, issue: dict) -> dict:
+        return {
+            "id": issue["id"],
+            "idReadable": issue["idReadable"],
+            "summary": issue["summary"],
+            "description": issue["description"],
+            "project": {"shortName": self.PROJECT["shortName"]},
+            "customFields": issue["customFields"],
+            "updated": int(time.time() * 1000),
+            "links": [{
+                "direction": "INWARD",
+                "linkType": {"name": "Subtask"},
+                "issues": [{"idReadable": p} for p in issue["parents"]],
+            }],
+        }
+
+    # --- risposte ---
+
+    def _route(self, method: str, path: str) -> str:
+        path = re.sub(r"/api/(issues|users|admin/projects)/[^/]+", r"/api/\1/{id}", path)
+        path = re.sub(r"/links/[^/]+/", "/links/{id}/", path)
+        return f"{method} {path}"
+
+    def _delay(self, seconds: float):
+        if seconds > 0:
+            time.sleep(max(0.0, seconds + random.uniform(-self.jitter, self.jitter)))
+
+    def _llm_reply(self, body: dict) -> dict:
+        if body.get("tools"):
+            # Interpretazione di un comando: risposta come chiamata di funzione.
+            # "Epic con N figli" produce un piano create_epic_with_children
+            command = body["messages"][-1].get("content", "")
+            match = re.search(r"Epic con (\d+) figli", command)
+            if match:
+                name = "create_epic_with_children"
+                arguments = json.dumps({
+                    "project": "BENCH",
+                    "epic": {"summary": "Epic di benchmark", "priority": "Major"},
+                    "children": [
+                        {"summary": f"Figlio {n} del piano di benchmark", "priority": "Normal"}
+                        for n in range(int(match.group(1)))
+                    ],
+                    "link_type": "subtask",
+                })
+            else:
+                name, arguments = "list_issues", json.dumps({"filters": {"project": "BENCH"}})
+            return {"role": "assistant", "content": None, "tool_calls": [{
+                "id": "call_bench", "type": "function",
+                "function": {"name": name, "arguments": arguments},
+            }]}
+        return {"role": "assistant",
+                "content": "Riassunto: attività in corso, nessun blocco critico, priorità da rivedere."}
+
+    def _llm_stream(self, message: dict, pieces: list, prompt: int, completion: int):
+        """Eventi SSE di chat/completions in streaming, un pezzo di testo ogni llm_chunk_latency."""
+        def event(delta: dict, finish_reason=None) -> bytes:
+            chunk = {"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        calls = message.get("tool_calls")
+        if calls:
+            yield event({"tool_calls": [{"index": 0, "id": calls[0]["id"], "type": "function",
+                                         "function": {"name": calls[0]["function"]["name"], "arguments": ""}}]})
+        for piece in pieces:
+            self._delay(self.llm_chunk_latency)
+            if calls:
+                yield event({"tool_calls": [{"index": 0, "function": {"arguments": piece}}]})
+            else:
+                yield event({"content": piece})
+        yield event({}, "tool_calls" if calls else "stop")
+        usage = {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+        yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    def handle(self, method: str, raw_path: str, body: dict | None):
+        url = urlparse(raw_path)
+        path, query = url.path, parse_qs(url.query)
+        with self.lock:
+            self.requests[self._route(method, path)] += 1
+
+        if path.endswith("/chat/completions"):
+            self._delay(self.llm_latency)
+            message = self._llm_reply(body or {})
+            prompt = sum(len(m.get("content") or "") for m in (body or {}).get("messages", [])) // 4
+            completion = len(json.dumps(message)) // 4
+            text = message["tool_calls"][0]["function"]["arguments"] if message.get("tool_calls") else message["content"]
+            pieces = [text[i:i + self.CHUNK_CHARS] for i in range(0, len(text), self.CHUNK_CHARS)]
+            if (body or {}).get("stream"):
+                return 200, self._llm_stream(message, pieces, prompt, completion)
+            self._delay(self.llm_chunk_latency * len(pieces))
+            return 200, {
+                "choices": [{"message": message,
+                             "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+                "usage": {"prompt_tokens": prompt, "completion_tokens": completion,
+                          "total_tokens": prompt + completion},
+            }
+
+        self._delay(self.yt_latency)
+
+        if method == "GET":
+            if path.startswith("/api/admin/projects"):
+                wanted = path.rsplit("/", 1)[-1]
+                if wanted in ("projects", self.PROJECT["shortName"]):
+                    return 200, self.PROJECT if wanted != "projects" else [self.PROJECT]
+                return 404, {"error": "not found"}
+            if path == "/api/users":
+                if "query" in query:
+                    q = query["query"][0].split(":", 1)[-1]
+                    return 200, [u for u in self.users if q in (u["login"], u["fullName"])]
+                # elenco completo a pagine (UserDirectory)
+                skip = int(query.get("$skip", ["0"])[0])
+                top = int(query.get("$top", [str(len(self.users))])[0])
+                return 200, self.users[skip:skip + top]
+            if path.startswith("/api/users/"):
+                login = path.rsplit("/", 1)[-1]
+                user = next((u for u in self.users if u["login"] == login), None)
+                return (200, user) if user else (404, {"error": "not found"})
+            if path == "/api/issueLinkTypes":
+                return 200, self.LINK_TYPES
+            if path == "/api/issues":
+                items = sorted(self.issues.values(), key=lambda i: -i["number"])
+                q = query.get("query", [""])[0]
+                match = re.search(r"subtask of: (.+)", q, re.IGNORECASE)
+                if match:
+                    parents = {p.strip() for p in match.group(1).split(",")}
+                    items = [i for i in items if parents & set(i["parents"])]
+                skip = int(query.get("$skip", ["0"])[0])
+                top = int(query.get("$top", [str(len(items))])[0])
+                return 200, [self._issue_json(i) for i in items[skip:skip + top]]
+            if path.startswith("/api/issues/"):
+                issue = self._find(path.rsplit("/", 1)[-1])
+                return (200, self._issue_json(issue)) if issue else (404, {"error": "not found"})
+            return 404, {"error": "not found"}
+
+        if method == "POST":
+            body = body or {}
+            if path == "/api/issues":
+                fields = {
+                    f["name"]: (f.get("value") or {}).get("name") or (f.get("value") or {}).get("login")
+                    for f in body.get("customFields", [])
+                }
+                issue = self.add_issue(body.get("summary", ""), fields)
+                return 200, {"id": issue["id"], "idReadable": issue["idReadable"]}
+            if path == "/api/commands":
+                match = re.match(r"subtask of (\S+)", body.get("query", ""), re.IGNORECASE)
+                for ref in body.get("issues", []):
+                    issue = self._find(ref.get("idReadable") or ref.get("id", ""))
+                    if issue and match:
+                        issue["parents"].append(match.group(1))
+                return 200, {}
+            match = re.match(r"/api/issues/([^/]+)/links/[^/]+/issues", path)
+            if match:
+                issue, target = self._find(match.group(1)), self._find(body.get("id", ""))
+                if issue and target:
+                    issue["parents"].append(target["idReadable"])
+                return 200, {}
+            if path.startswith("/api/issues/"):
+                issue = self._find(path.rsplit("/", 1)[-1])
+                if not issue:
+                    return 404, {"error": "not found"}
+                if "summary" in body:
+                    issue["summary"] = body["summary"]
+                for field in body.get("customFields", []):
+                    value = field.get("value") or {}
+                    issue["customFields"] = [f for f in issue["customFields"] if f["name"] != field["name"]]
+                    issue["customFields"].append(
+                        {"name": field["name"], "value": {"name": value.get("name") or value.get("login")}})
+                return 200, {"id": issue["id"], "idReadable": issue["idReadable"]}
+            return 404, {"error": "not found"}
+
+        if method == "DELETE" and path.startswith("/api/issues/"):
+            issue = self._find(path.rsplit("/", 1)[-1])
+            if issue:
+                del self.issues[issue["idReadable"]]
+                return 200, {}
+            return 404, {"error": "not found"}
+        return 405, {"error": "method not allowed"}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, come YouTrack reale
+            # Header e body in un'unica scrittura: con scritture separate Nagle e
+            # delayed ACK aggiungono ~40ms a ogni richiesta keep-alive
+            wbufsize = 1 << 16
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                status, payload = server.handle(method, self.path, json.loads(raw) if raw else None)
+                if not isinstance(payload, (dict, list)):
+                    # risposta in streaming (SSE) con transfer-encoding chunked
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for part in payload:
+                        self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def do_DELETE(self):
+                self._serve("DELETE")
+
+        return Handler
+
+
+def load_tool(server_url: str):
+    """Importa youtrack-mcp.py (nome con trattino) puntando l'endpoint OpenAI al server finto."""
+    os.environ["OPENAI_BASE_URL"] = f"{server_url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    # Niente cache persistente/mirror della macchina che esegue il benchmark
+    os.environ["YT_CACHE_DISABLE"] = "1"
+    os.environ["YT_MIRROR"] = "0"
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "youtrack-mcp.py")
+    spec = importlib.util.spec_from_file_location("youtrack_mcp", path)
+    module = importlib.util.module_from_spec(spec)
+    with redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values: list, pct: float) -> float:
+    """Percentile con interpolazione lineare (values non vuota)."""
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+# --- workload ---
+
+def make_workloads(tool, server: FakeServer, args) -> dict:
+    """Ritorna {nome: (setup, run)}: setup prepara lo stato del server, run è la parte misurata."""
+
+    def new_client():
+        transport = tool.HttpTransport(pool_size=max(tool.YT_HTTP_POOL_SIZE, args.max_workers),
+                                       retries=0)
+        return tool.YouTrackClient(server.url, "bench-token", transport=transport)
+
+    def new_parser():
+        return tool.GPTParser(tool.OPENAI_API_KEY, fast_path=None, parse_cache=None)
+
+    def seed_issues():
+        server.issues.clear()
+        server.seed(args.issues)
+
+    def run_epic():
+        children = [
+            {"summary": f"Figlio {n}", "assignee": "mario" if n % 2 else "", "priority": "Major"}
+            for n in range(args.children)
+        ]
+        result = new_client().create_epic_with_children(
+            "BENCH", {"summary": "Epic di benchmark"}, children, max_workers=args.max_workers)
+        assert len(result["children"]) == args.children, result["failures"]
+
+    def run_list():
+        count = sum(1 for _ in new_client().iter_issues({"project": "BENCH"}, page_size=args.page_size))
+        assert count == args.issues, count
+
+    def run_summary():
+        summarizer = tool.MapReduceSummarizer(new_parser())
+        summarizer.summarize("BENCH", new_client().iter_issues({"project": "BENCH"}, page_size=args.page_size))
+
+    def seed_tree():
+        server.issues.clear()
+        level = [server.add_issue("Epic radice", {"Type": "Epic"})["idReadable"]]
+        server.tree_root = level[0]
+        for _ in range(args.depth):
+            level = [
+                server.add_issue(f"Nodo figlio di {parent}", {"Type": "Task"}, [parent])["idReadable"]
+                for parent in level for _ in range(args.fan_out)
+            ]
+
+    def run_tree():
+        tree = new_client().get_epic_tree(server.tree_root, max_depth=args.depth + 1)
+        assert not tree["truncated"]
+
+    def run_plan(stream: bool):
+        parser = new_parser()
+        client = new_client()
+        command = f"Crea un Epic con {args.children} figli nel progetto BENCH"
+        plan = tool.StreamedEpicPlan(client, max_workers=args.max_workers) if stream else None
+        action_data = parser.parse_command(command, use_cache=False, on_value=plan.on_value if plan else None)
+        if plan is not None and plan.started:
+            result = plan.finish(action_data)
+        else:
+            result = tool.execute_action(client, parser, action_data, max_workers=args.max_workers)
+        assert len(result["children"]) == args.children, result["failures"]
+
+    def seed_assign():
+        server.issues.clear()
+        server.seed_users(args.users)
+        for n in range(args.children):
+            server.add_issue(f"Issue da assegnare {n}", {"Type": "Task"})
+
+    def run_assign(directory: bool):
+        client = new_client()
+        if directory:
+            client.users = tool.UserDirectory(client)
+        # assegnatari indicati a volte per login, a volte per nome completo
+        expected = {}
+        for n, issue_id in enumerate(sorted(server.issues)):
+            user = server.users[n % len(server.users)]
+            client.change_issue_assignee(issue_id, user["fullName"] if n % 2 else user["login"])
+            expected[issue_id] = user["login"]
+        assigned = {
+            issue_id: next(f["value"]["name"] for f in issue["customFields"] if f["name"] == "Assignee")
+            for issue_id, issue in server.issues.items()
+        }
+        assert assigned == expected, assigned
+
+    def run_parse():
+        parser = new_parser()
+        for n in range(args.commands):
+            parser.parse_command(f"mostra gli issue del progetto BENCH numero {n}", use_cache=False)
+
+    return {
+        "epic": (lambda: server.issues.clear(), run_epic),
+        "list": (seed_issues, run_list),
+        "summary": (seed_issues, run_summary),
+        "tree": (seed_tree, run_tree),
+        "parse": (lambda: None, run_parse),
+        # assegnatari risolti con i lookup HTTP o con la rubrica utenti in memoria
+        "assign": (seed_assign, lambda: run_assign(directory=False)),
+        "assign-directory": (seed_assign, lambda: run_assign(directory=True)),
+        # piano Epic+figli generato da GPT: eseguito a risposta completa o in pipeline con lo streaming
+        "plan": (lambda: server.issues.clear(), lambda: run_plan(stream=False)),
+        "plan-stream": (lambda: server.issues.clear(), lambda: run_plan(stream=True)),
+    }
+
+
+def run_benchmark(args) -> dict:
+    server = FakeServer(args.yt_latency / 1000, args.llm_latency / 1000, args.jitter / 1000,
+                        args.llm_chunk_latency / 1000).start()
+    try:
+        tool = load_tool(server.url)
+        workloads = make_workloads(tool, server, args)
+        report = {}
+        for name in args.workloads:
+            setup, run = workloads[name]
+            timings = []
+            requests_total = Counter()
+            for _ in range(args.runs):
+                setup()
+                server.reset_counts()
+                started = time.perf_counter()
+                # L'output diagnostico dello script non fa parte della misura
+                with redirect_stdout(io.StringIO()):
+                    run()
+                timings.append(time.perf_counter() - started)
+                requests_total.update(server.reset_counts())
+            report[name] = {
+                "runs": args.runs,
+                "requests": {route: n / args.runs for route, n in sorted(requests_total.items())},
+                "requests_total": sum(requests_total.values()) / args.runs,
+                "mean": sum(timings) / len(timings),
+                "p50": percentile(timings, 50),
+                "p90": percentile(timings, 90),
+                "p99": percentile(timings, 99),
+                "max": max(timings),
+            }
+        return report
+    finally:
+        server.stop()
+
+
+def print_report(report: dict, args):
+    print(f"latenza YouTrack {args.yt_latency:.0f}ms, LLM {args.llm_latency:.0f}ms, "
+          f"{args.runs} run per workload\n")
+    for name, stats in report.items():
+        print(f"▶ {name}: {stats['requests_total']:.1f} richieste/run, "
+              f"media {stats['mean'] * 1000:.1f}ms, p50 {stats['p50'] * 1000:.1f}ms, "
+              f"p90 {stats['p90'] * 1000:.1f}ms, p99 {stats['p99'] * 1000:.1f}ms, "
+              f"max {stats['max'] * 1000:.1f}ms")
+        for route, count in stats["requests"].items():
+            print(f"     {count:8.1f}  {route}")
+        print()
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Confronta con un report precedente: ritorna le regressioni oltre la soglia (in %)."""
+    problems = []
+    for name, stats in report.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        for metric in ("requests_total", "p50"):
+            before, after = old[metric], stats[metric]
+            if before > 0 and (after - before) / before * 100 > max_regression:
+                problems.append(f"{name}.{metric}: {before:.4g} -> {after:.4g} "
+                                f"(+{(after - before) / before * 100:.0f}%)")
+    return problems
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark di youtrack-mcp.py con server finti locali")
+    workloads = ["epic", "list", "summary", "tree", "parse", "assign", "assign-directory", "plan", "plan-stream"]
+    arg_parser.add_argument("--workloads", nargs="+", default=workloads, choices=workloads)
+    arg_parser.add_argument("--runs", type=int, default=5, help="Ripetizioni per workload (default: 5)")
+    arg_parser.add_argument("--yt-latency", type=float, default=20, help="Latenza YouTrack finta in ms (default: 20)")
+    arg_parser.add_argument("--llm-latency", type=float, default=200, help="Latenza LLM finta in ms (default: 200)")
+    arg_parser.add_argument("--llm-chunk-latency", type=float, default=5,
+                            help="Tempo di generazione in ms di ogni pezzo di risposta LLM (default: 5)")
+    arg_parser.add_argument("--jitter", type=float, default=0, help="Variazione casuale della latenza in ms")
+    arg_parser.add_argument("--children", type=int, default=20, help="Figli dell'Epic nel workload epic")
+    arg_parser.add_argument("--issues", type=int, default=500, help="Issue nel progetto per list/summary")
+    arg_parser.add_argument("--page-size", type=int, default=100, help="Issue per pagina in list/summary")
+    arg_parser.add_argument("--depth", type=int, default=3, help="Profondità dell'albero nel workload tree")
+    arg_parser.add_argument("--fan-out", type=int, default=4, help="Figli per nodo nel workload tree")
+    arg_parser.add_argument("--commands", type=int, default=5, help="Comandi interpretati nel workload parse")
+    arg_parser.add_argument("--users", type=int, default=200,
+                            help="Utenti aggiuntivi nella rubrica per i workload assign (default: 200)")
+    arg_parser.add_argument("--max-workers", type=int, default=8, help="Worker paralleli del client")
+    arg_parser.add_argument("--json", dest="json_path", help="Salva il report JSON in questo file")
+    arg_parser.add_argument("--baseline", help="Report JSON di riferimento con cui confrontare")
+    arg_parser.add_argument("--max-regression", type=float, default=20,
+                            help="Peggioramento massimo ammesso rispetto alla baseline, in %% (default: 20)")
+    args = arg_parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report, args)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report salvato in {args.json_path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_regression)
+        if problems:
+            print("❌ Regressioni rispetto alla baseline:")
+            for problem in problems:
+                print(f"   {problem}")
+            sys.exit(1)
+        print("✅ Nessuna regressione rispetto alla baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,22 @@
 import os
+import sys
 import json
+import time
+import re
+import random
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from bisect import bisect_left
+from datetime import datetime, timezone
 import requests
+from collections import OrderedDict, Counter, deque, namedtuple
+from contextlib import redirect_stdout
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 
 try:
@@ -9,6 +25,12 @@ try:
 except ImportError:
     OpenAI = None
 
+try:
+    # Conteggio token preciso per i prompt (opzionale)
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 # Carica variabili d'ambiente dal file .env, se presente
 load_dotenv()
 
@@ -22,653 +44,3724 @@ YT_TOKEN = os.getenv("YT_TOKEN")
 if not OPENAI_API_KEY:
     raise RuntimeError("Configurazione mancante! Assicurarsi che OPENAI_API_KEY sia impostata.")
 
+# Parametri del layer HTTP condiviso (pool keep-alive, timeout, retry)
+YT_HTTP_POOL_SIZE = int(os.getenv("YT_HTTP_POOL_SIZE", "10"))
+YT_HTTP_TIMEOUT = float(os.getenv("YT_HTTP_TIMEOUT", "30"))
+YT_HTTP_RETRIES = int(os.getenv("YT_HTTP_RETRIES", "3"))
+YT_HTTP_BACKOFF = float(os.getenv("YT_HTTP_BACKOFF", "0.5"))
+# Numero massimo di operazioni YouTrack eseguite in parallelo (es. figli di un Epic);
+# conviene che sia <= YT_HTTP_POOL_SIZE per non saturare il pool di connessioni
+YT_MAX_WORKERS = int(os.getenv("YT_MAX_WORKERS", "8"))
+# Issue per richiesta /api/commands negli aggiornamenti in blocco (bulk_update)
+YT_BULK_BATCH_SIZE = int(os.getenv("YT_BULK_BATCH_SIZE", "200"))
+# Cache persistente (SQLite) per project/user/link-type lookup, nella cache dir dell'utente
+YT_CACHE_DIR = os.getenv("YT_CACHE_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "youtrack-llm"
+)
+YT_CACHE_DISABLE = os.getenv("YT_CACHE_DISABLE") == "1"
+# Cache dei risultati di GPTParser.parse_command (0 = disabilitata)
+YT_PARSE_CACHE = os.getenv("YT_PARSE_CACHE", "1") != "0"
+YT_PARSE_CACHE_SIZE = int(os.getenv("YT_PARSE_CACHE_SIZE", "256"))
+# Pre-parser locale a regole per i comandi più semplici (0 = tutto passa da GPT)
+YT_FAST_PATH = os.getenv("YT_FAST_PATH", "1") != "0"
+# Comandi interpretati in parallelo da GPT in modalità --batch
+YT_BATCH_WORKERS = int(os.getenv("YT_BATCH_WORKERS", "4"))
+# Riassunto map-reduce dei progetti: token per blocco di issue, blocchi fusi per
+# ogni chiamata di reduce, chiamate LLM in parallelo
+YT_SUMMARY_CHUNK_TOKENS = int(os.getenv("YT_SUMMARY_CHUNK_TOKENS", "3000"))
+YT_SUMMARY_FAN_IN = int(os.getenv("YT_SUMMARY_FAN_IN", "8"))
+YT_SUMMARY_WORKERS = int(os.getenv("YT_SUMMARY_WORKERS", "4"))
+# Budget di token per ogni prompt del riassunto map-reduce e
+# lunghezza massima dei testi lunghi (summary, description) nel formato compatto
+YT_SUMMARY_PROMPT_TOKENS = int(os.getenv("YT_SUMMARY_PROMPT_TOKENS", "6000"))
+YT_PROMPT_MAX_TEXT = int(os.getenv("YT_PROMPT_MAX_TEXT", "160"))
+# Mirror locale degli issue (SQLite): età massima prima di un delta sync automatico
+# e sovrapposizione della finestra di delta sync (secondi) per tollerare fusi orari/ritardi
+YT_MIRROR = os.getenv("YT_MIRROR") == "1"
+YT_MIRROR_MAX_AGE = float(os.getenv("YT_MIRROR_MAX_AGE", "300"))
+YT_MIRROR_OVERLAP = float(os.getenv("YT_MIRROR_OVERLAP", str(24 * 3600)))
+# Rubrica utenti in memoria per risolvere gli assegnatari senza lookup HTTP,
+# ricaricata quando è più vecchia di YT_USER_DIRECTORY_MAX_AGE secondi
+YT_USER_DIRECTORY = os.getenv("YT_USER_DIRECTORY") == "1"
+YT_USER_DIRECTORY_MAX_AGE = float(os.getenv("YT_USER_DIRECTORY_MAX_AGE", "900"))
+# Modalità MCP: mostra la risposta in streaming (0 = attende la risposta completa)
+YT_MCP_STREAM = os.getenv("YT_MCP_STREAM", "1") != "0"
+# Modalità MCP con client locale (sessione MCP aperta dallo script invece del connettore OpenAI)
+YT_MCP_LOCAL = os.getenv("YT_MCP_LOCAL") == "1"
+# Modalità MCP: strumenti del server YouTrack esposti al modello, separati da virgola (vuoto = tutti)
+YT_MCP_TOOLS = [t.strip() for t in os.getenv("YT_MCP_TOOLS", "").split(",") if t.strip()]
+# Le chiamate LLM sono molto più lente di quelle REST: timeout dedicato
+OPENAI_HTTP_TIMEOUT = float(os.getenv("OPENAI_HTTP_TIMEOUT", "120"))
+# Esecuzione dei piani create_epic_with_children mentre GPT li genera (0 = a risposta completa)
+YT_PLAN_STREAM = os.getenv("YT_PLAN_STREAM", "1") != "0"
+# Tetto ai token di output per l'interpretazione di un comando (il budget normale
+# è proporzionale alla lunghezza del comando, vedi GPTParser.output_budget)
+YT_PARSE_MAX_TOKENS = int(os.getenv("YT_PARSE_MAX_TOKENS", "4000"))
+# Livello dei messaggi diagnostici (DEBUG mostra richieste e payload, WARNING solo gli avvisi)
+YT_LOG_LEVEL = os.getenv("YT_LOG_LEVEL", "WARNING").upper()
+# Tracing di azioni e chiamate HTTP/LLM (span con durate, metriche aggregate)
+YT_TRACE = os.getenv("YT_TRACE") == "1"
+# Endpoint OpenAI (stessa variabile della libreria 'openai'): proxy, gateway o server di test
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+# Modelli per carico di lavoro: l'interpretazione dei comandi usa prima un modello piccolo
+# e passa a quello di escalation solo se la risposta non supera la validazione
+# (YT_PARSE_ESCALATION_MODEL vuoto = nessuna escalation)
+YT_PARSE_MODEL = os.getenv("YT_PARSE_MODEL", "gpt-4.1-mini")
+YT_PARSE_ESCALATION_MODEL = os.getenv("YT_PARSE_ESCALATION_MODEL", "gpt-4.1")
+YT_SUMMARY_MODEL = os.getenv("YT_SUMMARY_MODEL", "gpt-4.1")
+YT_MCP_MODEL = os.getenv("YT_MCP_MODEL", "gpt-4.1")
+
+
+log = logging.getLogger("youtrack-llm")
+
+
+def endpoint_template(url: str) -> str:
+    """Path di un URL con gli ID sostituiti da {id} (es. /api/issues/{id}), per aggregare le metriche."""
+    path = urlparse(url).path
+    path = re.sub(r"/api/(issues|users|admin/projects)/[^/]+", r"/api/\1/{id}", path)
+    return re.sub(r"/links/[^/]+/", "/links/{id}/", path)
+
+
+class Span:
+    """Un'operazione tracciata: nome, tipo (action/http/llm/cache), attributi, durata e span figli."""
+
+    __slots__ = ("tracer", "name", "kind", "attrs", "start", "duration", "error", "children", "parent")
+
+    def __init__(self, tracer, name: str, kind: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.start = 0.0
+        self.duration = 0.0
+        self.error = None
+        self.children = []
+        self.parent = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.tracer._open(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.tracer._close(self)
+        return False
+
+    def to_dict(self) -> dict:
+        data = {"name": self.name, "kind": self.kind, "ms": round(self.duration * 1000, 2)}
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [c.to_dict() for c in sorted(self.children, key=lambda c: c.start)]
+        return data
+
+
+class _NoopSpan:
+    """Span vuoto restituito dal Tracer disabilitato."""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Tracing delle azioni: ogni azione (span radice) raccoglie gli span figli delle
+    chiamate HTTP/LLM e degli accessi in cache eseguiti mentre è aperta, con durata
+    e attributi (metodo, endpoint, status, byte, token, hit/miss).
+
+    Il lavoro inviato ai thread worker (es. figli di un Epic creati in parallelo) va
+    passato da bind(), che lo aggancia allo span corrente del thread che lo invia;
+    uno span aperto in un thread senza span corrente è una nuova radice. Da
+    disabilitato span() ritorna uno span vuoto condiviso, quindi la strumentazione
+    non costa nulla.
+
+    Ogni span chiuso aggiorna metriche aggregate per (tipo, nome), esportabili
+    con summary() (JSON) o prometheus() (formato testuale di Prometheus).
+    """
+
+    def __init__(self, enabled: bool = False, keep: int = 50, samples: int = 1000):
+        self.enabled = enabled
+        # Ultimi span radice completati (per 'trace' nella CLI)
+        self.traces = deque(maxlen=keep)
+        self.samples = samples
+        self.metrics = {}
+        self.cache_counts = Counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name: str, kind: str = "internal", **attrs):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, kind, attrs)
+
+    def cache(self, namespace: str, hit: bool):
+        """Registra un accesso in cache (hit/miss) come span istantaneo figlio dello span corrente."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.cache_counts[(namespace, "hit" if hit else "miss")] += 1
+        with self.span(namespace, kind="cache", hit=hit):
+            pass
+
+    def current(self):
+        """Span aperto nel thread corrente (None se nessuno)."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def bind(self, fn):
+        """
+        Ritorna 'fn' pronta per un altro thread: gli span che apre diventano figli dello
+        span corrente di chi chiama bind() (es. pool.submit(TRACER.bind(fn), ...)).
+        """
+        parent = self.current() if self.enabled else None
+        if parent is None:
+            return fn
+
+        def run(*args, **kwargs):
+            stack = self._stack()
+            stack.append(parent)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stack.pop()
+        return run
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _open(self, span: Span):
+        stack = self._stack()
+        span.parent = stack[-1] if stack else None
+        stack.append(span)
+
+    def _close(self, span: Span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        with self._lock:
+            if span.parent is not None:
+                span.parent.children.append(span)
+            else:
+                self.traces.append(span)
+            self._record(span)
+
+    def _record(self, span: Span):
+        key = (span.kind, span.name)
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = self.metrics[key] = {
+                "count": 0, "errors": 0, "seconds": 0.0, "bytes": 0,
+                "durations": deque(maxlen=self.samples),
+            }
+        metric["count"] += 1
+        metric["seconds"] += span.duration
+        metric["durations"].append(span.duration)
+        metric["bytes"] += span.attrs.get("bytes", 0)
+        status = span.attrs.get("status", 0)
+        if span.error or status >= 400:
+            metric["errors"] += 1
+
+    @staticmethod
+    def _quantile(values, q: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def summary(self) -> dict:
+        """Metriche aggregate per (tipo, nome) più i contatori di cache."""
+        with self._lock:
+            items = [(key, dict(m, durations=list(m["durations"]))) for key, m in self.metrics.items()]
+            cache_counts = dict(self.cache_counts)
+        spans = []
+        for (kind, name), m in sorted(items):
+            spans.append({
+                "kind": kind,
+                "name": name,
+                "count": m["count"],
+                "errors": m["errors"],
+                "total_ms": round(m["seconds"] * 1000, 2),
+                "mean_ms": round(m["seconds"] / m["count"] * 1000, 2),
+                "p50_ms": round(self._quantile(m["durations"], 0.5) * 1000, 2),
+                "p95_ms": round(self._quantile(m["durations"], 0.95) * 1000, 2),
+                "max_ms": round(max(m["durations"]) * 1000, 2),
+                "bytes": m["bytes"],
+            })
+        cache = {}
+        for (namespace, result), count in sorted(cache_counts.items()):
+            cache.setdefault(namespace, {"hit": 0, "miss": 0})[result] = count
+        return {"spans": spans, "cache": cache}
+
+    def prometheus(self) -> str:
+        """Metriche nel formato testuale di Prometheus."""
+        def labels(**values) -> str:
+            body = ",".join(
+                f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                for k, v in values.items()
+            )
+            return "{" + body + "}"
+
+        summary = self.summary()
+        lines = [
+            "# HELP youtrack_llm_span_seconds Durata delle azioni e delle chiamate HTTP/LLM.",
+            "# TYPE youtrack_llm_span_seconds summary",
+        ]
+        for m in summary["spans"]:
+            for q, field in (("0.5", "p50_ms"), ("0.95", "p95_ms")):
+                lines.append(f"youtrack_llm_span_seconds{labels(kind=m['kind'], name=m['name'], quantile=q)} "
+                             f"{m[field] / 1000:.6f}")
+            lines.append(f"youtrack_llm_span_seconds_sum{labels(kind=m['kind'], name=m['name'])} "
+                         f"{m['total_ms'] / 1000:.6f}")
+            lines.append(f"youtrack_llm_span_seconds_count{labels(kind=m['kind'], name=m['name'])} {m['count']}")
+        lines += [
+            "# HELP youtrack_llm_span_errors_total Span terminati con errore (eccezione o status >= 400).",
+            "# TYPE youtrack_llm_span_errors_total counter",
+        ]
+        for m in summary["spans"]:
+            lines.append(f"youtrack_llm_span_errors_total{labels(kind=m['kind'], name=m['name'])} {m['errors']}")
+        lines += [
+            "# HELP youtrack_llm_http_response_bytes_total Byte ricevuti per endpoint.",
+            "# TYPE youtrack_llm_http_response_bytes_total counter",
+        ]
+        for m in summary["spans"]:
+            if m["kind"] == "http":
+                lines.append(f"youtrack_llm_http_response_bytes_total{labels(name=m['name'])} {m['bytes']}")
+        lines += [
+            "# HELP youtrack_llm_cache_requests_total Accessi in cache per namespace ed esito.",
+            "# TYPE youtrack_llm_cache_requests_total counter",
+        ]
+        for namespace, counts in summary["cache"].items():
+            for result, count in counts.items():
+                lines.append(f"youtrack_llm_cache_requests_total{labels(namespace=namespace, result=result)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Salva le metriche: formato Prometheus per .prom/.txt, JSON altrimenti."""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def render(span: Span) -> list[str]:
+        """Rende uno span radice e i suoi figli come righe di testo con ├── / └──."""
+        def label(s: Span) -> str:
+            attrs = " ".join(f"{k}={v}" for k, v in s.attrs.items())
+            error = f" ❌ {s.error}" if s.error else ""
+            return f"{s.name} {s.duration * 1000:.1f}ms{(' ' + attrs) if attrs else ''}{error}"
+
+        lines = [label(span)]
+
+        def walk(children: list, prefix: str):
+            children = sorted(children, key=lambda c: c.start)
+            for i, child in enumerate(children):
+                last = i == len(children) - 1
+                lines.append(f"{prefix}{'└── ' if last else '├── '}{label(child)}")
+                walk(child.children, prefix + ("    " if last else "│   "))
+
+        walk(span.children, "")
+        return lines
+
+
+# Tracer globale usato da transport, parser e client (abilitato da --trace / YT_TRACE)
+TRACER = Tracer(enabled=YT_TRACE)
+
+
+class HttpTransport:
+    """
+    Layer HTTP condiviso: una requests.Session con pool di connessioni keep-alive,
+    timeout per chiamata e retry con backoff esponenziale su 5xx/429.
+
+    I metodi non idempotenti (POST) vengono ripetuti solo quando la richiesta
+    sicuramente non è stata elaborata (429 o timeout di connessione), a meno che
+    il chiamante non dichiari idempotent=True.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+    def __init__(self, pool_size: int = YT_HTTP_POOL_SIZE, timeout: float = YT_HTTP_TIMEOUT,
+                 retries: int = YT_HTTP_RETRIES, backoff: float = YT_HTTP_BACKOFF):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        # I retry li gestiamo noi in request(): l'adapter serve solo per il pool
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _should_retry(self, status: int | None, error: Exception | None,
+                      attempt: int, idempotent: bool) -> bool:
+        if attempt >= self.retries:
+            return False
+        if error is not None:
+            # Timeout di connessione: la richiesta non è mai partita
+            if isinstance(error, requests.ConnectTimeout):
+                return True
+            return idempotent and isinstance(error, (requests.ConnectionError, requests.Timeout))
+        if status == 429:
+            return True
+        return idempotent and status in self.RETRY_STATUSES
+
+    def _backoff_delay(self, attempt: int, resp: requests.Response | None) -> float:
+        # Rispettiamo Retry-After se il server lo indica (in secondi)
+        if resp is not None:
+            retry_after = resp.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    def request(self, method: str, url: str, timeout: float | None = None,
+                idempotent: bool | None = None, **kwargs) -> requests.Response:
+        """Esegue una richiesta HTTP sul pool condiviso, con timeout e retry."""
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in self.IDEMPOTENT_METHODS
+        timeout = timeout if timeout is not None else self.timeout
+
+        with TRACER.span(f"{method} {endpoint_template(url)}", kind="http") as span:
+            resp = self._request_with_retry(method, url, timeout, idempotent, **kwargs)
+            if TRACER.enabled:
+                length = resp.headers.get("Content-Length")
+                if length is None and not kwargs.get("stream"):
+                    length = len(resp.content)
+                span.set(status=resp.status_code, bytes=int(length or 0))
+        log.debug("%s %s -> %s", method, url, resp.status_code)
+        return resp
+
+    def _request_with_retry(self, method: str, url: str, timeout: float, idempotent: bool,
+                            **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            resp = None
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not self._should_retry(None, e, attempt, idempotent):
+                    raise
+                reason = type(e).__name__
+            else:
+                if not self._should_retry(resp.status_code, None, attempt, idempotent):
+                    return resp
+                reason = resp.status_code
+
+            delay = self._backoff_delay(attempt, resp)
+            attempt += 1
+            log.info("%s %s -> %s, retry %d/%d tra %.2fs", method, url, reason, attempt, self.retries, delay)
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_TOKEN_ENCODING = None
+_TOKEN_ENCODING_LOADED = False
+_TOKEN_ENCODING_LOCK = threading.Lock()
+
+
+def _token_encoding():
+    """
+    Encoding tiktoken, caricato alla prima stima (non all'import: la prima volta
+    tiktoken può scaricare il vocabolario). None se tiktoken non è installato o
+    non riesce a caricarlo.
+    """
+    global _TOKEN_ENCODING, _TOKEN_ENCODING_LOADED
+    if not _TOKEN_ENCODING_LOADED:
+        with _TOKEN_ENCODING_LOCK:
+            if not _TOKEN_ENCODING_LOADED:
+                if tiktoken is not None:
+                    try:
+                        _TOKEN_ENCODING = tiktoken.get_encoding("cl100k_base")
+                    except Exception as e:
+                        # es. nessun accesso di rete per scaricare il vocabolario
+                        log.warning("tiktoken non disponibile (%s): token stimati a ~4 caratteri per token.", e)
+                _TOKEN_ENCODING_LOADED = True
+    return _TOKEN_ENCODING
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima i token di un testo: conteggio esatto con tiktoken se installato, altrimenti ~4 caratteri per token."""
+    encoding = _token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, (len(text) + 3) // 4)
+
+
+class CompactIssueEncoder:
+    """
+    Serializzazione compatta degli issue per i prompt LLM: una tabella con una riga di
+    intestazione e una riga per issue, celle separate da '|'. Rispetto a json.dumps con
+    indentazione niente spazi, graffe o nomi di chiave ripetuti.
+
+    - fields: proiezione dei campi da includere (default: le chiavi del primo issue)
+    - max_text: lunghezza massima di ogni cella, i testi più lunghi vengono troncati con '…'
+    """
+
+    SEPARATOR = "|"
+
+    def __init__(self, fields: list[str] | None = None, max_text: int = YT_PROMPT_MAX_TEXT):
+        self.fields = list(fields) if fields else None
+        self.max_text = max_text
+
+    def cell(self, value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, dict):
+            # valori YouTrack annidati, es. {"name": "Major"} o {"login": "admin"}
+            value = value.get("name") or value.get("login") or value.get("shortName") or json.dumps(value)
+        elif isinstance(value, (list, tuple)):
+            value = ",".join(self.cell(v) for v in value)
+        text = " ".join(str(value).split()).replace(self.SEPARATOR, "/")
+        if len(text) > self.max_text:
+            text = text[: self.max_text - 1] + "…"
+        return text
+
+    @staticmethod
+    def _as_dict(issue) -> dict:
+        # accetta anche i record di IssueProjection (namedtuple)
+        return issue._asdict() if hasattr(issue, "_asdict") else issue
+
+    def fields_for(self, issue) -> list[str]:
+        return self.fields or list(self._as_dict(issue).keys())
+
+    def header(self, fields: list[str]) -> str:
+        return self.SEPARATOR.join(fields)
+
+    def row(self, issue, fields: list[str]) -> str:
+        issue = self._as_dict(issue)
+        return self.SEPARATOR.join(self.cell(issue.get(f)) for f in fields)
+
+    def encode(self, issues, token_budget: int | None = None) -> tuple[str, int, int]:
+        """
+        Codifica gli issue come tabella. Con 'token_budget' include quanti più issue
+        possibile restando entro il budget: gli issue che non ci stanno vengono
+        saltati (nell'ordine originale) e conteggiati come esclusi.
+        Ritorna (testo, issue inclusi, issue esclusi).
+        """
+        lines: list[str] = []
+        fields = None
+        used = 0
+        dropped = 0
+        for issue in issues:
+            if fields is None:
+                fields = self.fields_for(issue)
+                lines.append(self.header(fields))
+                used = estimate_tokens(lines[0])
+            line = self.row(issue, fields)
+            # +1 per il separatore di riga
+            line_tokens = estimate_tokens(line) + 1
+            if token_budget is not None and used + line_tokens > token_budget:
+                dropped += 1
+                continue
+            lines.append(line)
+            used += line_tokens
+        included = max(0, len(lines) - 1)
+        return "\n".join(lines), included, dropped
+
+
+class PersistentCache:
+    """
+    Cache chiave/valore persistente su SQLite, condivisa tra più esecuzioni della CLI.
+
+    Le voci sono separate per istanza YouTrack (base_url) e per namespace
+    ('project', 'user', 'link_types', ...); ogni namespace ha il proprio TTL in secondi,
+    sovrascrivibile con le variabili d'ambiente YT_CACHE_TTL_<NAMESPACE>.
+    I valori sono serializzati in JSON.
+    """
+
+    DEFAULT_TTLS = {
+        "project": 7 * 24 * 3600,
+        "user": 24 * 3600,
+        "link_types": 7 * 24 * 3600,
+        "parse": 7 * 24 * 3600,
+    }
+
+    def __init__(self, base_url: str, path: str | None = None, ttls: dict | None = None):
+        self.base_url = base_url
+        self.path = path or os.path.join(YT_CACHE_DIR, "cache.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self.ttls = dict(self.DEFAULT_TTLS)
+        for namespace in self.DEFAULT_TTLS:
+            env_ttl = os.getenv(f"YT_CACHE_TTL_{namespace.upper()}")
+            if env_ttl:
+                self.ttls[namespace] = float(env_ttl)
+        self.ttls.update(ttls or {})
+
+        # La connessione è condivisa tra thread (worker paralleli): serializziamo con un lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " base_url TEXT NOT NULL, namespace TEXT NOT NULL, key TEXT NOT NULL,"
+                " value TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (base_url, namespace, key))"
+            )
+
+    def get(self, namespace: str, key: str, default=None):
+        """Restituisce il valore in cache oppure 'default' se assente o scaduto."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE base_url = ? AND namespace = ? AND key = ?",
+                (self.base_url, namespace, key),
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return default
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value, ttl: float | None = None):
+        """Salva 'value' nel namespace indicato, con il TTL del namespace (o quello esplicito)."""
+        if ttl is None:
+            ttl = self.ttls.get(namespace, 24 * 3600)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (base_url, namespace, key, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (self.base_url, namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+            )
+
+    def invalidate(self, namespace: str | None = None) -> int:
+        """Elimina le voci di questa istanza YouTrack (tutte o di un solo namespace). Ritorna quante."""
+        with self._lock, self._conn:
+            if namespace:
+                cur = self._conn.execute(
+                    "DELETE FROM cache WHERE base_url = ? AND namespace = ?", (self.base_url, namespace)
+                )
+            else:
+                cur = self._conn.execute("DELETE FROM cache WHERE base_url = ?", (self.base_url,))
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ParseCache:
+    """
+    Memoizzazione dei risultati di parse_command.
+
+    La chiave combina il testo del comando normalizzato (spazi compattati), l'hash
+    del prompt di sistema e il nome del modello: cambiando prompt o modello le voci
+    vecchie non vengono più usate. Due livelli: LRU in memoria e, opzionalmente,
+    il namespace 'parse' di una PersistentCache su disco.
+    """
+
+    def __init__(self, max_entries: int = YT_PARSE_CACHE_SIZE, disk: PersistentCache | None = None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(user_command: str, system_prompt: str, model: str) -> str:
+        normalized = " ".join(user_command.split())
+        prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model}\0{prompt_hash}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # copia: il chiamante può modificare il dict (es. update_issue fa pop sui fields)
+                return json.loads(json.dumps(self._entries[key]))
+        if self.disk is not None:
+            value = self.disk.get("parse", key)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._store(key, value)
+                return json.loads(json.dumps(value))
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key: str, value: dict):
+        value = json.loads(json.dumps(value))
+        self._store(key, value)
+        if self.disk is not None:
+            self.disk.set("parse", key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.invalidate("parse")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+class FastPathParser:
+    """
+    Pre-parser locale e deterministico (italiano e inglese) per i comandi dalla forma fissa,
+    es. "delete SUP-3", "mostra la gerarchia di SUP-17", "link SUP-10 to SUP-11 as subtask".
+
+    Ogni regola deve combaciare con l'INTERA riga: se il comando ha anche solo una parola
+    in più, parse() ritorna None e il comando va a GPT. L'output è lo stesso JSON
+    d'azione prodotto da GPTParser.parse_command.
+    """
+
+    ISSUE = r"([A-Za-z][A-Za-z0-9_]*-\d+)"
+    PROJECT = r"([A-Za-z][A-Za-z0-9_]*)"
+
+    # Tipi di link accettati dopo "as"/"come" (nome usato -> link_type per link_issues);
+    # qualsiasi altro nome va a GPT, che sa interpretarlo o chiedere chiarimenti
+    LINK_TYPES = {
+        "relates": "relates", "relates to": "relates to",
+        "depends on": "depends on", "is required for": "is required for",
+        "duplicates": "duplicates", "is duplicated by": "is duplicated by",
+        "subtask": "subtask", "subtask of": "subtask of", "parent for": "parent for",
+        # sinonimi italiani
+        "correlato": "relates", "collegato": "relates",
+        "dipende da": "depends on",
+        "duplicato": "duplicates", "duplicato di": "duplicates",
+        "sottotask": "subtask", "sottotask di": "subtask", "subtask di": "subtask",
+    }
+
+    def __init__(self):
+        I, P = self.ISSUE, self.PROJECT
+        issue_word = r"(?:(?:the\s+)?(?:issue|ticket|task)\s+|(?:l'|l’)issue\s+|(?:il\s+)?ticket\s+)?"
+        self.rules = [
+            (
+                "delete_issue",
+                rf"(?:delete|remove|elimina|cancella|rimuovi)\s+{issue_word}{I}",
+                lambda m: {"action": "delete_issue", "issue": m.group(1).upper()},
+            ),
+            (
+                "show_epic_hierarchy",
+                rf"(?:show|display|print|mostra(?:mi)?|visualizza)\s+(?:the\s+|la\s+)?"
+                rf"(?:hierarchy|tree|gerarchia|albero)\s+(?:of|for|di|dell'|dell’|della|del)\s*(?:the\s+)?(?:epic\s+)?{I}",
+                lambda m: {"action": "show_epic_hierarchy", "epic": m.group(1).upper()},
+            ),
+            (
+                "link_issues",
+                rf"(?:link|collega)\s+{I}\s+(?:to|with|a|ad|con)\s+{I}"
+                rf"(?:\s+(?:as|come)\s+([A-Za-z][A-Za-z \-]*?))?",
+                self._link_issues,
+            ),
+            (
+                "change_issue_assignee",
+                rf"(?:assign|reassign|assegna|riassegna)\s+{issue_word}{I}\s+(?:to|a|ad)\s+([\w.\-@]+)",
+                lambda m: {"action": "change_issue_assignee", "issue": m.group(1).upper(), "assignee": m.group(2)},
+            ),
+            (
+                "summarize_project",
+                rf"(?:summarize|summarise|riassumi)\s+(?:the\s+|il\s+)?(?:project|progetto)\s+{P}",
+                lambda m: {"action": "summarize_project", "project": m.group(1).upper()},
+            ),
+            (
+                "list_issues",
+                rf"(?:list|show|mostra(?:mi)?|elenca)\s+(all\s+|tutti\s+)?(?:the\s+|i\s+)?"
+                rf"(?:issues|tickets|issue|ticket)\s+(?:of|in|for|del|nel|di)\s+(?:the\s+)?(?:project|progetto)\s+{P}",
+                lambda m: self._list_issues(m.group(2), bool(m.group(1))),
+            ),
+        ]
+        self.rules = [(action, re.compile(rf"^\s*{pattern}\s*[.!]?\s*$", re.IGNORECASE), build)
+                      for action, pattern, build in self.rules]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hits_by_action: dict = {}
+
+    def _link_issues(self, m) -> dict | None:
+        link_type = self.LINK_TYPES.get(" ".join((m.group(3) or "relates").lower().split()))
+        if link_type is None:
+            return None
+        return {"action": "link_issues", "from": m.group(1).upper(), "to": m.group(2).upper(),
+                "link_type": link_type}
+
+    @staticmethod
+    def _list_issues(project: str, all_issues: bool) -> dict:
+        action = {"action": "list_issues", "filters": {"project": project.upper()}}
+        if all_issues:
+            action["limit"] = "all"
+        return action
+
+    def parse(self, user_command: str) -> dict | None:
+        """
+        Ritorna il JSON d'azione se il comando combacia con una regola, altrimenti None.
+        Una regola può rifiutare una riga che combacia (build ritorna None, es. tipo di link sconosciuto).
+        """
+        for action, pattern, build in self.rules:
+            m = pattern.match(user_command)
+            result = build(m) if m else None
+            if result is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.hits_by_action[action] = self.hits_by_action.get(action, 0) + 1
+                return result
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "by_action": dict(self.hits_by_action),
+            }
+
+
+class ParseError(ValueError):
+    """Risposta del modello non utilizzabile: troncata, non JSON o non conforme allo schema dell'azione."""
+
+
+_ISSUE_FIELDS_SCHEMA = {
+    "summary": {"type": "string", "description": "Titolo"},
+    "description": {"type": "string"},
+    "priority": {"type": "string", "description": "Es. Critical, Major, Normal, Minor"},
+    "assignee": {"type": "string", "description": "Login o nome dell'assegnatario"},
+}
+
+# Parametri di ogni azione come JSON schema: sono le funzioni offerte al modello in
+# parse_command e lo schema con cui viene validato il risultato prima di eseguirlo.
+# Gli ID di issue possono anche essere riferimenti a risultati precedenti ($1, $2.epic).
+ACTION_SCHEMAS = {
+    "create_project": {
+        "description": "Crea un nuovo progetto.",
+        "properties": {
+            "name": {"type": "string"},
+            "key": {"type": "string", "description": "Chiave breve del progetto, es. SUP"},
+            "description": {"type": "string"},
+        },
+        "required": ["name", "key"],
+    },
+    "create_issue": {
+        "description": "Crea un issue.",
+        "properties": {"project": {"type": "string"}, **_ISSUE_FIELDS_SCHEMA},
+        "required": ["project", "summary"],
+    },
+    "create_epic": {
+        "description": "Crea un Epic (stessi campi di create_issue).",
+        "properties": {"project": {"type": "string"}, **_ISSUE_FIELDS_SCHEMA},
+        "required": ["project", "summary"],
+    },
+    "create_epic_with_children": {
+        "description": "Crea un Epic e i suoi task figli, collegati come subtask.",
+        "properties": {
+            "project": {"type": "string"},
+            "epic": {"type": "object", "properties": _ISSUE_FIELDS_SCHEMA, "required": ["summary"]},
+            "children": {
+                "type": "array",
+                "items": {"type": "object", "properties": _ISSUE_FIELDS_SCHEMA, "required": ["summary"]},
+            },
+            "link_type": {"type": "string", "description": "Default: subtask"},
+        },
+        "required": ["project", "epic", "children"],
+    },
+    "update_issue": {
+        "description": "Aggiorna i campi di un issue.",
+        "properties": {
+            "issue": {"type": "string", "description": "ID leggibile, es. SUP-3"},
+            "fields": {
+                "type": "object",
+                "description": "Campi da aggiornare, es. {\"summary\": \"...\", \"Priority\": \"Major\", \"assignee\": \"admin\"}",
+            },
+            "customFields": {
+                "type": "array",
+                "items": {"type": "object"},
+                "description": "Solo per casi avanzati: custom field in formato YouTrack",
+            },
+        },
+        "required": ["issue"],
+    },
+    "change_issue_assignee": {
+        "description": "Cambia l'assegnatario di un issue.",
+        "properties": {"issue": {"type": "string"}, "assignee": {"type": "string"}},
+        "required": ["issue", "assignee"],
+    },
+    "delete_issue": {
+        "description": "Elimina un issue.",
+        "properties": {"issue": {"type": "string", "description": "ID leggibile, es. SUP-3"}},
+        "required": ["issue"],
+    },
+    "list_issues": {
+        "description": "Elenca gli issue che soddisfano dei filtri.",
+        "properties": {
+            "filters": {
+                "type": "object",
+                "description": "Filtri {campo: valore} con i nomi di campo della ricerca YouTrack "
+                               "(project, Assignee, Priority, State, Type, ...)",
+            },
+            "limit": {
+                "type": ["integer", "string"],
+                "description": "Numero massimo di issue (default 20), \"all\" per tutti",
+            },
+        },
+        "required": ["filters"],
+    },
+    "bulk_update": {
+        "description": "Aggiorna gli stessi campi su TUTTI gli issue che soddisfano dei filtri "
+                       "(es. priorità o stato di tutti i bug aperti di un progetto).",
+        "properties": {
+            "filters": {
+                "type": "object",
+                "description": "Filtri {campo: valore} come in list_issues",
+            },
+            "fields": {
+                "type": "object",
+                "description": "Campi da impostare, es. {\"Priority\": \"Major\", \"State\": \"Fixed\", "
+                               "\"assignee\": \"admin\"}; summary e description non sono ammessi",
+            },
+            "dry_run": {"type": "boolean", "description": "true per mostrare cosa cambierebbe senza applicarlo"},
+        },
+        "required": ["filters", "fields"],
+    },
+    "summarize_project": {
+        "description": "Riassume lo stato di un progetto.",
+        "properties": {"project": {"type": "string"}},
+        "required": ["project"],
+    },
+    "link_issues": {
+        "description": "Collega due issue.",
+        "properties": {
+            "from": {"type": "string"},
+            "to": {"type": "string"},
+            "link_type": {"type": "string", "description": "Es. subtask, relates, depends on"},
+        },
+        "required": ["from", "to", "link_type"],
+    },
+    "show_epic_hierarchy": {
+        "description": "Mostra la gerarchia di subtask di un Epic.",
+        "properties": {"epic": {"type": "string"}, "max_depth": {"type": "integer", "description": "Default 5"}},
+        "required": ["epic"],
+    },
+    "sync_project": {
+        "description": "Sincronizza il mirror locale di un progetto.",
+        "properties": {
+            "project": {"type": "string"},
+            "full": {"type": "boolean", "description": "true per una risincronizzazione completa"},
+        },
+        "required": ["project"],
+    },
+}
+
+# Richieste composte: più azioni in un'unica risposta del modello, eseguite come grafo
+# di dipendenze (vedi execute_plan). Ogni passo è un'azione di ACTION_SCHEMAS.
+ACTION_SCHEMAS["plan"] = {
+    "description": "Richiesta composta da più azioni: un passo per azione, nell'ordine. "
+                   "Un passo può usare il risultato del passo N con $N o $N.chiave.",
+    "properties": {
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "action": {"type": "string", "enum": sorted(ACTION_SCHEMAS)},
+                    "after": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "Passi (1-based) che devono essere completati prima, "
+                                       "se servono senza usarne il risultato",
+                    },
+                },
+                "required": ["action"],
+            },
+        },
+    },
+    "required": ["steps"],
+}
+
+_JSON_TYPES = {
+    "string": str, "integer": int, "number": (int, float), "boolean": bool,
+    "object": dict, "array": list,
+}
+
+
+def validate_schema(value, schema: dict, path: str = "") -> list[str]:
+    """
+    Validazione minimale di 'value' rispetto a un JSON schema (type, properties,
+    required, items, enum): ritorna la lista degli errori, vuota se valido.
+    """
+    errors = []
+    expected = schema.get("type")
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        # bool è una sottoclasse di int: non deve valere come integer/number
+        if not any(isinstance(value, _JSON_TYPES[t]) and not (isinstance(value, bool) and t != "boolean")
+                   for t in types):
+            return [f"{path or 'valore'}: atteso {'/'.join(types)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path or 'valore'}: valore non ammesso {value!r}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if value.get(key) in (None, ""):
+                errors.append(f"{path + '.' if path else ''}{key}: campo obbligatorio mancante")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if value.get(key) is not None:
+                errors.extend(validate_schema(value[key], sub_schema, f"{path + '.' if path else ''}{key}"))
+    if isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+def validate_action(action_data: dict) -> list[str]:
+    """Controlla un'azione interpretata contro ACTION_SCHEMAS prima di eseguirla."""
+    if not isinstance(action_data, dict):
+        return ["l'azione deve essere un oggetto JSON"]
+    action = action_data.get("action")
+    schema = ACTION_SCHEMAS.get(action)
+    if schema is None:
+        return [f"azione sconosciuta: {action!r}"]
+    errors = validate_schema(action_data, {"type": "object", **schema})
+    if action == "plan" and not errors:
+        # ogni passo deve essere a sua volta un'azione valida (ma non un altro piano)
+        for index, step in enumerate(action_data["steps"], start=1):
+            if step.get("action") == "plan":
+                errors.append(f"passo {index}: piani annidati non ammessi")
+                continue
+            params = {k: v for k, v in step.items() if k != "after"}
+            errors.extend(f"passo {index}: {e}" for e in validate_action(params))
+    return errors
+
+
+class IncrementalJsonParser:
+    """
+    Parser JSON incrementale per testo che arriva a pezzi (es. gli argomenti di una
+    function call in streaming).
+
+    feed() ritorna i valori completati nel pezzo appena ricevuto come coppie
+    (path, valore), dove path è la tupla di chiavi/indici dalla radice, es.
+    ("epic",) o ("children", 2). Vengono emessi solo i valori con len(path) <= max_depth
+    (la radice ha path ()). Il testo deve essere JSON valido una volta completo.
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.buf = ""
+        self.pos = 0
+        # frame: {"kind": "obj"/"arr", "path": tuple, "start": int, "key": ..., "index": int, "expect": str}
+        self.stack: list[dict] = []
+        self.string_start = None   # inizio della stringa in corso (chiave o valore)
+        self.string_is_key = False
+        self.escape = False
+        self.scalar_start = None   # inizio di numero/true/false/null in corso
+        self.done = False
+
+    def _value_path(self) -> tuple:
+        if not self.stack:
+            return ()
+        frame = self.stack[-1]
+        return frame["path"] + ((frame["key"],) if frame["kind"] == "obj" else (frame["index"],))
+
+    def _emit(self, out: list, path: tuple, start: int, end: int):
+        if len(path) <= self.max_depth:
+            out.append((path, json.loads(self.buf[start:end])))
+        if self.stack:
+            self.stack[-1]["expect"] = "comma"
+        else:
+            self.done = True
+
+    def feed(self, chunk: str) -> list[tuple[tuple, object]]:
+        self.buf += chunk
+        out = []
+        buf = self.buf
+        while self.pos < len(buf):
+            c = buf[self.pos]
+
+            if self.string_start is not None:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    start, self.string_start = self.string_start, None
+                    if self.string_is_key:
+                        frame = self.stack[-1]
+                        frame["key"] = json.loads(buf[start:self.pos + 1])
+                        frame["expect"] = "colon"
+                    else:
+                        self._emit(out, self._value_path(), start, self.pos + 1)
+                self.pos += 1
+                continue
+
+            if self.scalar_start is not None:
+                if c not in ",}] \t\r\n":
+                    self.pos += 1
+                    continue
+                start, self.scalar_start = self.scalar_start, None
+                self._emit(out, self._value_path(), start, self.pos)
+                # il delimitatore viene elaborato sotto
+
+            frame = self.stack[-1] if self.stack else None
+            if c in " \t\r\n":
+                pass
+            elif frame is not None and frame["expect"] == "comma" and c == ",":
+                if frame["kind"] == "arr":
+                    frame["index"] += 1
+                frame["expect"] = "key" if frame["kind"] == "obj" else "value"
+            elif frame is not None and frame["expect"] == "colon" and c == ":":
+                frame["expect"] = "value"
+            elif frame is not None and frame["expect"] == "key" and c == '"':
+                self.string_start, self.string_is_key = self.pos, True
+            elif c in "}]" and frame is not None:
+                self.stack.pop()
+                self._emit(out, frame["path"], frame["start"], self.pos + 1)
+            else:
+                # inizio di un valore
+                path = self._value_path()
+                if c in "{[":
+                    kind = "obj" if c == "{" else "arr"
+                    self.stack.append({"kind": kind, "path": path, "start": self.pos, "key": None,
+                                       "index": 0, "expect": "key" if kind == "obj" else "value"})
+                elif c == '"':
+                    self.string_start, self.string_is_key = self.pos, False
+                else:
+                    self.scalar_start = self.pos
+            self.pos += 1
+        return out
+
+
 class GPTParser:
     """Utilizza l'API OpenAI per interpretare comandi in linguaggio naturale e produrre un JSON strutturato."""
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, transport: HttpTransport | None = None,
+                 parse_cache: ParseCache | None = None, fast_path: FastPathParser | None = None,
+                 parse_models: list | None = None, summary_model: str | None = None):
         self.api_key = api_key
+        # Sessione HTTP riutilizzata tra le chiamate (keep-alive verso api.openai.com)
+        self.http = transport or HttpTransport(timeout=OPENAI_HTTP_TIMEOUT)
+        # Livelli di modello per l'interpretazione dei comandi, dal più piccolo: si passa al
+        # successivo solo se la risposta non è valida (fanno parte della chiave di cache)
+        if parse_models is None:
+            parse_models = [YT_PARSE_MODEL, YT_PARSE_ESCALATION_MODEL]
+        self.parse_models = list(dict.fromkeys(m for m in parse_models if m))
+        if not self.parse_models:
+            raise ValueError("Serve almeno un modello per l'interpretazione dei comandi.")
+        # Modello per i riassunti (MapReduceSummarizer)
+        self.summary_model = summary_model or YT_SUMMARY_MODEL
+        # Statistiche per livello: chiamate, risposte non valide, latenza e token
+        self._tier_lock = threading.Lock()
+        self.tier_stats = {
+            model: {"calls": 0, "invalid": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+            for model in self.parse_models
+        }
+        self.escalations = 0
+        # Cache dei comandi già interpretati (None = disabilitata)
+        self.parse_cache = parse_cache
+        # Pre-parser locale per i comandi dalla forma fissa (None = sempre GPT)
+        self.fast_path = fast_path
         # Endpoint ChatGPT API
-        self.api_url = "https://api.openai.com/v1/chat/completions"
+        self.api_url = f"{OPENAI_BASE_URL}/chat/completions"
         # Prompt di sistema che istruisce GPT sul formato di output
+        # Le azioni e i loro parametri sono descritti dagli schemi (ACTION_SCHEMAS) passati
+        # come funzioni: il prompt contiene solo le regole che gli schemi non esprimono
         self.system_prompt = (
-            "Sei un assistente che converte un comando in linguaggio naturale in un'azione JSON per YouTrack. "
-            "Rispondi SOLO con un JSON contenente 'action' e i parametri necessari, senza spiegazioni. "
-            "Per delete_issue DEVI SEMPRE includere la chiave 'issue' con l'ID leggibile dell'issue (es. 'SUP-3'). "
-            "Azioni possibili: create_project, create_issue, update_issue, change_issue_assignee, "
-            "delete_issue, list_issues, summarize_project, create_epic, create_epic_with_children, link_issues, show_epic_hierarchy. "
-            "Per list_issues usa sempre un oggetto 'filters' con i filtri della query, ad esempio:\n"
-            '{"action": "list_issues", "filters": {"project": "SUP", "Assignee": "admin"}}\n'
-            "I nomi delle chiavi dentro 'filters' devono essere i nomi di campo usati nel linguaggio di ricerca di YouTrack "
-            "(es. project, Assignee, Priority, State, Type, ecc.)."
-            "Per update_issue usa un campo 'issue' con l'ID leggibile (es. 'SUP-3') e un oggetto 'fields' con i campi da aggiornare, ad esempio:\n"
-            '{"action": "update_issue", "issue": "SUP-3", "fields": {"summary": "Nuovo titolo", "Priority": "Major", "assignee": "admin"}}\n'
-            "Per casi avanzati puoi anche aggiungere 'customFields' come array YouTrack-ready:"
-            '{"action": "update_issue", "issue": "SUP-3", "customFields": [{"name": "MyField", "value": {"name": "Foo"}}]}'
-            "Per summarize_project DEVI SEMPRE includere la chiave 'project' con la chiave del progetto (es. 'SUP'), ad esempio:\n"
-            '{"action": "summarize_project", "project": "SUP"}'
-            "Per create_issue DEVI SEMPRE usare le chiavi top-level: "
-            "'project', 'summary', 'description', 'priority', 'assignee'. "
-            "Non inserire MAI questi campi dentro 'fields'. "
-            "Esempio corretto:\n"
-            '{"action": "create_issue", "project": "SUP", "summary": "Titolo", "description": "Testo", "priority": "Normal"}\n'
-            "Esempio NON valido (da evitare):\n"
-            '{"action": "create_issue", "fields": {"project": "SUP", "summary": "Titolo"}}\n'
-            "Per create_epic usa lo stesso formato di create_issue, ma con action='create_epic', ad esempio:\n"
-            '{"action": "create_epic", "project": "SUP", "summary": "Nuova funzionalità", "description": "Descrizione", "priority": "Major", "assignee": "admin"}\n'
-            "Per create_epic_with_children usa:\n"
-            '{"action": "create_epic_with_children", "project": "SUP", "epic": {"summary": "Nuovo modulo WiFi", "priority": "Major"}, '
-            '"children": [ {"summary": "Aggiornare driver", "priority": "Normal"}, {"summary": "Test di stabilità", "priority": "Major"} ] }\n'
-            "Per link_issues DEVI SEMPRE fornire 'from', 'to' e 'link_type', ad esempio:\n"
-            '{"action": "link_issues", "from": "SUP-10", "to": "SUP-11", "link_type": "subtask"}\n'
+            "Sei un assistente che converte un comando in linguaggio naturale in un'azione per YouTrack. "
+            "Rispondi SEMPRE chiamando la funzione dell'azione richiesta, senza testo. "
+            "Gli issue si indicano con l'ID leggibile (es. 'SUP-3'). "
+            "In list_issues i nomi delle chiavi di 'filters' sono i nomi di campo della ricerca YouTrack "
+            "(es. project, Assignee, Priority, State, Type); se l'utente chiede TUTTI gli issue usa \"limit\": \"all\". "
+            "In create_issue e create_epic project, summary, description, priority e assignee sono parametri "
+            "di primo livello, mai dentro 'fields'. "
+            "Se il comando chiede più azioni usa UNA sola chiamata a plan con un passo per azione: "
+            "per usare il risultato del passo N scrivi $N (ID creato da create_issue/create_epic) "
+            "o $N.chiave (es. $1.epic per l'Epic di create_epic_with_children); se un passo deve solo "
+            "attendere un passo precedente (es. issue in un progetto appena creato) indicalo in 'after'. "
+            "Fuori da plan, se il comando contiene riferimenti a risultati precedenti come $1 o $2.epic, "
+            "riportali invariati al posto dell'ID (es. from='$2', to='$1.epic')."
         )
+        # Una funzione per azione, con lo schema dei parametri
+        self.action_tools = [
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": schema["description"],
+                    "parameters": {
+                        "type": "object",
+                        "properties": schema["properties"],
+                        "required": schema["required"],
+                    },
+                },
+            }
+            for name, schema in ACTION_SCHEMAS.items()
+        ]
 
-    def parse_command(self, user_command: str) -> dict:
-        """Invia il comando utente a GPT-4 e ritorna il JSON interpretato come dizionario Python."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        # Costruisce il payload per l'API OpenAI
+    def parse_command(self, user_command: str, use_cache: bool = True, on_value=None,
+                      on_discard=None) -> dict:
+        """
+        Invia il comando utente a GPT e ritorna il JSON interpretato come dizionario Python.
+        Si parte dal modello più piccolo di parse_models; se la risposta non è valida
+        (ParseError) il comando passa al livello successivo.
+        Con use_cache=False la cache dei comandi viene ignorata (ma aggiornata col nuovo risultato).
+        I comandi riconosciuti dal pre-parser locale non arrivano a GPT.
+
+        Con on_value la risposta di GPT viene letta in streaming: on_value(azione, path, valore)
+        riceve i parametri man mano che sono completi (es. ("epic",) e ogni ("children", i)),
+        così il chiamante può iniziare a eseguirli mentre il modello genera il resto.
+        Non viene chiamata se il comando arriva dal pre-parser o dalla cache.
+        Se la risposta in streaming non è valida, prima di passare al livello successivo
+        viene chiamata on_discard(): deve ritornare False se con on_value sono già partite
+        scritture, e in quel caso non c'è escalation (la ParseError arriva al chiamante,
+        che chiude quanto avviato); altrimenti l'azione ritornata, del nuovo livello e
+        a risposta completa, va eseguita per intero.
+        """
+        with TRACER.span("parse_command", kind="action"):
+            return self._parse_command(user_command, use_cache, on_value, on_discard)
+
+    def _parse_command(self, user_command: str, use_cache: bool, on_value=None, on_discard=None) -> dict:
+        if self.fast_path is not None:
+            action_data = self.fast_path.parse(user_command)
+            TRACER.cache("fast_path", action_data is not None)
+            if action_data is not None:
+                return action_data
+
+        cache_key = None
+        if self.parse_cache is not None:
+            # Anche gli schemi fanno parte della chiave: se cambiano i risultati in cache non valgono più
+            prompt = self.system_prompt + json.dumps(self.action_tools, sort_keys=True)
+            cache_key = ParseCache.make_key(user_command, prompt, ",".join(self.parse_models))
+            if use_cache:
+                cached = self.parse_cache.get(cache_key)
+                TRACER.cache("parse", cached is not None)
+                if cached is not None:
+                    return cached
+
+        # Dal modello più piccolo al più grande: il primo che produce un'azione valida vince
+        for tier, model in enumerate(self.parse_models):
+            last = tier == len(self.parse_models) - 1
+            try:
+                action_data = self._parse_with_model(model, user_command, on_value)
+            except ParseError as e:
+                if last:
+                    raise
+                # Se la risposta in streaming ha già prodotto scritture, un secondo piano
+                # le duplicherebbe: niente escalation
+                if on_value is not None and on_discard is not None and not on_discard():
+                    raise
+                log.info("Risposta di %s non valida (%s), escalation a %s", model, e, self.parse_models[tier + 1])
+                with self._tier_lock:
+                    self.escalations += 1
+                on_value = None
+                continue
+            if cache_key is not None:
+                self.parse_cache.put(cache_key, action_data)
+            return action_data
+
+    def _parse_with_model(self, model: str, user_command: str, on_value=None) -> dict:
+        """Interpreta il comando con un solo modello; ParseError se la risposta non è valida."""
+        # Costruisce il payload per l'API OpenAI: il modello deve chiamare una delle
+        # funzioni-azione, quindi gli argomenti rispettano lo schema dell'azione
         data = {
-            "model": "gpt-4",
+            "model": model,
             "messages": [
                 {"role": "system", "content": self.system_prompt},
                 {"role": "user", "content": user_command}
             ],
-            # Chiediamo la massima aderenza al formato JSON
+            "tools": self.action_tools,
+            "tool_choice": "required",
+            # una sola chiamata: le richieste composte devono arrivare come un unico 'plan'
+            "parallel_tool_calls": False,
             "temperature": 0,  # deterministico
-            "max_tokens": 200,
+            "max_tokens": self.output_budget(user_command),
             "n": 1,
-            "stop": None
         }
-        response = requests.post(self.api_url, headers=headers, json=data)
-        response.raise_for_status()  # in caso di errore HTTP, genera eccezione
-        result = response.json()
-        # Estrae il contenuto della risposta (messaggio dell'assistente)
-        assistant_message = result["choices"][0]["message"]["content"]
-        # Converte la stringa JSON in un dizionario Python
-        action_data = json.loads(assistant_message)
-        return action_data
+        stats = {"calls": 1, "invalid": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+        def complete(response: dict) -> dict:
+            usage = response.get("usage") or {}
+            stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            stats["completion_tokens"] += usage.get("completion_tokens", 0)
+            return response["choices"][0]
+
+        started = time.monotonic()
+        try:
+            if on_value is not None:
+                # In streaming il budget non costa tempo (si paga solo quanto generato) e non
+                # si può ripetere una risposta già in esecuzione: usiamo subito il tetto
+                data["max_tokens"] = YT_PARSE_MAX_TOKENS
+                choice = complete(self._stream_tool_call(data, on_value))
+            else:
+                choice = complete(self.chat_completion(data))
+            if choice.get("finish_reason") == "length" and data["max_tokens"] < YT_PARSE_MAX_TOKENS:
+                # Stima troppo bassa (es. molti figli con descrizioni lunghe): un solo
+                # nuovo tentativo, con il tetto massimo
+                log.info("Risposta troncata a %d token, nuovo tentativo con %d", data["max_tokens"], YT_PARSE_MAX_TOKENS)
+                data["max_tokens"] = YT_PARSE_MAX_TOKENS
+                stats["calls"] += 1
+                choice = complete(self.chat_completion(data))
+
+            action_data = self._action_from_choice(choice)
+            errors = validate_action(action_data)
+            if errors:
+                raise ParseError("Azione non valida: " + "; ".join(errors))
+            return action_data
+        except ParseError:
+            stats["invalid"] = 1
+            raise
+        finally:
+            with self._tier_lock:
+                tier = self.tier_stats[model]
+                for key, value in stats.items():
+                    tier[key] += value
+                tier["seconds"] += time.monotonic() - started
+
+    def _stream_tool_call(self, data: dict, on_value) -> dict:
+        """
+        Esegue la chiamata chat/completions in streaming, passando a on_value i parametri
+        della function call man mano che l'IncrementalJsonParser li completa.
+        Ritorna la risposta nello stesso formato di chat_completion (choices e usage).
+        """
+        calls: dict = {}   # index -> {"name": ..., "arguments": [...]}
+        content, finish_reason, usage = [], None, {}
+        parser = IncrementalJsonParser(max_depth=2)
+        with TRACER.span("chat/completions", kind="llm", model=data.get("model"), stream=True) as span:
+            response = self.http.post(
+                self.api_url,
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                json={**data, "stream": True, "stream_options": {"include_usage": True}},
+                stream=True,
+            )
+            try:
+                response.raise_for_status()
+                # SSE è sempre UTF-8: senza charset requests userebbe ISO-8859-1 e rovinerebbe gli accenti
+                response.encoding = "utf-8"
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    chunk = json.loads(payload)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                        span.set(prompt_tokens=chunk["usage"].get("prompt_tokens", 0),
+                                 completion_tokens=chunk["usage"].get("completion_tokens", 0))
+                    for choice in chunk.get("choices", []):
+                        finish_reason = choice.get("finish_reason") or finish_reason
+                        delta = choice.get("delta") or {}
+                        if delta.get("content"):
+                            content.append(delta["content"])
+                        for call in delta.get("tool_calls") or []:
+                            function = call.get("function") or {}
+                            current = calls.setdefault(call.get("index", 0), {"name": None, "arguments": []})
+                            current["name"] = current["name"] or function.get("name")
+                            fragment = function.get("arguments") or ""
+                            if not fragment:
+                                continue
+                            current["arguments"].append(fragment)
+                            # in streaming si esegue solo la prima chiamata (le eventuali altre
+                            # diventano passi di un piano in _action_from_choice)
+                            if call.get("index", 0) != 0:
+                                continue
+                            name = current["name"]
+                            try:
+                                values = parser.feed(fragment)
+                            except ValueError:
+                                # JSON non valido: lo segnalerà _action_from_choice a fine stream
+                                continue
+                            for path, value in values:
+                                if path:
+                                    on_value(name, path, value)
+            finally:
+                response.close()
+
+        message = {"role": "assistant", "content": "".join(content) or None}
+        if calls:
+            message["tool_calls"] = [
+                {"type": "function",
+                 "function": {"name": call["name"], "arguments": "".join(call["arguments"])}}
+                for _, call in sorted(calls.items())
+            ]
+        return {"choices": [{"message": message, "finish_reason": finish_reason}], "usage": usage}
 
-    def summarize_issues(self, project_key: str, issues: list) -> str:
+    @staticmethod
+    def output_budget(user_command: str) -> int:
         """
-        Usa GPT per riassumere lo stato di un progetto a partire dalla lista di issue.
-        'issues' è una lista di dict con almeno id, summary, project.
+        Token di output per interpretare 'user_command': l'azione JSON ripete in gran
+        parte il testo del comando (titoli, descrizioni, elenchi di figli), quindi il
+        budget cresce con la lunghezza del comando, entro YT_PARSE_MAX_TOKENS.
         """
+        return min(YT_PARSE_MAX_TOKENS, 150 + 2 * estimate_tokens(user_command))
+
+    @staticmethod
+    def _action_from_choice(choice: dict) -> dict:
+        """Estrae l'azione ({"action": nome, **parametri}) dalla risposta del modello."""
+        if choice.get("finish_reason") == "length":
+            raise ParseError("Risposta del modello troncata: comando troppo lungo, provare a dividerlo.")
+        message = choice.get("message") or {}
+        tool_calls = message.get("tool_calls") or []
+        try:
+            actions = [
+                {"action": call["function"]["name"], **json.loads(call["function"].get("arguments") or "{}")}
+                for call in tool_calls
+            ]
+            if len(actions) == 1:
+                return actions[0]
+            if actions:
+                # più chiamate nonostante parallel_tool_calls=False: nessuna va persa,
+                # diventano i passi (indipendenti) di un piano
+                log.info("Risposta con %d chiamate, eseguite come piano", len(actions))
+                return {"action": "plan", "steps": actions}
+            # Modelli/endpoint senza function calling: JSON nel testo della risposta
+            content = (message.get("content") or "").strip()
+            content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content)
+            return json.loads(content)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ParseError(f"Risposta del modello non valida: {e}") from e
+
+    def stats(self) -> dict:
+        """Statistiche del parser (pre-parser locale, cache dei comandi e livelli di modello)."""
+        with self._tier_lock:
+            tiers = {
+                model: {**stats, "seconds": round(stats["seconds"], 3),
+                        "avg_seconds": round(stats["seconds"] / stats["calls"], 3) if stats["calls"] else None}
+                for model, stats in self.tier_stats.items()
+            }
+            escalations = self.escalations
+        return {
+            "fast_path": self.fast_path.stats() if self.fast_path is not None else None,
+            "parse_cache": self.parse_cache.stats() if self.parse_cache is not None else None,
+            "parse_tiers": tiers,
+            "escalations": escalations,
+        }
+
+    SUMMARY_SYSTEM_PROMPT = (
+        "Sei un assistente che riassume lo stato di un progetto YouTrack per un essere umano. "
+        "Hai a disposizione una lista di issue (con id e summary, eventualmente altri campi). "
+        "Devi fornire un riassunto discorsivo e sintetico in italiano: cosa sembra essere in lavorazione, "
+        "quali sono i problemi principali, eventuali punti di attenzione. "
+        "Non ripetere tutto l'elenco in modo pedissequo, ma estrai le informazioni rilevanti."
+    )
+
+    # Descrizione del formato di CompactIssueEncoder per il modello
+    COMPACT_TABLE_HINT = "Lista issue (tabella: prima riga = nomi dei campi, celle separate da '|'):"
+
+    def chat_completion(self, data: dict) -> dict:
+        """Esegue una chiamata chat/completions con il payload 'data' e ritorna il JSON di risposta."""
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        with TRACER.span("chat/completions", kind="llm", model=data.get("model")) as span:
+            response = self.http.post(self.api_url, headers=headers, json=data, idempotent=True)
+            response.raise_for_status()
+            result = response.json()
+            usage = result.get("usage") or {}
+            span.set(prompt_tokens=usage.get("prompt_tokens", 0),
+                     completion_tokens=usage.get("completion_tokens", 0))
+        return result
 
-        # Prepariamo un prompt compatto con la lista issue in JSON
-        issues_text = json.dumps(issues, ensure_ascii=False, indent=2)
+class MapReduceSummarizer:
+    """
+    Riassunto gerarchico di progetti con molti issue.
 
-        system_msg = (
-            "Sei un assistente che riassume lo stato di un progetto YouTrack per un essere umano. "
-            "Hai a disposizione una lista di issue (con id e summary, eventualmente altri campi). "
-            "Devi fornire un riassunto discorsivo e sintetico in italiano: cosa sembra essere in lavorazione, "
-            "quali sono i problemi principali, eventuali punti di attenzione. "
-            "Non ripetere tutto l'elenco in modo pedissequo, ma estrai le informazioni rilevanti."
-        )
+    - map: gli issue (anche da un generatore, es. YouTrackClient.iter_issues) vengono
+      serializzati con CompactIssueEncoder e divisi in blocchi da al più
+      'chunk_tokens' token stimati; ogni blocco viene
+      riassunto in parallelo (al più 'max_workers' chiamate LLM contemporanee);
+    - reduce: i riassunti parziali vengono fusi a gruppi di 'fan_in' per livello,
+      finché ne resta uno solo, il report finale.
 
-        user_msg = (
-            f"Progetto: {project_key}\n"
-            f"Lista issue (JSON):\n{issues_text}"
-        )
+    Nessun prompt supera 'prompt_tokens': i blocchi restano entro il budget, 'fan_in'
+    viene ridotto se i riassunti parziali di un gruppo non ci starebbero, e gli issue
+    che da soli superano il budget vengono esclusi (e segnalati).
+
+    Dopo summarize(), 'stats' contiene issue inclusi ed esclusi, blocchi, chiamate LLM
+    e token usati.
+    """
+
+    # max_tokens delle risposte di map e reduce intermedie: dimensione massima di un riassunto parziale
+    PARTIAL_MAX_TOKENS = 400
+
+    MAP_SYSTEM_PROMPT = (
+        "Sei un assistente che analizza una PARTE degli issue di un progetto YouTrack. "
+        "Riassumi in italiano, in modo compatto, i temi ricorrenti, il lavoro in corso, "
+        "i problemi principali e i punti di attenzione di questo gruppo di issue, "
+        "citando gli ID più rilevanti. Il testo verrà poi fuso con altri riassunti parziali."
+    )
+    REDUCE_SYSTEM_PROMPT = (
+        "Sei un assistente che fonde riassunti parziali dello stesso progetto YouTrack. "
+        "Unisci le informazioni eliminando le ripetizioni, mantieni i temi e i rischi principali "
+        "e gli ID più rilevanti. Rispondi in italiano in modo compatto."
+    )
+
+    def __init__(self, parser: GPTParser, chunk_tokens: int = YT_SUMMARY_CHUNK_TOKENS,
+                 fan_in: int = YT_SUMMARY_FAN_IN, max_workers: int = YT_SUMMARY_WORKERS,
+                 model: str | None = None, prompt_tokens: int = YT_SUMMARY_PROMPT_TOKENS):
+        self.parser = parser
+        self.prompt_tokens = prompt_tokens
+        self.chunk_tokens = min(chunk_tokens, prompt_tokens)
+        # un prompt di reduce contiene fino a fan_in riassunti parziali
+        self.fan_in = max(2, min(fan_in, prompt_tokens // self.PARTIAL_MAX_TOKENS))
+        self.max_workers = max(1, max_workers)
+        # Di default lo stesso modello dei riassunti del parser
+        self.model = model or parser.summary_model
+        self.encoder = CompactIssueEncoder()
+        self._lock = threading.Lock()
+        self.stats = {}
 
+    def _call(self, system_msg: str, user_msg: str, max_tokens: int) -> str:
         data = {
-            "model": "gpt-4",
+            "model": self.model,
             "messages": [
                 {"role": "system", "content": system_msg},
                 {"role": "user", "content": user_msg}
             ],
             "temperature": 0.3,
-            "max_tokens": 600
+            "max_tokens": max_tokens
         }
-
-        response = requests.post(self.api_url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
+        result = self.parser.chat_completion(data)
+        usage = result.get("usage") or {}
+        with self._lock:
+            self.stats["llm_calls"] += 1
+            self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
         return result["choices"][0]["message"]["content"]
 
-class YouTrackClient:
-    """Client per eseguire operazioni su YouTrack tramite API REST e MCP."""
-    def __init__(self, base_url: str, token: str):
-        self.base_url = base_url
-        self.token = token
-        # Header di autenticazione e tipo di contenuto JSON
-        self.headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        # Cache per ID progetti e utenti (per evitare lookup ripetuti)
-        self.project_cache = {}
-        self.user_cache = {}
-    
-    def _get_current_user_id(self):
-        """Recupera l'ID dell'utente corrente (associato al token) tramite API YouTrack."""
-        url = f"{self.base_url}/api/users/me?fields=id"
-        resp = requests.get(url, headers=self.headers)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("id")
-    
-    def _find_user_by_name_or_login(self, name_or_login: str):
-        """Trova un utente su YouTrack dato login o nome.
+    def _chunks(self, issues):
+        """
+        Raggruppa gli issue in tabelle compatte (CompactIssueEncoder) entro il budget di
+        token di un blocco; ogni blocco ripete la riga di intestazione.
+        Gli issue che da soli superano il budget di un prompt vengono esclusi.
+        """
+        fields, header, header_tokens = None, "", 0
+        lines, tokens = [], 0
+        for issue in issues:
+            if fields is None:
+                fields = self.encoder.fields_for(issue)
+                header = self.encoder.header(fields)
+                header_tokens = estimate_tokens(header)
+            line = self.encoder.row(issue, fields)
+            line_tokens = estimate_tokens(line) + 1
+            if header_tokens + line_tokens > self.prompt_tokens:
+                with self._lock:
+                    self.stats["dropped"] += 1
+                continue
+            if lines and header_tokens + tokens + line_tokens > self.chunk_tokens:
+                yield "\n".join([header] + lines)
+                lines, tokens = [], 0
+            lines.append(line)
+            tokens += line_tokens
+            with self._lock:
+                self.stats["issues"] += 1
+        if lines:
+            yield "\n".join([header] + lines)
+
+    def _map(self, project_key: str, table: str) -> str:
+        user_msg = f"Progetto: {project_key}\n{GPTParser.COMPACT_TABLE_HINT}\n{table}"
+        return self._call(self.MAP_SYSTEM_PROMPT, user_msg, max_tokens=self.PARTIAL_MAX_TOKENS)
+
+    def _reduce(self, project_key: str, partials: list, final: bool) -> str:
+        parts = "\n\n".join(f"[Parte {i}]\n{p}" for i, p in enumerate(partials, start=1))
+        if final:
+            return self._call(
+                GPTParser.SUMMARY_SYSTEM_PROMPT,
+                f"Progetto: {project_key}\nRiassunti parziali degli issue:\n{parts}",
+                max_tokens=600,
+            )
+        return self._call(self.REDUCE_SYSTEM_PROMPT, f"Progetto: {project_key}\n{parts}",
+                          max_tokens=self.PARTIAL_MAX_TOKENS)
+
+    def summarize(self, project_key: str, issues) -> str | None:
+        """Riassume tutti gli 'issues' (lista o iterabile). Ritorna None se non ce ne sono."""
+        self.stats = {"issues": 0, "dropped": 0, "chunks": 0, "levels": 0,
+                      "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # map: i blocchi partono appena pronti, mentre il generatore scarica le pagine successive.
+            # Il primo blocco resta in attesa finché non sappiamo se ce n'è un secondo.
+            first, futures = None, []
+            for lines in self._chunks(issues):
+                if first is None:
+                    first = lines
+                    continue
+                if not futures:
+                    futures.append(pool.submit(TRACER.bind(self._map), project_key, first))
+                futures.append(pool.submit(TRACER.bind(self._map), project_key, lines))
+
+            if self.stats["dropped"]:
+                log.warning("%d issue esclusi dal riassunto: superano da soli il budget di %d token.",
+                            self.stats["dropped"], self.prompt_tokens)
+            if first is None:
+                return None
+            if not futures:
+                # un solo blocco: basta un riassunto diretto, niente reduce
+                self.stats["chunks"] = 1
+                user_msg = f"Progetto: {project_key}\n{GPTParser.COMPACT_TABLE_HINT}\n{first}"
+                summary = self._call(GPTParser.SUMMARY_SYSTEM_PROMPT, user_msg, max_tokens=600)
+                self.stats["total_tokens"] = self.stats["prompt_tokens"] + self.stats["completion_tokens"]
+                return summary
+
+            self.stats["chunks"] = len(futures)
+            partials = [f.result() for f in futures]
+
+            # reduce: fondiamo a gruppi di fan_in finché resta un solo testo
+            while len(partials) > 1:
+                self.stats["levels"] += 1
+                final = len(partials) <= self.fan_in
+                groups = [partials[i:i + self.fan_in] for i in range(0, len(partials), self.fan_in)]
+                partials = list(pool.map(lambda g: self._reduce(project_key, g, final) if len(g) > 1 else g[0],
+                                         groups))
+
+        self.stats["total_tokens"] = self.stats["prompt_tokens"] + self.stats["completion_tokens"]
+        return partials[0]
+
+
+class IssueProjection:
+    """
+    Proiezione degli issue dichiarata dal chiamante: dai nomi degli attributi richiesti
+    costruisce il parametro 'fields' minimo di YouTrack (e l'elenco 'customFields' che
+    limita i custom field restituiti) e converte ogni issue in un record tipizzato
+    (namedtuple IssueRecord) con solo quegli attributi, nell'ordine richiesto.
+
+    Attributi di base: quelli di BASE_ATTRIBUTES (id è l'ID leggibile, db_id quello di
+    database). Ogni altro nome è un custom field: 'priority' -> "Priority",
+    'fix_versions' -> "Fix versions", oppure il nome esplicito in 'custom_names'.
+    I valori dei custom field sono ridotti come nel mirror (nome, login o testo; liste
+    per i campi multi-valore).
+
+        projection = IssueProjection(("id", "summary", "priority"))
+        for issue in yt.iter_issues({"project": "SUP"}, fields=projection):
+            print(issue.id, issue.priority)
+    """
+
+    # attributo -> frammento di 'fields' (chiave o chiave(sottocampo))
+    BASE_ATTRIBUTES = {
+        "id": "idReadable",
+        "db_id": "id",
+        "summary": "summary",
+        "description": "description",
+        "project": "project(shortName)",
+        "created": "created",
+        "updated": "updated",
+        "resolved": "resolved",
+        "reporter": "reporter(login)",
+    }
+    # attributi disponibili anche negli issue del mirror locale
+    MIRROR_ATTRIBUTES = {"id", "summary", "description", "project", "updated"}
+
+    _record_types: dict = {}
+
+    def __init__(self, attributes, custom_names: dict | None = None):
+        self.attributes = tuple(attributes)
+        if not self.attributes:
+            raise ValueError("La proiezione deve contenere almeno un attributo.")
+        custom_names = custom_names or {}
+        self.custom_fields = {
+            attr: custom_names.get(attr) or attr.replace("_", " ").capitalize()
+            for attr in self.attributes
+            if attr not in self.BASE_ATTRIBUTES
+        }
+        key = self.attributes
+        if key not in self._record_types:
+            self._record_types[key] = namedtuple("IssueRecord", self.attributes)
+        self.record_type = self._record_types[key]
+
+    @classmethod
+    def of(cls, fields) -> "IssueProjection":
+        """Accetta una proiezione già pronta o una sequenza di nomi di attributo."""
+        return fields if isinstance(fields, cls) else cls(fields)
+
+    @property
+    def fields(self) -> str:
+        """Parametro 'fields' di YouTrack: solo i campi necessari agli attributi."""
+        parts = [self.BASE_ATTRIBUTES[a] for a in self.attributes if a in self.BASE_ATTRIBUTES]
+        if self.custom_fields:
+            parts.append("customFields(name,value(name,login,text))")
+        return ",".join(dict.fromkeys(parts))
+
+    @property
+    def custom_field_names(self) -> list[str]:
+        """Valori del parametro 'customFields', che limita i custom field nella risposta."""
+        return list(dict.fromkeys(self.custom_fields.values()))
+
+    def params(self) -> dict:
+        """Parametri di query per /api/issues con questa proiezione."""
+        params = {"fields": self.fields}
+        if self.custom_fields:
+            params["customFields"] = self.custom_field_names
+        return params
+
+    @property
+    def mirror_supported(self) -> bool:
+        return all(a in self.MIRROR_ATTRIBUTES or a in self.custom_fields for a in self.attributes)
+
+    def record(self, issue: dict):
+        """Issue JSON di YouTrack -> IssueRecord."""
+        custom = {}
+        if self.custom_fields:
+            custom = {f.get("name"): IssueMirror._simplify(f.get("value")) for f in issue.get("customFields") or []}
+        values = []
+        for attr in self.attributes:
+            if attr in self.custom_fields:
+                values.append(custom.get(self.custom_fields[attr]))
+                continue
+            key, _, sub = self.BASE_ATTRIBUTES[attr].partition("(")
+            value = issue.get(key)
+            if sub and isinstance(value, dict):
+                value = value.get(sub.rstrip(")"))
+            values.append(value)
+        return self.record_type(*values)
+
+    def mirror_record(self, issue: dict):
+        """Issue del mirror locale (custom field già ridotti) -> IssueRecord."""
+        custom = {name.lower(): value for name, value in (issue.get("customFields") or {}).items()}
+        return self.record_type(*(
+            custom.get(self.custom_fields[a].lower()) if a in self.custom_fields else issue.get(a)
+            for a in self.attributes
+        ))
+
+
+class YouTrackClient:
+    """Client per eseguire operazioni su YouTrack tramite API REST e MCP."""
+    def __init__(self, base_url: str, token: str, transport: HttpTransport | None = None,
+                 cache: PersistentCache | None = None):
+        self.base_url = base_url
+        self.token = token
+        # Layer HTTP condiviso: pool keep-alive, timeout e retry per tutte le chiamate
+        self.http = transport or HttpTransport()
+        # Header di autenticazione e tipo di contenuto JSON
+        self.headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        }
+        # Cache per ID progetti e utenti (per evitare lookup ripetuti)
+        self.project_cache = {}
+        self.user_cache = {}
+        # Lookup in corso (namespace, chiave) -> Future, condivisi tra i thread (vedi _lookup_once)
+        self._inflight: dict = {}
+        self._inflight_lock = threading.Lock()
+        self._link_command_cache = {}
+        self._link_types: list | None = None
+        # Cache persistente opzionale, condivisa tra più esecuzioni della CLI
+        self.cache = cache
+        # Mirror locale opzionale (IssueMirror): se un progetto vi è sincronizzato
+        # le letture (list/iter_issues, get_epic_tree) non passano dal server
+        self.mirror = None
+        # Rubrica utenti opzionale (UserDirectory): gli assegnatari si risolvono in locale
+        self.users = None
+
+    @staticmethod
+    def _project_of(issue_id: str) -> str:
+        """Chiave progetto di un ID leggibile (es. 'SUP-17' -> 'SUP')."""
+        return issue_id.rsplit("-", 1)[0].upper()
+
+    def _mirror_for(self, project: str | None):
+        """Il mirror locale se 'project' vi è sincronizzato (con delta sync se vecchio), altrimenti None."""
+        if self.mirror is None or not project:
+            return None
+        return self.mirror if self.mirror.ensure_fresh(project) else None
+
+    def _local_query(self, filters: dict | None, projection: IssueProjection) -> list | None:
+        """
+        Valuta 'filters' sull'indice locale del mirror, senza richieste di rete.
+        Ritorna la lista di record della proiezione oppure None se il progetto non è nel
+        mirror, qualche filtro non è valutabile localmente o la proiezione chiede attributi
+        che il mirror non salva (serve il server).
+        """
+        project = next((v for k, v in (filters or {}).items() if k.lower() == "project"), None)
+        if not isinstance(project, str) or not projection.mirror_supported:
+            return None
+        mirror = self._mirror_for(project)
+        if mirror is None:
+            return None
+        issues = mirror.query(filters)
+        return None if issues is None else [projection.mirror_record(issue) for issue in issues]
+
+    def _mirror_touch(self, issue_or_project: str):
+        """Dopo una scrittura il mirror del progetto va riallineato alla prossima lettura."""
+        if self.mirror is not None and issue_or_project:
+            self.mirror.mark_stale(self._project_of(issue_or_project) if "-" in issue_or_project
+                                   else issue_or_project.upper())
+
+    def _cached(self, namespace: str, memory: dict, key: str):
+        """Cerca 'key' prima nella cache in memoria, poi in quella persistente (se configurata)."""
+        if key in memory:
+            TRACER.cache(namespace, True)
+            return memory[key]
+        if self.cache is not None:
+            value = self.cache.get(namespace, key)
+            if value is not None:
+                TRACER.cache(namespace, True)
+                memory[key] = value
+                return value
+        TRACER.cache(namespace, False)
+        return None
+
+    def _lookup_once(self, namespace: str, memory: dict, key: str, fetch):
+        """
+        Esegue fetch(key) una sola volta anche se più thread chiedono insieme la stessa
+        chiave (es. figli di un Epic con lo stesso assegnatario): il primo esegue la
+        richiesta, gli altri ne attendono il risultato (o l'eccezione).
+        """
+        with self._inflight_lock:
+            # un altro thread può aver appena completato lo stesso lookup
+            if key in memory:
+                return memory[key]
+            future = self._inflight.get((namespace, key))
+            owner = future is None
+            if owner:
+                future = self._inflight[(namespace, key)] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = fetch(key)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                del self._inflight[(namespace, key)]
+
+    def _remember(self, namespace: str, memory: dict, key: str, value):
+        """Salva 'value' nella cache in memoria e, se configurata, in quella persistente."""
+        memory[key] = value
+        if self.cache is not None:
+            self.cache.set(namespace, key, value)
+    
+    def _get_current_user_id(self):
+        """Recupera l'ID dell'utente corrente (associato al token) tramite API YouTrack."""
+        url = f"{self.base_url}/api/users/me?fields=id"
+        resp = self.http.get(url, headers=self.headers)
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get("id")
+    
+    def _find_user_by_name_or_login(self, name_or_login: str):
+        """Trova un utente su YouTrack dato login o nome.
         Prova prima l'endpoint diretto /api/users/{login}, poi la search API.
         Restituisce dict {id, login} oppure None.
+        Con la rubrica utenti attiva (self.users) la ricerca è solo locale.
         """
-        if name_or_login in self.user_cache:
-            return self.user_cache[name_or_login]
+        if self.users is not None and self.users.available():
+            user = self.users.resolve(name_or_login)
+            if user is None:
+                log.warning("Nessun utente trovato per '%s'", name_or_login)
+            return user
+
+        cached = self._cached("user", self.user_cache, name_or_login)
+        if cached is not None:
+            return cached
+        return self._lookup_once("user", self.user_cache, name_or_login, self._fetch_user)
 
+    def _fetch_user(self, name_or_login: str):
+        """Lookup HTTP di _find_user_by_name_or_login (al più tre GET)."""
         # 1) Tentativo diretto: /api/users/{login}
         url_direct = f"{self.base_url}/api/users/{name_or_login}?fields=id,login,fullName"
-        resp = requests.get(url_direct, headers=self.headers)
-        print(f"[DEBUG] GET {url_direct} -> {resp.status_code}")
+        resp = self.http.get(url_direct, headers=self.headers)
         if resp.status_code == 200:
             u = resp.json()
             user = {"id": u["id"], "login": u["login"]}
-            self.user_cache[name_or_login] = user
-            print(f"[DEBUG] Utente '{name_or_login}' trovato via endpoint diretto: {user}")
+            self._remember("user", self.user_cache, name_or_login, user)
+            log.debug("Utente '%s' trovato via endpoint diretto: %s", name_or_login, user)
             return user
 
         # 2) Fallback: search per login
         url_search_login = f"{self.base_url}/api/users?fields=id,login,fullName&query=login:{name_or_login}"
-        resp = requests.get(url_search_login, headers=self.headers)
-        print(f"[DEBUG] GET {url_search_login} -> {resp.status_code}")
+        resp = self.http.get(url_search_login, headers=self.headers)
         if resp.ok:
             users = resp.json()
-            print(f"[DEBUG] Risultati search login: {users}")
+            log.debug("Risultati search login: %s", users)
             if users:
                 u = users[0]
                 user = {"id": u["id"], "login": u["login"]}
-                self.user_cache[name_or_login] = user
+                self._remember("user", self.user_cache, name_or_login, user)
                 return user
 
         # 3) Fallback: search per nome (fullName)
         url_search_name = f"{self.base_url}/api/users?fields=id,login,fullName&query=name:{name_or_login}"
-        resp = requests.get(url_search_name, headers=self.headers)
-        print(f"[DEBUG] GET {url_search_name} -> {resp.status_code}")
+        resp = self.http.get(url_search_name, headers=self.headers)
         if resp.ok:
             users = resp.json()
-            print(f"[DEBUG] Risultati search name: {users}")
+            log.debug("Risultati search name: %s", users)
             if users:
                 u = users[0]
                 user = {"id": u["id"], "login": u["login"]}
-                self.user_cache[name_or_login] = user
+                self._remember("user", self.user_cache, name_or_login, user)
                 return user
 
-        print(f"[WARN] Nessun utente trovato per '{name_or_login}'")
-        return None
+        log.warning("Nessun utente trovato per '%s'", name_or_login)
+        return None
+
+    
+    def _get_project_id(self, project_key: str):
+        """Restituisce l'ID interno di un progetto dato il suo shortName (chiave)."""
+        cached = self._cached("project", self.project_cache, project_key)
+        if cached is not None:
+            return cached
+        return self._lookup_once("project", self.project_cache, project_key, self._fetch_project_id)
+
+    def _fetch_project_id(self, project_key: str):
+        """Lookup HTTP di _get_project_id (endpoint diretto, poi search)."""
+        # 1) Prova endpoint diretto /api/admin/projects/{project_key}
+        url_direct = f"{self.base_url}/api/admin/projects/{project_key}?fields=id,shortName"
+        resp = self.http.get(url_direct, headers=self.headers)
+        if resp.status_code == 200:
+            proj = resp.json()
+            proj_id = proj["id"]
+            self._remember("project", self.project_cache, project_key, proj_id)
+            log.debug("Project '%s' has internal id '%s' (via direct endpoint)", project_key, proj_id)
+            return proj_id
+
+        # 2) Fallback: usa la search API
+        url_search = f"{self.base_url}/api/admin/projects?fields=id,shortName&query=shortName:{project_key}"
+        resp = self.http.get(url_search, headers=self.headers)
+        resp.raise_for_status()
+        projects = resp.json()
+        log.debug("Projects search result: %s", projects)
+        if projects:
+            proj_id = projects[0]["id"]
+            self._remember("project", self.project_cache, project_key, proj_id)
+            log.debug("Project '%s' has internal id '%s' (via search)", project_key, proj_id)
+            return proj_id
+
+        # Se arriviamo qui, non abbiamo trovato il progetto
+        raise ValueError(f"Project '{project_key}' not found on YouTrack")
+
+    
+    def create_project(self, name: str, key: str, description: str = ""):
+        """Crea un nuovo progetto con nome e key specificati. Restituisce l'ID leggibile (shortName) del progetto creato."""
+        # Prepara il corpo JSON con i campi richiesti per la creazione progetto
+        # Campi obbligatori: name, shortName, leader (id utente leader):contentReference[oaicite:18]{index=18}.
+        current_user_id = self._get_current_user_id()
+        project_data = {
+            "name": name,
+            "shortName": key,
+            "leader": { "id": current_user_id }
+        }
+        if description:
+            project_data["description"] = description
+        url = f"{self.base_url}/api/admin/projects?fields=id,shortName,name,leader(login)"
+        resp = self.http.post(url, headers=self.headers, json=project_data)
+        resp.raise_for_status()
+        proj = resp.json()
+        proj_key = proj.get("shortName", key)
+        print(f"✅ Progetto '{proj.get('name')}' creato con chiave {proj_key}")
+        return proj_key
+    
+    def create_issue(self, project: str, summary: str, description: str = "", assignee: str = "", priority: str = "",
+                     issue_type: str = ""):
+        """
+        Crea un nuovo issue nel progetto specificato. Restituisce l'ID leggibile dell'issue creato.
+        'issue_type' (es. 'Epic') imposta il campo Type nella stessa richiesta di creazione.
+        """
+        # Ottiene l'ID interno del progetto (ora, se non esiste, solleva errore chiaro)
+        project_id = self._get_project_id(project)
+
+        issue_data = {
+            "summary": summary,
+            "project": { "id": project_id }
+        }
+        if description:
+            issue_data["description"] = description
+
+        # Prepara la lista dei customFields se necessari
+        custom_fields = []
+        if assignee:
+            user = self._find_user_by_name_or_login(assignee)
+            log.debug("Risultato lookup utente '%s': %s", assignee, user)
+            if user:
+                custom_fields.append({
+                    "name": "Assignee",
+                    "$type": "SingleUserIssueCustomField",
+                    "value": { "login": user["login"] }
+                })
+            else:
+                log.warning("Utente '%s' non trovato, issue creato senza assignee.", assignee)
+
+        if priority:
+            # Imposta il campo di Priorità con il nome fornito:contentReference[oaicite:20]{index=20}
+            custom_fields.append({
+                "name": "Priority",
+                "$type": "SingleEnumIssueCustomField",
+                "value": { "name": priority }
+            })
+        if issue_type:
+            custom_fields.append({
+                "name": "Type",
+                "$type": "SingleEnumIssueCustomField",
+                "value": { "name": issue_type }
+            })
+        if custom_fields:
+            issue_data["customFields"] = custom_fields
+        # Chiamata API per creare l'issue
+        url = f"{self.base_url}/api/issues?fields=id,idReadable"
+        # Il payload completo solo a livello DEBUG: serializzarlo ha un costo
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Issue payload che sto per inviare a YouTrack:\n%s",
+                      json.dumps(issue_data, indent=2, ensure_ascii=False))
+        resp = self.http.post(url, headers=self.headers, json=issue_data)
+        resp.raise_for_status()
+        issue = resp.json()
+        issue_id_readable = issue.get("idReadable")
+        print(f"✅ Issue creato con ID {issue_id_readable}")
+        self._mirror_touch(project)
+        return issue_id_readable
+    
+    def update_issue(self, issue_id: str, fields: dict | None = None, custom_fields: list | None = None):
+        """
+        Aggiorna uno o più campi di un issue in modo generico.
+
+        - fields: dizionario {nomeCampo: valore}, es:
+            {
+              "summary": "Nuovo titolo",
+              "description": "Testo aggiornato",
+              "assignee": "admin",
+              "Priority": "Major",
+              "State": "Submitted"
+            }
+
+          Regole:
+          - summary, description -> campi top-level dell'issue.
+          - 'assignee' (case-insensitive) -> custom field 'Assignee' con value {login: ...}.
+          - 'priority' (minuscolo) -> custom field 'Priority' con value {name: ...}.
+          - 'Priority', 'State', 'Type' (case-sensitive) -> trattati come enum: value {name: valore}.
+          - per tutti gli altri campi:
+              - se value è un dict -> usato come value così com'è
+              - altrimenti -> usato come value scalare (stringa, numero, ecc.)
+
+        - custom_fields: lista di entry customFields già pronte, es:
+            [
+              { "name": "MyCustomEnum", "value": { "name": "Foo" } }
+            ]
+          che vengono aggiunte senza modifiche.
+        """
+        update_data: dict = {}
+        cf_list: list = []
+
+        fields = fields or {}
+        custom_fields = custom_fields or []
+
+        # Campi top-level
+        if "summary" in fields:
+            update_data["summary"] = fields.pop("summary")
+        if "description" in fields:
+            update_data["description"] = fields.pop("description")
+
+        # Altri campi
+        for field_name, value in fields.items():
+            lname = field_name.lower()
+
+            if lname == "assignee":
+                user = self._find_user_by_name_or_login(value)
+                if not user:
+                    log.warning("Utente '%s' non trovato, campo Assignee ignorato.", value)
+                    continue
+                cf_list.append({
+                    "name": "Assignee",
+                    "$type": "SingleUserIssueCustomField",
+                    "value": { "login": user["login"] }
+                })
+
+            elif lname == "priority":
+                # sintassi compatibile con enum standard
+                cf_list.append({
+                    "name": "Priority",
+                    "$type": "SingleEnumIssueCustomField",
+                    "value": { "name": value }
+                })
+
+            elif field_name in ("Priority", "State", "Type"):
+                # altri enum tipici: usiamo {name: valore}
+                cf_list.append({
+                    "name": field_name,
+                    "$type": "SingleEnumIssueCustomField",
+                    "value": { "name": value }
+                })
+
+            else:
+                # caso generico:
+                # - se value è un dict, lo usiamo direttamente come value
+                # - se è scalare (stringa/numero), lo usiamo come value scalare
+                if isinstance(value, dict):
+                    cf_list.append({
+                        "name": field_name,
+                        "$type": "SimpleIssueCustomField",
+                        "value": value
+                    })
+                else:
+                    cf_list.append({
+                        "name": field_name,
+                        "value": value
+                    })
+
+        # Aggiungi eventuali customFields raw passati da fuori
+        cf_list.extend(custom_fields)
+
+        if cf_list:
+            update_data["customFields"] = cf_list
+
+        if not update_data:
+            log.warning("Nessun campo da aggiornare.")
+            return None
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Payload update_issue che sto per inviare:\n%s",
+                      json.dumps(update_data, indent=2, ensure_ascii=False))
+
+        url = f"{self.base_url}/api/issues/{issue_id}?fields=id,idReadable"
+        # Impostare gli stessi valori due volte è innocuo: possiamo ripetere la POST
+        resp = self.http.post(url, headers=self.headers, json=update_data, idempotent=True)
+        if not resp.ok:
+            log.warning("YouTrack ha risposto con errore in update_issue: %s %s", resp.status_code, resp.text)
+            resp.raise_for_status()
+
+        updated = resp.json()
+        issue_key = updated.get("idReadable", issue_id)
+        print(f"✅ Issue {issue_key} aggiornato.")
+        self._mirror_touch(issue_key)
+        return issue_key
+    
+    def change_issue_assignee(self, issue_id: str, assignee: str):
+        """Modifica l'assegnatario di un issue esistente."""
+        return self.update_issue(issue_id, {"assignee": assignee})
+    
+    def delete_issue(self, issue_id: str):
+        """Elimina l'issue specificato (usa l'ID leggibile o quello interno)."""
+        url = f"{self.base_url}/api/issues/{issue_id}"
+        resp = self.http.delete(url, headers=self.headers)
+        if resp.status_code == 404:
+            print(f"⚠️ Issue {issue_id} non trovato o già eliminato.")
+            return False
+        resp.raise_for_status()
+        print(f"✅ Issue {issue_id} eliminato con successo.")
+        if self.mirror is not None:
+            # il delta sync non vede le cancellazioni: togliamo subito la riga dal mirror
+            self.mirror.remove(issue_id)
+        return True
+
+    # 👇 Alias "furbi" per i nomi campo usati spesso in linguaggio naturale o da GPT
+    FIELD_ALIASES = {
+        # se GPT (o noi) scriviamo "Parent for": X intendendo
+        # "dammi i subtask di X", lo mappiamo a "Subtask of"
+        "Parent for": "Subtask of",
+        "parent for": "Subtask of",
+        # altri alias comodi
+        "subtasks": "Subtask of",
+        "subtask": "Subtask of",
+    }
+
+    # Attributi di default di list_issues/iter_issues (vedi IssueProjection)
+    ISSUE_LIST_ATTRIBUTES = ("id", "summary", "project")
+
+    def _build_issue_query(self, filters: dict | None) -> str:
+        """Traduce il dizionario 'filters' {campo: valore} nel linguaggio di query di YouTrack."""
+        query_parts = []
+        if filters:
+            for field, value in filters.items():
+                # normalizza il campo se esiste un alias
+                norm_field = self.FIELD_ALIASES.get(field, field)
+                query_parts.append(f"{norm_field}: {value}")
+        return " ".join(query_parts)
+
+    def _fetch_issue_page(self, params: dict) -> list:
+        """Esegue una GET su /api/issues e restituisce la lista JSON grezza."""
+        base_url = f"{self.base_url}/api/issues"
+        log.debug("GET %s params=%s", base_url, params)
+        resp = self.http.get(base_url, headers=self.headers, params=params)
+        if not resp.ok:
+            log.warning("YouTrack ha risposto con errore in list_issues: %s %s", resp.status_code, resp.text)
+            resp.raise_for_status()
+        return resp.json()
+
+    def list_issues(self, filters: dict | None = None, limit: int = 20, fields=ISSUE_LIST_ATTRIBUTES):
+        """
+        Restituisce la lista degli issue come record IssueRecord.
+        'filters' è un dizionario generico {campo: valore} che viene tradotto
+        direttamente nel linguaggio di query di YouTrack.
+        'fields' sono gli attributi che servono al chiamante (nomi o IssueProjection):
+        YouTrack restituisce solo quelli (default: id, summary, project).
+        Per scorrere tutti gli issue senza limite usare iter_issues().
+        """
+        projection = IssueProjection.of(fields)
+        local = self._local_query(filters, projection)
+        # Il mirror non ha l'ordinamento del server: lo usiamo solo se 'limit' non taglia
+        # niente, altrimenti i primi 'limit' issue sarebbero diversi da quelli di YouTrack
+        if local is not None and len(local) <= limit:
+            return local
+
+        params = {
+            **projection.params(),
+            "$top": limit,
+        }
+        query = self._build_issue_query(filters)
+        if query:
+            params["query"] = query
+
+        return [projection.record(issue) for issue in self._fetch_issue_page(params)]
+
+    def iter_issues(self, filters: dict | None = None, page_size: int = 100, prefetch: bool = True,
+                    fields=ISSUE_LIST_ATTRIBUTES):
+        """
+        Generatore che scorre TUTTI gli issue che soddisfano 'filters', pagina per pagina
+        ($skip/$top), restituendoli uno alla volta come record di 'fields' (vedi list_issues).
+
+        In memoria restano al più due pagine (quella corrente e, con prefetch=True,
+        la successiva, scaricata in background mentre il chiamante consuma la corrente).
+        """
+        projection = IssueProjection.of(fields)
+        local = self._local_query(filters, projection)
+        if local is not None:
+            yield from local
+            return
+
+        query = self._build_issue_query(filters)
+        for issue in self._iter_raw_issues(query, projection.fields, page_size, prefetch,
+                                           custom_fields=projection.custom_field_names):
+            yield projection.record(issue)
+
+    def _iter_raw_issues(self, query: str, fields: str, page_size: int = 100, prefetch: bool = True,
+                         custom_fields: list | None = None):
+        """
+        Scorre pagina per pagina gli issue JSON grezzi di una query (vedi iter_issues).
+        'custom_fields' limita i custom field restituiti a quelli indicati.
+        """
+        def fetch(skip: int) -> list:
+            params = {
+                "fields": fields,
+                "$skip": skip,
+                "$top": page_size,
+            }
+            if custom_fields:
+                params["customFields"] = custom_fields
+            if query:
+                params["query"] = query
+            return self._fetch_issue_page(params)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            skip = 0
+            page = fetch(skip)
+            while page:
+                # Una pagina piena significa che potrebbero essercene altre
+                has_more = len(page) >= page_size
+                next_page = executor.submit(TRACER.bind(fetch), skip + page_size) if executor and has_more else None
+
+                yield from page
+
+                if not has_more:
+                    break
+                skip += page_size
+                page = next_page.result() if next_page else fetch(skip)
+        finally:
+            if executor:
+                # se il chiamante interrompe l'iterazione, non aspettiamo il prefetch pendente
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_link_types(self) -> list:
+        """Restituisce tutti i tipi di link dell'istanza (un'unica GET, poi cache)."""
+        if self._link_types is None:
+            types = self.cache.get("link_types", "all") if self.cache is not None else None
+            if types is None:
+                url = f"{self.base_url}/api/issueLinkTypes"
+                params = {
+                    "fields": "id,name,sourceToTarget,targetToSource,localizedSourceToTarget,localizedTargetToSource"
+                }
+                resp = self.http.get(url, headers=self.headers, params=params)
+                if not resp.ok:
+                    log.warning("Errore nella lettura dei link types: %s %s", resp.status_code, resp.text)
+                    resp.raise_for_status()
+                types = resp.json()
+                if self.cache is not None:
+                    self.cache.set("link_types", "all", types)
+            self._link_types = types
+        return self._link_types
+
+    def _get_link_command(self, link_name: str) -> str | None:
+        """
+        Traduce un nome 'umano' di link nella frase da usare nei comandi YouTrack
+        (es. 'subtask' -> 'subtask of', 'relates' -> 'relates to', 'depends on' -> 'depends on').
+        - confronta con sourceToTarget, targetToSource, localized* e name
+        - 'subtask', 'subtask of', 'parent for' ed 'epic-child' indicano tutti che l'issue
+          sorgente è subtask del target (stessa normalizzazione di sempre per i subtask).
+        """
+        key = link_name.strip().lower()
+        if key in self._link_command_cache:
+            return self._link_command_cache[key]
+
+        types = self._get_link_types()
+
+        phrase = None
+        if key in ("subtask", "subtask of", "parent for", "epic-child"):
+            for t in types:
+                if (t.get("name") or "").lower() == "subtask":
+                    phrase = t.get("targetToSource") or "subtask of"
+                    break
+        else:
+            for t in types:
+                for attr in ("sourceToTarget", "targetToSource",
+                             "localizedSourceToTarget", "localizedTargetToSource"):
+                    if (t.get(attr) or "").lower() == key:
+                        phrase = t[attr]
+                        break
+                if phrase:
+                    break
+                # nome del tipo (es. 'Relates'): usiamo la direzione sorgente -> target
+                if (t.get("name") or "").lower() == key:
+                    phrase = t.get("sourceToTarget") or t["name"]
+                    break
+
+        if not phrase:
+            log.warning("Tipo di link '%s' non trovato. Nessun link creato.", link_name)
+            return None
+
+        self._link_command_cache[key] = phrase
+        return phrase
+
+    def apply_command(self, issue_ids: list[str], command: str, silent: bool = False):
+        """
+        Applica un comando YouTrack (es. 'subtask of SUP-10', 'Priority Major') a una lista
+        di issue con UNA sola richiesta a /api/commands.
+        Con silent=True YouTrack non invia notifiche agli osservatori.
+        """
+        url = f"{self.base_url}/api/commands"
+        payload = {
+            "query": command,
+            "issues": [{"idReadable": issue_id} for issue_id in issue_ids],
+            "silent": silent,
+        }
+        log.debug("POST %s command='%s' issues=%d", url, command, len(issue_ids))
+        # Riapplicare lo stesso comando porta allo stesso stato: la POST è ripetibile
+        resp = self.http.post(url, headers=self.headers, json=payload, idempotent=True)
+        if not resp.ok:
+            log.warning("Errore nell'applicazione del comando: %s %s", resp.status_code, resp.text)
+            resp.raise_for_status()
+
+    # nome del campo nei comandi YouTrack per le chiavi scritte in minuscolo
+    COMMAND_FIELDS = {"assignee": "Assignee", "priority": "Priority", "state": "State", "type": "Type"}
+
+    def build_update_command(self, fields: dict) -> str:
+        """
+        Traduce {campo: valore} in un comando YouTrack, es.
+        {"priority": "Major", "State": "In Progress"} -> "Priority Major State {In Progress}".
+        L'assegnatario viene risolto una volta sola (login). summary e description non
+        si possono impostare con un comando: ValueError.
+        """
+        parts = []
+        for field_name, value in fields.items():
+            if field_name.lower() in ("summary", "description"):
+                raise ValueError(f"Il campo '{field_name}' non si può aggiornare in blocco.")
+            name = self.COMMAND_FIELDS.get(field_name.lower(), field_name)
+            value = str(value).strip()
+            if name == "Assignee" and value.lower() != "unassigned":
+                user = self._find_user_by_name_or_login(value)
+                if not user:
+                    raise ValueError(f"Utente '{value}' non trovato.")
+                value = user["login"]
+            # nomi e valori con spazi vanno tra graffe, come nelle query
+            name = f"{{{name}}}" if " " in name else name
+            value = f"{{{value}}}" if " " in value else value
+            parts.append(f"{name} {value}")
+        return " ".join(parts)
+
+    def bulk_update(self, filters: dict, fields: dict, dry_run: bool = False,
+                    batch_size: int = YT_BULK_BATCH_SIZE, max_workers: int | None = None) -> dict:
+        """
+        Imposta 'fields' su tutti gli issue che soddisfano 'filters' (formato di list_issues):
+        gli issue vengono cercati sempre sul server (anche con il mirror attivo),
+        i campi diventano un unico comando YouTrack (build_update_command) applicato con
+        una richiesta /api/commands ogni 'batch_size' issue, al più 'max_workers' in parallelo,
+        con l'avanzamento stampato man mano. Con dry_run=True non modifica nulla.
+
+        Ritorna {"command": ..., "issues": [ID, ...], "matched": N, "updated": M,
+                 "dry_run": bool, "failures": [{"issues": [...], "error": "..."}]}.
+        """
+        command = self.build_update_command(fields)
+        # Prima si raccolgono tutti gli ID: aggiornare durante la paginazione sposterebbe
+        # gli issue fuori dalla query (es. filtro e modifica sullo stesso State) e $skip ne salterebbe.
+        # Sempre dal server, mai dal mirror: una scrittura in blocco non parte da una copia forse vecchia
+        projection = IssueProjection(("id",))
+        query = self._build_issue_query(filters)
+        issue_ids = [projection.record(issue).id
+                     for issue in self._iter_raw_issues(query, projection.fields, page_size=500)]
+        result = {"command": command, "issues": issue_ids, "matched": len(issue_ids), "updated": 0,
+                  "dry_run": dry_run, "failures": []}
+        if dry_run or not issue_ids:
+            return result
+
+        batches = [issue_ids[i:i + batch_size] for i in range(0, len(issue_ids), batch_size)]
+        if max_workers is None:
+            max_workers = YT_MAX_WORKERS
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+            # silent: niente notifiche agli osservatori per ogni issue del blocco
+            futures = {pool.submit(TRACER.bind(self.apply_command), batch, command, True): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    log.warning("Blocco di %d issue non aggiornato (%s...): %s", len(batch), batch[0], e)
+                    result["failures"].append({"issues": batch, "error": str(e)})
+                else:
+                    result["updated"] += len(batch)
+                done = result["updated"] + sum(len(f["issues"]) for f in result["failures"])
+                print(f"⏳ {done}/{len(issue_ids)} issue elaborati")
+
+        for project in {self._project_of(issue_id) for issue_id in issue_ids}:
+            self._mirror_touch(project)
+        return result
+
+    def link_issues(self, from_issue: str, to_issue: str, link_type_name: str = "relates") -> bool:
+        """
+        Crea un link tra due issue.
+        - from_issue: ID leggibile dell'issue sorgente (es. SUP-10)
+        - to_issue:   ID leggibile dell'issue target (es. SUP-8)
+        - link_type_name: nome del link (es. 'relates', 'depends on', 'subtask', 'parent for')
+        """
+        return self.link_issues_bulk([from_issue], to_issue, link_type_name)
+
+    def link_issues_bulk(self, from_issues: list[str], to_issue: str,
+                         link_type_name: str = "relates", batch_size: int = 100) -> bool:
+        """
+        Collega più issue sorgente allo stesso target con un comando YouTrack
+        (es. "subtask of SUP-10" applicato a tutti i figli), una richiesta ogni 'batch_size' issue.
+        """
+        phrase = self._get_link_command(link_type_name)
+        if not phrase:
+            return False
+
+        for start in range(0, len(from_issues), batch_size):
+            batch = from_issues[start:start + batch_size]
+            self.apply_command(batch, f"{phrase} {to_issue}")
+            print(f"✅ Link '{link_type_name}' creato tra {', '.join(batch)} -> {to_issue}")
+        for issue_id in {to_issue, *from_issues}:
+            self._mirror_touch(issue_id)
+        return True
+
+    def create_epic(self, project: str, summary: str,
+                    description: str = "", assignee: str = "", priority: str = "") -> str:
+        """
+        Crea un issue e lo imposta come Epic (Type = Epic).
+        Restituisce l'ID leggibile dell'Epic (es. SUP-10).
+        """
+        # Type = Epic impostato direttamente nella POST di creazione (una sola richiesta)
+        return self.create_issue(project, summary, description, assignee, priority, issue_type="Epic")
+
+    def _create_child(self, project: str, child: dict) -> dict:
+        """
+        Crea un singolo figlio di un Epic (il link viene fatto dopo, in blocco).
+        Ritorna {"id": ..., "error": ..., "stage": ...}.
+        """
+        c_summary = child.get("summary") or child.get("title")
+        c_desc = child.get("description", "")
+        c_assignee = child.get("assignee", "")
+        c_priority = child.get("priority", "")
+
+        try:
+            child_id = self.create_issue(project, c_summary, c_desc, c_assignee, c_priority)
+        except Exception as e:
+            return {"id": None, "error": str(e), "stage": "create"}
+        return {"id": child_id, "error": None, "stage": "done"}
+
+    def create_epic_with_children(self, project: str,
+                                  epic_fields: dict,
+                                  children: list[dict],
+                                  child_link_type: str = "subtask",
+                                  max_workers: int | None = None) -> dict:
+        """
+        Crea un Epic e una serie di task figli, collegandoli come subtasks (o altro link type).
+        epic_fields: dict con almeno 'summary', opzionali description/assignee/priority.
+        children: lista di dict, ognuno con almeno 'summary', opzionali description/assignee/priority.
+        max_workers: numero massimo di figli creati in parallelo
+                     (default: YT_MAX_WORKERS; 1 = esecuzione sequenziale).
+        I figli vengono poi collegati all'Epic con un unico comando in blocco (vedi EpicPipeline).
+        Ritorna un dict con gli ID (nell'ordine di 'children') e gli eventuali errori per figlio:
+           { "epic": "SUP-10", "children": ["SUP-11", "SUP-12", ...],
+             "failures": [{"index": 2, "summary": "...", "stage": "link", "issue": "SUP-13", "error": "..."}] }
+        """
+        pipeline = EpicPipeline(self, project, child_link_type, max_workers=max_workers)
+        pipeline.start_epic(epic_fields)
+        for child in children:
+            pipeline.add_child(child)
+        return pipeline.finish()
+
+    @staticmethod
+    def _child_record(item: dict) -> dict:
+        """Riduce un subtask YouTrack a {id, summary, type, priority}."""
+        cf = {}
+        for f in item.get("customFields", []):
+            name = f.get("name")
+            val = f.get("value")
+            if isinstance(val, dict):
+                cf[name] = val.get("name")
+        return {
+            "id": item.get("idReadable", ""),
+            "summary": item.get("summary", ""),
+            "type": cf.get("Type"),
+            "priority": cf.get("Priority")
+        }
+
+    CHILD_ATTRIBUTES = ("id", "summary", "type", "priority")
+
+    def get_children_of_epic(self, epic_id: str, fields=CHILD_ATTRIBUTES):
+        """
+        Restituisce tutti i subtasks dell'Epic come record di 'fields' (default: id,
+        summary, type, priority; vedi IssueProjection).
+        Solo il primo livello: per l'intero albero usare get_epic_tree().
+        """
+        projection = IssueProjection.of(fields)
+        # cerchiamo TUTTI gli issue che sono 'subtask of' l'Epic
+        query = f"subtask of: {epic_id}"
+        return [
+            projection.record(item)
+            for item in self._iter_raw_issues(query, projection.fields, prefetch=False,
+                                              custom_fields=projection.custom_field_names)
+        ]
+
+    HIERARCHY_FIELDS = (
+        "id,idReadable,summary,customFields(name,value(name)),"
+        "links(direction,linkType(name),issues(idReadable))"
+    )
+    # della visita servono solo Type e Priority (vedi _child_record)
+    HIERARCHY_CUSTOM_FIELDS = ["Type", "Priority"]
+
+    def get_epic_tree(self, epic_id: str, max_depth: int = 5, parents_per_query: int = 50) -> dict:
+        """
+        Restituisce l'intera gerarchia di subtask sotto l'Epic, visitata in ampiezza.
+
+        Per ogni livello si fa UNA query "subtask of: A, B, C, ..." che copre tutti i nodi
+        di quel livello (a gruppi di 'parents_per_query' per non superare la lunghezza
+        della query), quindi le richieste sono O(profondità) e non O(nodi).
+        Il genitore di ogni risultato si ricava dai suoi link 'Subtask'.
+
+        Ritorna:
+          { "id": "SUP-17", "children": [ {id, summary, type, priority, children: [...]}, ... ],
+            "cycles": [["SUP-20", "SUP-17"], ...],  # link figlio -> antenato già visitato
+            "truncated": True se max_depth ha interrotto la visita (l'ultimo livello ha figli),
+            "requests": numero di query eseguite }
+        Se il progetto dell'Epic è nel mirror locale la visita avviene lì, senza richieste
+        (a meno che qualche subtask stia in un progetto non sincronizzato).
+        """
+        mirror = self._mirror_for(self._project_of(epic_id))
+        if mirror is not None:
+            tree = mirror.get_epic_tree(epic_id, max_depth=max_depth)
+            if tree is not None:
+                return tree
+
+        root = {"id": epic_id, "children": []}
+        nodes = {epic_id: root}
+        parent_of: dict = {}
+        cycles: list = []
+        requests_made = 0
+
+        level = [epic_id]
+        depth = 0
+        while level and depth < max_depth:
+            depth += 1
+            level_set = set(level)
+            next_level = []
+            for start in range(0, len(level), parents_per_query):
+                group = level[start:start + parents_per_query]
+                query = f"subtask of: {', '.join(group)}"
+                requests_made += 1
+                for item in self._iter_raw_issues(query, self.HIERARCHY_FIELDS, prefetch=False,
+                                                  custom_fields=self.HIERARCHY_CUSTOM_FIELDS):
+                    child_id = item.get("idReadable")
+                    parents = [
+                        linked.get("idReadable")
+                        for link in item.get("links", [])
+                        if (link.get("linkType") or {}).get("name", "").lower() == "subtask"
+                        and link.get("direction") != "OUTWARD"
+                        for linked in link.get("issues", [])
+                        if linked.get("idReadable") in level_set
+                    ]
+                    for parent_id in parents:
+                        if child_id in nodes:
+                            # già visitato: se è un antenato del genitore abbiamo un ciclo
+                            ancestor = parent_id
+                            while ancestor is not None and ancestor != child_id:
+                                ancestor = parent_of.get(ancestor)
+                            if ancestor == child_id:
+                                cycles.append([parent_id, child_id])
+                            continue
+                        node = self._child_record(item)
+                        node["children"] = []
+                        nodes[child_id] = node
+                        parent_of[child_id] = parent_id
+                        nodes[parent_id]["children"].append(node)
+                        next_level.append(child_id)
+            level = next_level
+
+        # Al limite di profondità la visita è troncata solo se l'ultimo livello ha figli
+        truncated = False
+        for start in range(0, len(level), parents_per_query):
+            requests_made += 1
+            query = f"subtask of: {', '.join(level[start:start + parents_per_query])}"
+            if self._fetch_issue_page({"fields": "idReadable", "$top": 1, "query": query}):
+                truncated = True
+                break
+
+        root["cycles"] = cycles
+        root["truncated"] = truncated
+        root["requests"] = requests_made
+        return root
+
+    @staticmethod
+    def render_epic_tree(tree: dict) -> list[str]:
+        """Rende l'albero di get_epic_tree come righe di testo con ├── / └──."""
+        lines = [tree["id"]]
+
+        def walk(children: list, prefix: str):
+            for index, c in enumerate(children):
+                last = index == len(children) - 1
+                lines.append(f"{prefix}{'└── ' if last else '├── '}{c['id']} {c['summary']} "
+                             f"({c['type']} – {c['priority']})")
+                walk(c["children"], prefix + ("    " if last else "│   "))
+
+        walk(tree["children"], "   ")
+        return lines
+
+class EpicPipeline:
+    """
+    Creazione incrementale di un Epic con i suoi figli.
+
+    L'Epic viene creato appena start_epic() lo riceve, ogni figlio appena add_child()
+    lo riceve: i figli sono creati in parallelo (al più 'max_workers' alla volta),
+    dopo l'Epic, e finish() li collega tutti all'Epic con un unico comando in blocco.
+    Con un piano già completo (create_epic_with_children) equivale a creare l'Epic e poi
+    i figli in parallelo; con un piano in streaming (StreamedEpicPlan) le creazioni
+    partono mentre il modello sta ancora generando i figli successivi.
+    """
+
+    def __init__(self, client: YouTrackClient, project: str, child_link_type: str = "subtask",
+                 max_workers: int | None = None):
+        self.client = client
+        self.project = project
+        self.child_link_type = child_link_type
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers or YT_MAX_WORKERS))
+        self.epic_future = None
+        # (indice nel piano, figlio, future della creazione)
+        self.children: list[tuple[int, dict, object]] = []
+        self._next_index = 0
+
+    def start_epic(self, epic_fields: dict):
+        """Avvia la creazione dell'Epic (è la prima richiesta inviata al pool)."""
+        epic_summary = epic_fields.get("summary") or epic_fields.get("title")
+        if not epic_summary:
+            raise ValueError("Per create_epic_with_children è necessario almeno epic.summary")
+        self.epic_future = self.pool.submit(
+            TRACER.bind(self.client.create_epic), self.project, epic_summary,
+            epic_fields.get("description", ""), epic_fields.get("assignee", ""),
+            epic_fields.get("priority", ""),
+        )
+        # I tipi di link servono solo in finish(): li leggiamo mentre Epic e figli vengono creati
+        # (eventuali errori si ripresenteranno, e verranno gestiti, al momento del link)
+        self.pool.submit(TRACER.bind(self.client._get_link_types))
+
+    def add_child(self, child: dict):
+        """Avvia la creazione di un figlio (dopo start_epic)."""
+        index = self._next_index
+        self._next_index += 1
+        if not (child.get("summary") or child.get("title")):
+            log.warning("Child senza summary, saltato.")
+            return
+        self.children.append((index, child, self.pool.submit(TRACER.bind(self._create_child), child)))
+
+    def _create_child(self, child: dict) -> dict:
+        # I figli vengono creati solo se l'Epic esiste: l'Epic è stato inviato al pool
+        # per primo, quindi qui è già completato o in corso (nessun rischio di stallo)
+        try:
+            self.epic_future.result()
+        except Exception as e:
+            return {"id": None, "error": f"Epic non creato: {e}", "stage": "create"}
+        return self.client._create_child(self.project, child)
+
+    def cancel(self) -> dict:
+        """
+        Piano interrotto: rinuncia alle creazioni non ancora partite, attende quelle in
+        corso e NON collega nulla. Ritorna quanto è stato comunque creato su YouTrack,
+        {"epic": ID o None, "children": [ID, ...]}, perché il chiamante lo possa riportare.
+        """
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        epic_id = None
+        if self.epic_future is not None and not self.epic_future.cancelled() \
+                and self.epic_future.exception() is None:
+            epic_id = self.epic_future.result()
+        child_ids = [
+            future.result()["id"]
+            for _, _, future in self.children
+            if not future.cancelled() and future.result()["id"]
+        ]
+        return {"epic": epic_id, "children": child_ids}
+
+    def finish(self, child_link_type: str | None = None) -> dict:
+        """
+        Attende Epic e figli, collega i figli creati all'Epic con un solo comando e
+        ritorna il risultato nel formato di create_epic_with_children.
+        """
+        if child_link_type:
+            self.child_link_type = child_link_type
+        try:
+            # se la creazione dell'Epic è fallita l'eccezione arriva al chiamante
+            epic_id = self.epic_future.result()
+            outcomes = [future.result() for _, _, future in self.children]
+        finally:
+            self.pool.shutdown(wait=True)
+
+        # Link epic -> figli come subtask (o altro tipo): un solo comando per tutti
+        created = [outcome["id"] for outcome in outcomes if outcome["id"]]
+        if created:
+            try:
+                linked = self.client.link_issues_bulk(created, epic_id, self.child_link_type)
+                link_error = None if linked else f"link '{self.child_link_type}' non creato"
+            except Exception as e:
+                link_error = str(e)
+            if link_error:
+                for outcome in outcomes:
+                    if outcome["id"]:
+                        outcome.update({"error": link_error, "stage": "link"})
+
+        child_ids: list[str] = []
+        failures: list[dict] = []
+        for (index, child, _), outcome in zip(self.children, outcomes):
+            if outcome["id"]:
+                child_ids.append(outcome["id"])
+            if outcome["error"]:
+                failures.append({
+                    "index": index,
+                    "summary": child.get("summary") or child.get("title"),
+                    "stage": outcome["stage"],
+                    "issue": outcome["id"],
+                    "error": outcome["error"],
+                })
+
+        print(f"✅ Epic {epic_id} creato con figli {child_ids}")
+        for f in failures:
+            log.warning("Figlio #%d '%s' fallito in fase %s: %s", f["index"], f["summary"], f["stage"], f["error"])
+        return {"epic": epic_id, "children": child_ids, "failures": failures}
+
+
+class StreamedEpicPlan:
+    """
+    Esecuzione in pipeline di un create_epic_with_children mentre GPT lo sta generando.
+
+    Si passa on_value a GPTParser.parse_command: appena sono noti 'project' ed 'epic'
+    l'Epic viene creato, e ogni elemento di 'children' viene inviato alla creazione
+    appena il modello lo chiude. Alla fine finish() attende le creazioni e collega i
+    figli con un unico comando: il tempo totale tende a max(generazione, scritture)
+    invece della loro somma. Per le altre azioni on_value non fa nulla.
+    Se la risposta viene poi scartata (non valida o troncata) abort() non collega nulla
+    e riporta gli issue già creati, senza completare il piano.
+    """
+
+    ACTION = "create_epic_with_children"
+
+    def __init__(self, client: YouTrackClient, max_workers: int | None = None):
+        self.client = client
+        self.max_workers = max_workers
+        self.pipeline = None
+        self.project = None
+        self.epic = None
+        self.pending_children: list[dict] = []
+        self.received = 0
+        self.closed = False
+
+    @property
+    def started(self) -> bool:
+        return self.pipeline is not None
+
+    def on_value(self, action: str, path: tuple, value):
+        if self.closed or action != self.ACTION or len(path) > 2:
+            return
+        if path == ("project",) and isinstance(value, str):
+            self.project = value
+        elif path == ("epic",) and isinstance(value, dict):
+            self.epic = value
+        elif len(path) == 2 and path[0] == "children" and isinstance(value, dict):
+            self.pending_children.append(value)
+            self.received += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        if self.pipeline is None:
+            # l'Epic parte solo con progetto noto e summary presente (altrimenti
+            # la validazione finale del piano lo rifiuterà)
+            epic_schema = ACTION_SCHEMAS[self.ACTION]["properties"]["epic"]
+            if not self.project or self.epic is None or validate_schema(self.epic, epic_schema):
+                return
+            self.pipeline = EpicPipeline(self.client, self.project, max_workers=self.max_workers)
+            self.pipeline.start_epic(self.epic)
+        while self.pending_children:
+            self.pipeline.add_child(self.pending_children.pop(0))
+
+    def finish(self, action_data: dict) -> dict:
+        """Completa il piano (action_data è l'azione finale già validata) e ne ritorna il risultato."""
+        with TRACER.span(self.ACTION, kind="action", streamed=True):
+            # eventuali figli non ricevuti in streaming (es. JSON parziale non leggibile)
+            self.pending_children.extend((action_data.get("children") or [])[self.received:])
+            self.received = len(action_data.get("children") or [])
+            self.project = self.project or action_data.get("project")
+            self.epic = self.epic or action_data.get("epic")
+            self._dispatch()
+            return self.pipeline.finish(action_data.get("link_type") or "subtask")
+
+    def discard(self) -> bool:
+        """
+        Risposta scartata per escalation (on_discard di parse_command): True se non era
+        partita nessuna scrittura e il piano si può sostituire, False altrimenti.
+        """
+        if self.pipeline is not None:
+            return False
+        self.closed = True
+        return True
+
+    def abort(self) -> dict | None:
+        """
+        Piano interrotto (risposta troncata o non valida): nessuna nuova creazione e
+        nessun link; le creazioni già partite non si possono annullare, quindi vengono
+        attese e riportate. Ritorna {"epic": ..., "children": [...]} con gli issue
+        creati (None se non era partito nulla).
+        Dopo abort() il piano non riceve più valori e started è False.
+        """
+        self.closed = True
+        pipeline, self.pipeline = self.pipeline, None
+        if pipeline is None:
+            return None
+        self.pending_children.clear()
+        created = pipeline.cancel()
+        issues = [i for i in [created["epic"], *created["children"]] if i]
+        if issues:
+            print(f"⚠️ Piano interrotto: issue già creati e non collegati: {', '.join(issues)}")
+        else:
+            print("⚠️ Piano interrotto: nessun issue creato.")
+        return created
+
+
+class LocalIssueIndex:
+    """
+    Motore di query in memoria sugli issue di un progetto del mirror, per valutare gli
+    stessi 'filters' di YouTrackClient.list_issues senza richieste di rete.
+
+    Indici secondari su project, Assignee, Priority, State e Type (valore -> insieme di ID),
+    indice dei subtask per 'Subtask of' (con gli alias di YouTrackClient.FIELD_ALIASES);
+    gli altri custom field noti vengono valutati con una scansione.
+    Sono supportati valori semplici, liste separate da virgola (OR), valori tra graffe
+    e 'Unassigned'; tutto il resto (range, negazioni, #tag, 'me', Resolved/Unresolved,
+    campi sconosciuti...) fa ritornare None a query(), e il chiamante passa al server.
+    Anche un valore che nessun issue del mirror ha (es. il nome completo di un utente,
+    di cui il mirror salva solo il login, o un valore di enum mai usato) va al server:
+    solo lui sa se corrisponde a qualcosa.
+    """
+
+    INDEXED_FIELDS = ("project", "assignee", "priority", "state", "type")
+    UNSUPPORTED_SYNTAX = ("..", "#", ":", "(", ")", "*")
+    SERVER_KEYWORDS = ("me", "resolved", "unresolved")
+
+    def __init__(self, issues):
+        self.order: list[str] = []
+        self.records: dict = {}
+        self.values: dict = {}
+        self.custom_fields: set = set()
+        self.indexes: dict = {field: {} for field in self.INDEXED_FIELDS}
+        self.subtasks_of: dict = {}
+
+        for issue in issues:
+            issue_id = issue["id"]
+            self.order.append(issue_id)
+            self.records[issue_id] = issue
+
+            values = {"project": issue["project"]}
+            for name, value in (issue.get("customFields") or {}).items():
+                self.custom_fields.add(name.lower())
+                values[name.lower()] = value
+            self.values[issue_id] = values
+
+            for field in self.INDEXED_FIELDS:
+                for key in self._keys(values.get(field)):
+                    self.indexes[field].setdefault(key, set()).add(issue_id)
+
+            for link in issue.get("links") or []:
+                if (link.get("type") or "").lower() == "subtask" and link.get("direction") != "OUTWARD":
+                    for parent_id in link.get("issues", []):
+                        self.subtasks_of.setdefault(parent_id.upper(), set()).add(issue_id)
+
+    @staticmethod
+    def _keys(value) -> set:
+        """Chiavi di indice di un valore: minuscole, None per 'non impostato', una per elemento delle liste."""
+        if value is None or value == []:
+            return {None}
+        if isinstance(value, list):
+            return {str(v).lower() for v in value if v is not None}
+        return {str(value).lower()}
+
+    @classmethod
+    def _parse_values(cls, raw) -> set | None:
+        """Valori accettati da un filtro ('Major, Critical' -> {'major', 'critical'}), None se non supportato."""
+        text = str(raw).strip()
+        if not text or text.startswith("-") or any(token in text.lower() for token in cls.UNSUPPORTED_SYNTAX):
+            return None
+        values = set()
+        for part in text.split(","):
+            part = part.strip().strip("{}").strip()
+            # 'me' dipende dall'utente del token e Resolved/Unresolved sono parole chiave
+            # (stato risolto o no, non nomi di stato): le lasciamo valutare al server
+            if not part or part.lower() in cls.SERVER_KEYWORDS:
+                return None
+            values.add(None if part.lower() == "unassigned" else part.lower())
+        return values
+
+    @staticmethod
+    def _known(values: set, keys) -> bool:
+        """True se ogni valore del filtro (tranne 'Unassigned') compare tra le chiavi del campo."""
+        return all(v is None or v in keys for v in values)
+
+    def match(self, filters: dict) -> set | None:
+        """Insieme degli ID che soddisfano tutti i filtri, o None se qualche filtro non è valutabile."""
+        result = None
+        for field, raw in filters.items():
+            name = YouTrackClient.FIELD_ALIASES.get(field, field).lower()
+            values = self._parse_values(raw)
+            if values is None:
+                return None
+
+            if name == "subtask of":
+                ids = set().union(*(self.subtasks_of.get(str(v).upper(), set()) for v in values))
+            elif name in self.indexes:
+                if not self._known(values, self.indexes[name]):
+                    return None
+                ids = set().union(*(self.indexes[name].get(v, set()) for v in values))
+            elif name in self.custom_fields:
+                keys = {i: self._keys(self.values[i].get(name)) for i in self.order}
+                if not self._known(values, set().union(*keys.values())):
+                    return None
+                ids = {i for i in self.order if keys[i] & values}
+            else:
+                return None
+
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return set(self.order) if result is None else result
+
+    def query(self, filters: dict) -> list | None:
+        """Issue del mirror che soddisfano 'filters', dal più recente; None se non valutabile."""
+        ids = self.match(filters)
+        if ids is None:
+            return None
+        return [self.records[i] for i in self.order if i in ids]
+
+
+class IssueMirror:
+    """
+    Copia locale (SQLite) degli issue di uno o più progetti, per servire le letture
+    senza interrogare YouTrack.
+
+    - sync(project, full=True): scarica tutti gli issue del progetto e rimuove quelli
+      non più presenti;
+    - sync(project): delta sync, solo gli issue con 'updated' successivo alla watermark
+      salvata (meno YT_MIRROR_OVERLAP di margine);
+    - ensure_fresh(project): usato dal client prima di ogni lettura, esegue un delta sync
+      se l'ultimo è più vecchio di 'max_age' secondi.
+
+    I sync dello stesso progetto sono serializzati: con più thread solo il primo che
+    trova il mirror vecchio lo aggiorna, gli altri aspettano e rileggono lo stato.
+
+    Per ogni issue vengono salvati summary, description, progetto, updated, i custom
+    field (valori semplificati) e i link; le cancellazioni fatte da altri client
+    vengono recepite solo da un full sync.
+    """
+
+    FIELDS = (
+        "id,idReadable,summary,description,updated,project(shortName),"
+        "customFields(name,value(name,login,text)),"
+        "links(direction,linkType(name),issues(idReadable))"
+    )
+
+    def __init__(self, client: YouTrackClient, path: str | None = None,
+                 max_age: float = YT_MIRROR_MAX_AGE, overlap: float = YT_MIRROR_OVERLAP):
+        self.client = client
+        self.base_url = client.base_url
+        self.max_age = max_age
+        self.overlap = overlap
+        self.path = path or os.path.join(YT_CACHE_DIR, "mirror.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self._lock = threading.RLock()
+        # Un sync alla volta per progetto: i thread che trovano il mirror vecchio aspettano
+        # quello in corso invece di scaricare tutti lo stesso delta
+        self._sync_locks: dict = {}
+        # Indici in memoria per progetto, invalidati da ogni modifica del mirror
+        self._generation = 0
+        self._indexes: dict = {}
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS issues ("
+                " base_url TEXT NOT NULL, id_readable TEXT NOT NULL, db_id TEXT, project TEXT NOT NULL,"
+                " summary TEXT, description TEXT, updated INTEGER, custom_fields TEXT, links TEXT,"
+                " PRIMARY KEY (base_url, id_readable));"
+                "CREATE INDEX IF NOT EXISTS issues_project ON issues (base_url, project, updated);"
+                "CREATE TABLE IF NOT EXISTS issue_links ("
+                " base_url TEXT NOT NULL, source TEXT NOT NULL, link_type TEXT NOT NULL,"
+                " direction TEXT, target TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS issue_links_target ON issue_links (base_url, target, link_type);"
+                "CREATE INDEX IF NOT EXISTS issue_links_source ON issue_links (base_url, source);"
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                " base_url TEXT NOT NULL, project TEXT NOT NULL, watermark INTEGER,"
+                " last_full_sync REAL, last_sync REAL,"
+                " PRIMARY KEY (base_url, project));"
+            )
+
+    @staticmethod
+    def _simplify(value):
+        """Valore di un custom field YouTrack ridotto a stringa/lista (nome, login o testo)."""
+        if isinstance(value, dict):
+            # per gli utenti teniamo il login, lo stesso usato nelle query (es. Assignee: admin)
+            return value.get("login") or value.get("name") or value.get("text")
+        if isinstance(value, list):
+            return [IssueMirror._simplify(v) for v in value]
+        return value
+
+    def _upsert(self, item: dict):
+        issue_id = item.get("idReadable")
+        custom_fields = {f.get("name"): self._simplify(f.get("value")) for f in item.get("customFields", [])}
+        links = [
+            {
+                "type": (link.get("linkType") or {}).get("name"),
+                "direction": link.get("direction"),
+                "issues": [i.get("idReadable") for i in link.get("issues", [])],
+            }
+            for link in item.get("links", [])
+            if link.get("issues")
+        ]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO issues (base_url, id_readable, db_id, project, summary, description,"
+            " updated, custom_fields, links) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.base_url, issue_id, item.get("id"), (item.get("project") or {}).get("shortName"),
+             item.get("summary"), item.get("description"), item.get("updated"),
+             json.dumps(custom_fields, ensure_ascii=False), json.dumps(links, ensure_ascii=False)),
+        )
+        self._conn.execute("DELETE FROM issue_links WHERE base_url = ? AND source = ?", (self.base_url, issue_id))
+        self._conn.executemany(
+            "INSERT INTO issue_links (base_url, source, link_type, direction, target) VALUES (?, ?, ?, ?, ?)",
+            [(self.base_url, issue_id, (link["type"] or "").lower(), link["direction"], target)
+             for link in links for target in link["issues"]],
+        )
+
+    def _state(self, project: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT watermark, last_full_sync, last_sync FROM sync_state WHERE base_url = ? AND project = ?",
+                (self.base_url, project),
+            ).fetchone()
+
+    def sync(self, project: str, full: bool = False) -> dict:
+        """Sincronizza il progetto (full o delta). Ritorna {mode, fetched, removed, watermark}."""
+        project = project.upper()
+        with self._sync_lock(project):
+            return self._sync(project, full)
+
+    def _sync_lock(self, project: str) -> threading.RLock:
+        with self._lock:
+            return self._sync_locks.setdefault(project, threading.RLock())
+
+    def _sync(self, project: str, full: bool) -> dict:
+        state = self._state(project)
+        watermark = state[0] if state else None
+        mode = "full" if (full or watermark is None) else "delta"
+
+        query = f"project: {project}"
+        if mode == "delta":
+            since = datetime.fromtimestamp(watermark / 1000 - self.overlap, tz=timezone.utc)
+            query += f" updated: {since:%Y-%m-%d} .. *"
+
+        fetched = 0
+        seen: set = set()
+        new_watermark = watermark or 0
+        batch: list = []
+
+        def flush():
+            # una transazione per blocco di issue, non per singolo issue
+            with self._lock, self._conn:
+                for pending in batch:
+                    self._upsert(pending)
+            batch.clear()
+
+        for item in self.client._iter_raw_issues(query, self.FIELDS):
+            batch.append(item)
+            fetched += 1
+            seen.add(item.get("idReadable"))
+            new_watermark = max(new_watermark, item.get("updated") or 0)
+            if len(batch) >= 500:
+                flush()
+        flush()
+
+        removed = 0
+        now = time.time()
+        with self._lock, self._conn:
+            self._generation += 1
+            if mode == "full":
+                # gli issue non più restituiti dal server sono stati cancellati
+                rows = self._conn.execute(
+                    "SELECT id_readable FROM issues WHERE base_url = ? AND project = ?", (self.base_url, project)
+                ).fetchall()
+                stale = [(self.base_url, r[0]) for r in rows if r[0] not in seen]
+                self._conn.executemany("DELETE FROM issues WHERE base_url = ? AND id_readable = ?", stale)
+                self._conn.executemany("DELETE FROM issue_links WHERE base_url = ? AND source = ?", stale)
+                removed = len(stale)
+            self._conn.execute(
+                "INSERT INTO sync_state (base_url, project, watermark, last_full_sync, last_sync)"
+                " VALUES (?, ?, ?, ?, ?) ON CONFLICT (base_url, project) DO UPDATE SET"
+                " watermark = excluded.watermark, last_sync = excluded.last_sync,"
+                " last_full_sync = COALESCE(excluded.last_full_sync, sync_state.last_full_sync)",
+                (self.base_url, project, new_watermark, now if mode == "full" else None, now),
+            )
 
-    
-    def _get_project_id(self, project_key: str):
-        """Restituisce l'ID interno di un progetto dato il suo shortName (chiave)."""
-        if project_key in self.project_cache:
-            return self.project_cache[project_key]
+        print(f"🔄 Mirror {project}: sync {mode}, {fetched} issue scaricati, {removed} rimossi.")
+        return {"project": project, "mode": mode, "fetched": fetched, "removed": removed,
+                "watermark": new_watermark}
 
-        # 1) Prova endpoint diretto /api/admin/projects/{project_key}
-        url_direct = f"{self.base_url}/api/admin/projects/{project_key}?fields=id,shortName"
-        resp = requests.get(url_direct, headers=self.headers)
-        print(f"[DEBUG] GET {url_direct} -> {resp.status_code}")
-        if resp.status_code == 200:
-            proj = resp.json()
-            proj_id = proj["id"]
-            self.project_cache[project_key] = proj_id
-            print(f"[DEBUG] Project '{project_key}' has internal id '{proj_id}' (via direct endpoint)")
-            return proj_id
+    def is_synced(self, project: str) -> bool:
+        return self._state(project.upper()) is not None
 
-        # 2) Fallback: usa la search API
-        url_search = f"{self.base_url}/api/admin/projects?fields=id,shortName&query=shortName:{project_key}"
-        resp = requests.get(url_search, headers=self.headers)
-        print(f"[DEBUG] GET {url_search} -> {resp.status_code}")
-        resp.raise_for_status()
-        projects = resp.json()
-        print(f"[DEBUG] Projects search result: {projects}")
-        if projects:
-            proj_id = projects[0]["id"]
-            self.project_cache[project_key] = proj_id
-            print(f"[DEBUG] Project '{project_key}' has internal id '{proj_id}' (via search)")
-            return proj_id
+    def ensure_fresh(self, project: str) -> bool:
+        """True se il progetto è nel mirror (eseguendo prima un delta sync se è troppo vecchio)."""
+        project = project.upper()
+        state = self._state(project)
+        if state is None:
+            return False
+        if time.time() - (state[2] or 0) > self.max_age:
+            with self._sync_lock(project):
+                # un altro thread potrebbe aver appena finito il sync mentre aspettavamo
+                state = self._state(project)
+                if time.time() - (state[2] or 0) > self.max_age:
+                    self.sync(project)
+        return True
 
-        # Se arriviamo qui, non abbiamo trovato il progetto
-        raise ValueError(f"Project '{project_key}' not found on YouTrack")
+    def mark_stale(self, project: str):
+        """Forza un delta sync alla prossima lettura del progetto (es. dopo una scrittura)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sync_state SET last_sync = 0 WHERE base_url = ? AND project = ?",
+                (self.base_url, project.upper()),
+            )
 
-    
-    def create_project(self, name: str, key: str, description: str = ""):
-        """Crea un nuovo progetto con nome e key specificati. Restituisce l'ID leggibile (shortName) del progetto creato."""
-        # Prepara il corpo JSON con i campi richiesti per la creazione progetto
-        # Campi obbligatori: name, shortName, leader (id utente leader):contentReference[oaicite:18]{index=18}.
-        current_user_id = self._get_current_user_id()
-        project_data = {
-            "name": name,
-            "shortName": key,
-            "leader": { "id": current_user_id }
-        }
-        if description:
-            project_data["description"] = description
-        url = f"{self.base_url}/api/admin/projects?fields=id,shortName,name,leader(login)"
-        resp = requests.post(url, headers=self.headers, json=project_data)
-        resp.raise_for_status()
-        proj = resp.json()
-        proj_key = proj.get("shortName", key)
-        print(f"✅ Progetto '{proj.get('name')}' creato con chiave {proj_key}")
-        return proj_key
-    
-    def create_issue(self, project: str, summary: str, description: str = "", assignee: str = "", priority: str = ""):
-        """Crea un nuovo issue nel progetto specificato. Restituisce l'ID leggibile dell'issue creato."""
-        # Ottiene l'ID interno del progetto (ora, se non esiste, solleva errore chiaro)
-        project_id = self._get_project_id(project)
+    def remove(self, issue_id: str):
+        with self._lock, self._conn:
+            self._generation += 1
+            self._conn.execute("DELETE FROM issues WHERE base_url = ? AND id_readable = ?",
+                               (self.base_url, issue_id))
+            self._conn.execute("DELETE FROM issue_links WHERE base_url = ? AND (source = ? OR target = ?)",
+                               (self.base_url, issue_id, issue_id))
 
-        issue_data = {
+    def _row_to_issue(self, row) -> dict:
+        id_readable, project, summary, description, updated, custom_fields, links = row
+        return {
+            "id": id_readable,
             "summary": summary,
-            "project": { "id": project_id }
+            "project": project,
+            "description": description,
+            "updated": updated,
+            "customFields": json.loads(custom_fields or "{}"),
+            "links": json.loads(links or "[]"),
         }
-        if description:
-            issue_data["description"] = description
-
-        # Prepara la lista dei customFields se necessari
-        custom_fields = []
-        if assignee:
-            user = self._find_user_by_name_or_login(assignee)
-            print(f"[DEBUG] Risultato lookup utente '{assignee}': {user}")
-            if user:
-                custom_fields.append({
-                    "name": "Assignee",
-                    "$type": "SingleUserIssueCustomField",
-                    "value": { "login": user["login"] }
-                })
-            else:
-                print(f"[WARN] Utente '{assignee}' non trovato, issue creato senza assignee.")
 
-        if priority:
-            # Imposta il campo di Priorità con il nome fornito:contentReference[oaicite:20]{index=20}
-            custom_fields.append({
-                "name": "Priority",
-                "$type": "SingleEnumIssueCustomField",
-                "value": { "name": priority }
-            })
-        if custom_fields:
-            issue_data["customFields"] = custom_fields
-        # Chiamata API per creare l'issue
-        url = f"{self.base_url}/api/issues?fields=id,idReadable"
-        # DEBUG: stampiamo il payload che stiamo inviando
-        print("[DEBUG] Issue payload che sto per inviare a YouTrack:")
-        print(json.dumps(issue_data, indent=2, ensure_ascii=False))
-        resp = requests.post(url, headers=self.headers, json=issue_data)
-        resp.raise_for_status()
-        issue = resp.json()
-        issue_id_readable = issue.get("idReadable")
-        print(f"✅ Issue creato con ID {issue_id_readable}")
-        return issue_id_readable
-    
-    def update_issue(self, issue_id: str, fields: dict | None = None, custom_fields: list | None = None):
-        """
-        Aggiorna uno o più campi di un issue in modo generico.
+    def iter_issues(self, project: str):
+        """Tutti gli issue del progetto nel mirror (formato completo), dal più recente."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id_readable, project, summary, description, updated, custom_fields, links"
+                " FROM issues WHERE base_url = ? AND project = ? ORDER BY updated DESC",
+                (self.base_url, project.upper()),
+            ).fetchall()
+        for row in rows:
+            yield self._row_to_issue(row)
 
-        - fields: dizionario {nomeCampo: valore}, es:
-            {
-              "summary": "Nuovo titolo",
-              "description": "Testo aggiornato",
-              "assignee": "admin",
-              "Priority": "Major",
-              "State": "Submitted"
-            }
+    def index(self, project: str):
+        """Indice in memoria (LocalIssueIndex) del progetto, ricostruito solo se il mirror è cambiato."""
+        project = project.upper()
+        with self._lock:
+            cached = self._indexes.get(project)
+            if cached is not None and cached[0] == self._generation:
+                return cached[1]
+            generation = self._generation
+        index = LocalIssueIndex(self.iter_issues(project))
+        with self._lock:
+            self._indexes[project] = (generation, index)
+        return index
 
-          Regole:
-          - summary, description -> campi top-level dell'issue.
-          - 'assignee' (case-insensitive) -> custom field 'Assignee' con value {login: ...}.
-          - 'priority' (minuscolo) -> custom field 'Priority' con value {name: ...}.
-          - 'Priority', 'State', 'Type' (case-sensitive) -> trattati come enum: value {name: valore}.
-          - per tutti gli altri campi:
-              - se value è un dict -> usato come value così com'è
-              - altrimenti -> usato come value scalare (stringa, numero, ecc.)
+    def query(self, filters: dict) -> list | None:
+        """Risultati di 'filters' (che deve contenere il progetto) dall'indice locale, o None se non valutabile."""
+        project = next(v for k, v in filters.items() if k.lower() == "project")
+        return self.index(project).query(filters)
 
-        - custom_fields: lista di entry customFields già pronte, es:
-            [
-              { "name": "MyCustomEnum", "value": { "name": "Foo" } }
-            ]
-          che vengono aggiunte senza modifiche.
+    def get_epic_tree(self, epic_id: str, max_depth: int = 5) -> dict | None:
         """
-        update_data: dict = {}
-        cf_list: list = []
+        Stessa struttura di YouTrackClient.get_epic_tree, calcolata sui link del mirror.
+        None se qualche subtask non è nel mirror (es. in un progetto non sincronizzato):
+        l'albero sarebbe incompleto e il chiamante passa al server.
+        """
+        root = {"id": epic_id, "children": []}
+        nodes = {epic_id: root}
+        parent_of: dict = {}
+        cycles: list = []
 
-        fields = fields or {}
-        custom_fields = custom_fields or []
+        level = [epic_id]
+        depth = 0
+        while level and depth < max_depth:
+            depth += 1
+            next_level = []
+            for parent_id in level:
+                with self._lock:
+                    missing = self._conn.execute(
+                        "SELECT l.target FROM issue_links l"
+                        " LEFT JOIN issues i ON i.base_url = l.base_url AND i.id_readable = l.target"
+                        " WHERE l.base_url = ? AND l.source = ? AND l.link_type = 'subtask'"
+                        " AND l.direction = 'OUTWARD' AND i.id_readable IS NULL LIMIT 1",
+                        (self.base_url, parent_id),
+                    ).fetchone()
+                    if missing is not None:
+                        log.debug("Subtask %s di %s non nel mirror: albero dal server", missing[0], parent_id)
+                        return None
+                    rows = self._conn.execute(
+                        "SELECT i.id_readable, i.summary, i.custom_fields FROM issue_links l"
+                        " JOIN issues i ON i.base_url = l.base_url AND i.id_readable = l.source"
+                        " WHERE l.base_url = ? AND l.target = ? AND l.link_type = 'subtask'"
+                        " AND COALESCE(l.direction, '') != 'OUTWARD' ORDER BY i.updated DESC",
+                        (self.base_url, parent_id),
+                    ).fetchall()
+                for child_id, summary, custom_fields in rows:
+                    if child_id in nodes:
+                        ancestor = parent_id
+                        while ancestor is not None and ancestor != child_id:
+                            ancestor = parent_of.get(ancestor)
+                        if ancestor == child_id:
+                            cycles.append([parent_id, child_id])
+                        continue
+                    cf = json.loads(custom_fields or "{}")
+                    node = {"id": child_id, "summary": summary, "type": cf.get("Type"),
+                            "priority": cf.get("Priority"), "children": []}
+                    nodes[child_id] = node
+                    parent_of[child_id] = parent_id
+                    nodes[parent_id]["children"].append(node)
+                    next_level.append(child_id)
+            level = next_level
 
-        # Campi top-level
-        if "summary" in fields:
-            update_data["summary"] = fields.pop("summary")
-        if "description" in fields:
-            update_data["description"] = fields.pop("description")
+        # Al limite di profondità la visita è troncata solo se l'ultimo livello ha figli
+        with self._lock:
+            truncated = any(
+                self._conn.execute(
+                    "SELECT 1 FROM issue_links WHERE base_url = ? AND link_type = 'subtask' AND"
+                    " ((target = ? AND COALESCE(direction, '') != 'OUTWARD')"
+                    " OR (source = ? AND direction = 'OUTWARD')) LIMIT 1",
+                    (self.base_url, parent_id, parent_id),
+                ).fetchone()
+                for parent_id in level
+            )
 
-        # Altri campi
-        for field_name, value in fields.items():
-            lname = field_name.lower()
+        root["cycles"] = cycles
+        root["truncated"] = truncated
+        root["requests"] = 0
+        return root
 
-            if lname == "assignee":
-                user = self._find_user_by_name_or_login(value)
-                if not user:
-                    print(f"[WARN] Utente '{value}' non trovato, campo Assignee ignorato.")
-                    continue
-                cf_list.append({
-                    "name": "Assignee",
-                    "$type": "SingleUserIssueCustomField",
-                    "value": { "login": user["login"] }
-                })
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
-            elif lname == "priority":
-                # sintassi compatibile con enum standard
-                cf_list.append({
-                    "name": "Priority",
-                    "$type": "SingleEnumIssueCustomField",
-                    "value": { "name": value }
-                })
 
-            elif field_name in ("Priority", "State", "Type"):
-                # altri enum tipici: usiamo {name: valore}
-                cf_list.append({
-                    "name": field_name,
-                    "$type": "SingleEnumIssueCustomField",
-                    "value": { "name": value }
-                })
+class UserDirectory:
+    """
+    Rubrica in memoria degli utenti YouTrack, per risolvere gli assegnatari senza le
+    tre GET in sequenza di YouTrackClient._find_user_by_name_or_login.
 
-            else:
-                # caso generico:
-                # - se value è un dict, lo usiamo direttamente come value
-                # - se è scalare (stringa/numero), lo usiamo come value scalare
-                if isinstance(value, dict):
-                    cf_list.append({
-                        "name": field_name,
-                        "$type": "SimpleIssueCustomField",
-                        "value": value
-                    })
-                else:
-                    cf_list.append({
-                        "name": field_name,
-                        "value": value
-                    })
+    Gli utenti vengono scaricati una volta sola, a pagine da 'page_size', e indicizzati
+    per login, nome completo e token normalizzati (minuscoli, senza accenti; anche le
+    parti del login separate da '.', '_' o '-'). resolve() prova nell'ordine:
+      1. login esatto;
+      2. nome completo esatto;
+      3. prefissi dei token: ogni parola cercata deve essere l'inizio di un token
+         dell'utente ("mar ros" -> Mario Rossi); vince il candidato con più token
+         esatti, se è uno solo (altrimenti il nome è ambiguo e non viene risolto).
+    I nomi non trovati restano in una cache negativa fino al prossimo caricamento.
+    La rubrica viene ricaricata alla prima ricerca dopo 'max_age' secondi o dopo refresh().
+    """
 
-        # Aggiungi eventuali customFields raw passati da fuori
-        cf_list.extend(custom_fields)
+    FIELDS = "id,login,fullName,banned"
 
-        if cf_list:
-            update_data["customFields"] = cf_list
+    def __init__(self, client: YouTrackClient, page_size: int = 500,
+                 max_age: float = YT_USER_DIRECTORY_MAX_AGE):
+        self.client = client
+        self.page_size = page_size
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._failed_at = None
+        self._users: list[dict] = []
+        self._by_login: dict = {}
+        self._by_name: dict = {}
+        self._tokens: dict = {}
+        self._sorted_tokens: list[str] = []
+        self._misses: set = set()
+        self.counters = Counter()
 
-        if not update_data:
-            print("[WARN] Nessun campo da aggiornare.")
-            return None
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Minuscolo, senza accenti e con gli spazi compattati."""
+        text = unicodedata.normalize("NFKD", text or "")
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        return " ".join(text.lower().split())
 
-        print("[DEBUG] Payload update_issue che sto per inviare:")
-        print(json.dumps(update_data, indent=2, ensure_ascii=False))
+    @classmethod
+    def tokens(cls, text: str) -> list[str]:
+        return [t for t in re.split(r"[^0-9a-z]+", cls.normalize(text)) if t]
 
-        url = f"{self.base_url}/api/issues/{issue_id}?fields=id,idReadable"
-        resp = requests.post(url, headers=self.headers, json=update_data)
-        if not resp.ok:
-            print("[DEBUG] YouTrack ha risposto con errore in update_issue:")
-            print(f"Status: {resp.status_code}")
-            print(f"Body: {resp.text}")
+    def _fetch_all(self) -> list[dict]:
+        url = f"{self.client.base_url}/api/users"
+        users, skip = [], 0
+        while True:
+            params = {"fields": self.FIELDS, "$skip": skip, "$top": self.page_size}
+            resp = self.client.http.get(url, headers=self.client.headers, params=params)
             resp.raise_for_status()
+            page = resp.json()
+            users.extend(page)
+            if len(page) < self.page_size:
+                return users
+            skip += self.page_size
 
-        updated = resp.json()
-        issue_key = updated.get("idReadable", issue_id)
-        print(f"✅ Issue {issue_key} aggiornato.")
-        return issue_key
-    
-    def change_issue_assignee(self, issue_id: str, assignee: str):
-        """Modifica l'assegnatario di un issue esistente."""
-        return self.update_issue(issue_id, {"assignee": assignee})
-    
-    def delete_issue(self, issue_id: str):
-        """Elimina l'issue specificato (usa l'ID leggibile o quello interno)."""
-        url = f"{self.base_url}/api/issues/{issue_id}"
-        resp = requests.delete(url, headers=self.headers)
-        if resp.status_code == 404:
-            print(f"⚠️ Issue {issue_id} non trovato o già eliminato.")
-            return False
-        resp.raise_for_status()
-        print(f"✅ Issue {issue_id} eliminato con successo.")
-        return True
+    def load(self):
+        """Scarica tutti gli utenti e ricostruisce gli indici (svuota la cache negativa)."""
+        with TRACER.span("user_directory.load", kind="action") as span:
+            users = [u for u in self._fetch_all() if u.get("login") and not u.get("banned")]
+            by_login, by_name, tokens = {}, {}, {}
+            for index, user in enumerate(users):
+                by_login[user["login"].lower()] = index
+                if user.get("fullName"):
+                    by_name.setdefault(self.normalize(user["fullName"]), []).append(index)
+                for token in set(self.tokens(user.get("fullName")) + self.tokens(user["login"])):
+                    tokens.setdefault(token, set()).add(index)
+            span.set(users=len(users))
+        with self._lock:
+            self._users, self._by_login, self._by_name = users, by_login, by_name
+            self._tokens, self._sorted_tokens = tokens, sorted(tokens)
+            self._misses = set()
+            self._loaded_at = time.monotonic()
+            self._failed_at = None
+            self.counters["loads"] += 1
+        log.info("Rubrica utenti caricata: %d utenti", len(users))
+
+    def refresh(self):
+        """Forza il ricaricamento alla prossima ricerca."""
+        with self._lock:
+            self._loaded_at = None
 
-    def list_issues(self, filters: dict | None = None, limit: int = 20):
+    def available(self) -> bool:
         """
-        Restituisce la lista degli issue.
-        'filters' è un dizionario generico {campo: valore} che viene tradotto
-        direttamente nel linguaggio di query di YouTrack.
+        True se la rubrica è utilizzabile, caricandola (o ricaricandola) se serve.
+        Se il caricamento fallisce (es. token senza permesso di leggere gli utenti) ritorna
+        False e il client usa i lookup HTTP; si riprova dopo 'max_age' secondi.
         """
-        base_url = f"{self.base_url}/api/issues"
-        params = {
-            "fields": "id,idReadable,summary,project(shortName),customFields(name,value(name,login))",
-            "$top": limit,
-        }
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is not None and now - self._loaded_at <= self.max_age:
+                return True
+            if self._failed_at is not None and now - self._failed_at <= self.max_age:
+                return False
+            try:
+                self.load()
+            except requests.RequestException as e:
+                log.warning("Rubrica utenti non disponibile, uso i lookup diretti: %s", e)
+                self._failed_at = now
+                return self._loaded_at is not None
+            return True
 
-        # 👇 Alias "furbi" per i nomi campo usati spesso in linguaggio naturale o da GPT
-        alias_map = {
-            # se GPT (o noi) scriviamo "Parent for": X intendendo
-            # "dammi i subtask di X", lo mappiamo a "Subtask of"
-            "Parent for": "Subtask of",
-            "parent for": "Subtask of",
-            # altri alias comodi
-            "subtasks": "Subtask of",
-            "subtask": "Subtask of",
-        }
+    def _prefix_matches(self, prefix: str) -> set:
+        matches = set()
+        start = bisect_left(self._sorted_tokens, prefix)
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            matches |= self._tokens[token]
+        return matches
 
-        query_parts = []
-        if filters:
-            for field, value in filters.items():
-                # normalizza il campo se esiste un alias
-                norm_field = alias_map.get(field, field)
-                query_parts.append(f"{norm_field}: {value}")
-        if query_parts:
-            params["query"] = " ".join(query_parts)
+    def _match(self, name: str) -> dict | None:
+        index = self._by_login.get(name.strip().lower())
+        if index is not None:
+            return self._users[index]
+        exact = self._by_name.get(self.normalize(name)) or []
+        if len(exact) == 1:
+            return self._users[exact[0]]
 
-        print(f"[DEBUG] GET {base_url} params={params}")
-        resp = requests.get(base_url, headers=self.headers, params=params)
-        if not resp.ok:
-            print("[DEBUG] YouTrack ha risposto con errore in list_issues:")
-            print(f"Status: {resp.status_code}")
-            print(f"Body: {resp.text}")
-            resp.raise_for_status()
+        words = self.tokens(name)
+        if not words:
+            return None
+        candidates = None
+        for word in words:
+            matches = self._prefix_matches(word)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return None
+        # a parità di prefissi preferiamo chi ha più parole uguali per intero
+        scored = sorted(((sum(i in self._tokens.get(w, ()) for w in words), i) for i in candidates), reverse=True)
+        if len(scored) > 1 and scored[0][0] == scored[1][0]:
+            logins = ", ".join(sorted(self._users[i]["login"] for _, i in scored[:5]))
+            log.warning("Utente '%s' ambiguo (%s...): specificare il login", name, logins)
+            return None
+        return self._users[scored[0][1]]
 
-        issues = resp.json()
+    def resolve(self, name_or_login: str) -> dict | None:
+        """Utente {id, login} corrispondente a login o nome, oppure None."""
+        key = name_or_login.strip().lower()
+        with self._lock:
+            if key in self._misses:
+                self.counters["negative_hits"] += 1
+                TRACER.cache("user_directory", True)
+                return None
+            user = self._match(name_or_login)
+            if user is None:
+                self._misses.add(key)
+                self.counters["misses"] += 1
+            else:
+                self.counters["hits"] += 1
+        TRACER.cache("user_directory", user is not None)
+        return {"id": user["id"], "login": user["login"]} if user is not None else None
 
-        results = []
-        for issue in issues:
-            issue_key = issue.get("idReadable")
-            summary = issue.get("summary")
-            project_short = issue.get("project", {}).get("shortName")
-            results.append({
-                "id": issue_key,
-                "summary": summary,
-                "project": project_short,
-            })
+    def stats(self) -> dict:
+        with self._lock:
+            return {"users": len(self._users), **self.counters}
 
-        return results
 
-    def _get_issue_db_id(self, issue_id_readable: str) -> str:
-        """Restituisce l'ID di database di un issue dato l'ID leggibile (es. SUP-3)."""
-        url = f"{self.base_url}/api/issues/{issue_id_readable}?fields=id"
-        resp = requests.get(url, headers=self.headers)
-        resp.raise_for_status()
-        data = resp.json()
-        return data["id"]
+class McpError(RuntimeError):
+    """Errore restituito dal server MCP (errore JSON-RPC o risposta non valida)."""
 
-    def _get_link_type_id(self, link_name: str) -> str | None:
-        """
-        Trova l'ID del tipo di link a partire da un nome 'umano':
-        - prova a confrontare con name, sourceToTarget, targetToSource, localized*
-        - gestisce un paio di sinonimi per Subtask.
-        """
-        if not hasattr(self, "_link_type_cache"):
-            self._link_type_cache = {}
 
-        key = link_name.strip().lower()
-        if key in self._link_type_cache:
-            return self._link_type_cache[key]
+class McpSession:
+    """
+    Client MCP minimale (JSON-RPC 2.0 su streamable HTTP) per l'endpoint /mcp di YouTrack.
 
-        # normalizzazione minima per i subtasks
-        if key in ("subtask", "subtask of", "parent for", "epic-child"):
-            normalized = "subtask"
-        else:
-            normalized = key
+    Mantiene una sola sessione (header Mcp-Session-Id) sul pool HTTP condiviso,
+    la riapre automaticamente se il server la dichiara scaduta (404) e mette in
+    cache il risultato di tools/list per tutta la durata della sessione.
+    Le risposte possono arrivare come JSON semplice o come stream SSE.
+    """
 
-        url = f"{self.base_url}/api/issueLinkTypes"
-        params = {
-            "fields": "id,name,sourceToTarget,targetToSource,localizedSourceToTarget,localizedTargetToSource"
-        }
-        resp = requests.get(url, headers=self.headers, params=params)
-        if not resp.ok:
-            print(f"[DEBUG] Errore nella lettura dei link types: {resp.status_code} {resp.text}")
-            resp.raise_for_status()
-        types = resp.json()
-
-        found_id = None
-        for t in types:
-            candidates = [
-                t.get("name"),
-                t.get("sourceToTarget"),
-                t.get("targetToSource"),
-                t.get("localizedSourceToTarget"),
-                t.get("localizedTargetToSource"),
-            ]
-            candidates = [c.lower() for c in candidates if c]
-            if normalized in candidates:
-                found_id = t["id"]
-                break
+    PROTOCOL_VERSION = "2025-03-26"
 
-            # fallback per 'subtask' → tipo 'Subtask'
-            if normalized == "subtask" and t.get("name", "").lower() == "subtask":
-                found_id = t["id"]
-                break
+    def __init__(self, url: str, token: str, transport: HttpTransport | None = None,
+                 allowed_tools: list | None = None):
+        self.url = url
+        self.token = token
+        self.http = transport or HttpTransport()
+        # Se indicato, solo questi strumenti vengono esposti al modello
+        self.allowed_tools = set(allowed_tools) if allowed_tools else None
+        self.session_id = None
+        self.server_info = {}
+        self._tools = None
+        self._next_id = 0
+        self._lock = threading.Lock()
 
-        if not found_id:
-            print(f"[WARN] Tipo di link '{link_name}' non trovato. Nessun link creato.")
-            return None
+    def _headers(self) -> dict:
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json, text/event-stream",
+        }
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+            headers["MCP-Protocol-Version"] = self.PROTOCOL_VERSION
+        return headers
 
-        self._link_type_cache[key] = found_id
-        return found_id
+    def _new_id(self) -> int:
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
 
-    def link_issues(self, from_issue: str, to_issue: str, link_type_name: str = "relates") -> bool:
-        """
-        Crea un link tra due issue.
-        - from_issue: ID leggibile dell'issue sorgente (es. SUP-10)
-        - to_issue:   ID leggibile dell'issue target (es. SUP-8)
-        - link_type_name: nome del link (es. 'relates', 'depends on', 'subtask', 'parent for')
-        """
-        link_type_id = self._get_link_type_id(link_type_name)
-        if not link_type_id:
-            return False
+    @staticmethod
+    def _read_message(resp: requests.Response, request_id: int) -> dict:
+        """Estrae dalla risposta HTTP il messaggio JSON-RPC con l'id della richiesta."""
+        content_type = resp.headers.get("Content-Type", "")
+        if "text/event-stream" not in content_type:
+            return resp.json()
 
-        # YouTrack vuole l'ID DB dell'issue target
-        target_db_id = self._get_issue_db_id(to_issue)
+        # Stream SSE: ogni evento ha una o più righe 'data:'; il server può inviare
+        # notifiche prima della risposta, quindi cerchiamo quella con il nostro id
+        data_lines = []
+        # SSE è sempre UTF-8: senza charset requests userebbe ISO-8859-1 e rovinerebbe gli accenti
+        resp.encoding = "utf-8"
+        for line in resp.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line.startswith("data:"):
+                data_lines.append(line[5:].lstrip())
+                continue
+            if line or not data_lines:
+                continue
+            message = json.loads("\n".join(data_lines))
+            data_lines = []
+            if message.get("id") == request_id:
+                return message
+        if data_lines:
+            message = json.loads("\n".join(data_lines))
+            if message.get("id") == request_id:
+                return message
+        raise McpError(f"Nessuna risposta dal server MCP per la richiesta {request_id}")
 
-        url = f"{self.base_url}/api/issues/{from_issue}/links/{link_type_id}/issues"
-        payload = { "id": target_db_id }
+    def _post(self, payload: dict, idempotent: bool) -> requests.Response:
+        return self.http.post(self.url, headers=self._headers(), json=payload,
+                              idempotent=idempotent, stream=True)
 
-        print(f"[DEBUG] POST {url} body={payload}")
-        resp = requests.post(url, headers=self.headers, json=payload)
-        if not resp.ok:
-            print("[DEBUG] Errore nella creazione del link:")
-            print(f"Status: {resp.status_code}")
-            print(f"Body: {resp.text}")
+    def initialize(self):
+        """Apre la sessione MCP (initialize + notifications/initialized)."""
+        self.session_id = None
+        request_id = self._new_id()
+        resp = self._post({
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": "initialize",
+            "params": {
+                "protocolVersion": self.PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": "youtrack-llm", "version": "1.0"},
+            },
+        }, idempotent=True)
+        try:
             resp.raise_for_status()
+            self.session_id = resp.headers.get("Mcp-Session-Id")
+            message = self._read_message(resp, request_id)
+        finally:
+            resp.close()
+        if "error" in message:
+            raise McpError(f"initialize fallita: {message['error']}")
+        self.server_info = message.get("result", {}).get("serverInfo", {})
 
-        print(f"✅ Link '{link_type_name}' creato tra {from_issue} -> {to_issue}")
-        return True
+        resp = self._post({"jsonrpc": "2.0", "method": "notifications/initialized"}, idempotent=True)
+        resp.close()
 
-    def create_epic(self, project: str, summary: str,
-                    description: str = "", assignee: str = "", priority: str = "") -> str:
-        """
-        Crea un issue e lo imposta come Epic (Type = Epic).
-        Restituisce l'ID leggibile dell'Epic (es. SUP-10).
-        """
-        epic_id = self.create_issue(project, summary, description, assignee, priority)
-        # Imposta Type = Epic
-        self.update_issue(epic_id, fields={"Type": "Epic"})
-        return epic_id
+    def request(self, method: str, params: dict | None = None, idempotent: bool = False):
+        """Invia una richiesta JSON-RPC nella sessione corrente e ne ritorna il 'result'."""
+        if self.session_id is None:
+            self.initialize()
 
-    def create_epic_with_children(self, project: str,
-                                  epic_fields: dict,
-                                  children: list[dict],
-                                  child_link_type: str = "subtask") -> dict:
+        for attempt in range(2):
+            request_id = self._new_id()
+            payload = {"jsonrpc": "2.0", "id": request_id, "method": method}
+            if params is not None:
+                payload["params"] = params
+            resp = self._post(payload, idempotent)
+            try:
+                # 404 con sessione attiva = sessione scaduta sul server: la riapriamo una volta
+                if resp.status_code == 404 and self.session_id and attempt == 0:
+                    self.initialize()
+                    continue
+                resp.raise_for_status()
+                message = self._read_message(resp, request_id)
+            finally:
+                resp.close()
+            if "error" in message:
+                error = message["error"]
+                raise McpError(f"{method}: {error.get('message', error)}")
+            return message.get("result", {})
+
+    def list_tools(self, refresh: bool = False) -> list:
+        """Ritorna gli strumenti del server (tools/list, con paginazione), in cache per la sessione."""
+        if self._tools is not None and not refresh:
+            return self._tools
+
+        tools = []
+        cursor = None
+        while True:
+            result = self.request("tools/list", {"cursor": cursor} if cursor else {}, idempotent=True)
+            tools.extend(result.get("tools", []))
+            cursor = result.get("nextCursor")
+            if not cursor:
+                break
+
+        if self.allowed_tools is not None:
+            tools = [t for t in tools if t.get("name") in self.allowed_tools]
+        self._tools = tools
+        return tools
+
+    def call_tool(self, name: str, arguments: dict | None = None) -> tuple[str, bool]:
         """
-        Crea un Epic e una serie di task figli, collegandoli come subtasks (o altro link type).
-        epic_fields: dict con almeno 'summary', opzionali description/assignee/priority.
-        children: lista di dict, ognuno con almeno 'summary', opzionali description/assignee/priority.
-        Ritorna un dict con gli ID:
-           { "epic": "SUP-10", "children": ["SUP-11", "SUP-12", ...] }
+        Esegue tools/call e ritorna (testo, is_error): il testo concatena i blocchi
+        di contenuto testuali, o il contenuto strutturato se non ce ne sono.
         """
-        epic_summary = epic_fields.get("summary") or epic_fields.get("title")
-        if not epic_summary:
-            raise ValueError("Per create_epic_with_children è necessario almeno epic.summary")
+        result = self.request("tools/call", {"name": name, "arguments": arguments or {}})
+        texts = [c.get("text", "") for c in result.get("content", []) if c.get("type") == "text"]
+        if texts:
+            text = "\n".join(texts)
+        else:
+            text = json.dumps(result.get("structuredContent", result.get("content", [])), ensure_ascii=False)
+        return text, bool(result.get("isError"))
 
-        epic_desc = epic_fields.get("description", "")
-        epic_assignee = epic_fields.get("assignee", "")
-        epic_priority = epic_fields.get("priority", "")
+    def close(self):
+        """Chiude la sessione sul server (DELETE), se aperta."""
+        if self.session_id:
+            try:
+                self.http.delete(self.url, headers=self._headers())
+            except requests.RequestException:
+                pass
+            self.session_id = None
 
-        epic_id = self.create_epic(project, epic_summary, epic_desc, epic_assignee, epic_priority)
 
-        child_ids: list[str] = []
-        for child in children:
-            c_summary = child.get("summary") or child.get("title")
-            if not c_summary:
-                print("[WARN] Child senza summary, saltato.")
-                continue
-            c_desc = child.get("description", "")
-            c_assignee = child.get("assignee", "")
-            c_priority = child.get("priority", "")
+def _mcp_print_blocking(response):
+    """Stampa la risposta completa (non in streaming) di una chiamata Responses API."""
+    # La libreria Python espone direttamente response.output_text
+    # che concatena il testo finale dell'assistente.
+    try:
+        output_text = getattr(response, "output_text", None)
+    except Exception:
+        output_text = None
 
-            child_id = self.create_issue(project, c_summary, c_desc, c_assignee, c_priority)
-            child_ids.append(child_id)
+    if output_text:
+        print()
+        print(output_text)
+        print()
+    else:
+        # Fallback: stampiamo il raw response (utile per debug)
+        log.warning("Nessun output_text, risposta grezza: %s", response)
 
-            # Link epic -> child come subtask (o altro tipo)
-            self.link_issues(child_id, epic_id, child_link_type)
 
-        print(f"✅ Epic {epic_id} creato con figli {child_ids}")
-        return {"epic": epic_id, "children": child_ids}
+def _mcp_report_usage(response):
+    """Stampa i token di input (e quanti arrivano dalla cache del prompt) di un turno MCP."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    print(f"   📊 token input: {usage.input_tokens} (in cache: {cached}), output: {usage.output_tokens}")
 
-    def get_children_of_epic(self, epic_id: str):
-        """
-        Restituisce tutti i subtasks dell'Epic in formato leggibile.
-        """
-        url = f"{self.base_url}/api/issues"
-        params = {
-            # ci bastano id, summary, Type e Priority
-            "fields": "id,idReadable,summary,customFields(name,value(name))",
-            # cerchiamo TUTTI gli issue che sono 'subtask of' l'Epic
-            "query": f"subtask of: {epic_id}"
-        }
-        print(f"[DEBUG] GET {url} params={params}")
-        resp = requests.get(url, headers=self.headers, params=params)
-        if not resp.ok:
-            print(f"[DEBUG] Errore nella ricerca subtasks: {resp.status_code} {resp.text}")
-            resp.raise_for_status()
 
-        issues = []
-        for item in resp.json():
-            summary = item.get("summary", "")
-            id_readable = item.get("idReadable", "")
-            custom_fields = item.get("customFields", [])
-            cf = {}
-            for f in custom_fields:
-                name = f.get("name")
-                val = f.get("value")
-                if isinstance(val, dict):
-                    cf[name] = val.get("name")
-            issues.append({
-                "id": id_readable,
-                "summary": summary,
-                "type": cf.get("Type"),
-                "priority": cf.get("Priority")
-            })
+def _mcp_stream_turn(client, request: dict):
+    """
+    Esegue un turno MCP in streaming: i delta di testo vengono stampati appena
+    arrivano e le chiamate agli strumenti MCP sono mostrate all'inizio e alla
+    fine, con la durata.
+
+    Ritorna (ok, response): ok è False se lo stream fallisce prima di aver
+    stampato qualcosa (il chiamante può ripiegare sulla chiamata non in
+    streaming); response è la risposta finale, se lo stream l'ha inviata.
+    Gli errori a metà risposta vengono propagati, per non ristampare output
+    già mostrato.
+    """
+    started = time.monotonic()
+    response = None
+    tool_names = {}   # item_id -> nome dello strumento
+    tool_started = {}  # item_id -> istante di inizio
+    printed = False
+    text_seen = False
+    text_open = False  # True se l'ultima riga stampata è testo senza newline finale
+
+    def status(line: str):
+        nonlocal printed, text_open
+        if text_open:
+            print()
+            text_open = False
+        print(line, flush=True)
+        printed = True
 
-        return issues
+    try:
+        stream = client.responses.create(stream=True, **request)
+    except Exception as e:
+        print(f"⚠️ Streaming non disponibile ({e}), uso la risposta completa.")
+        return False, None
 
-def run_mcp_cli(base_url: str, yt_token: str):
+    try:
+        for event in stream:
+            etype = getattr(event, "type", "")
+            if etype == "response.output_text.delta":
+                if not text_seen:
+                    status(f"   ⏱️ primo token dopo {time.monotonic() - started:.2f}s\n")
+                sys.stdout.write(event.delta)
+                sys.stdout.flush()
+                printed = text_seen = text_open = True
+            elif etype == "response.output_item.added":
+                item = event.item
+                if getattr(item, "type", "") == "mcp_call":
+                    tool_names[item.id] = item.name
+                    tool_started[item.id] = time.monotonic()
+                    status(f"   🔧 {item.name} ...")
+            elif etype in ("response.mcp_call.completed", "response.mcp_call.failed"):
+                name = tool_names.get(event.item_id, event.item_id)
+                elapsed = time.monotonic() - tool_started.get(event.item_id, started)
+                icon = "✅" if etype.endswith("completed") else "❌"
+                status(f"   {icon} {name} ({elapsed:.2f}s)")
+            elif etype == "response.mcp_list_tools.in_progress":
+                tool_started["__list_tools__"] = time.monotonic()
+            elif etype == "response.mcp_list_tools.completed":
+                elapsed = time.monotonic() - tool_started.get("__list_tools__", started)
+                status(f"   📋 strumenti MCP importati ({elapsed:.2f}s)")
+            elif etype == "response.completed":
+                response = event.response
+            elif etype in ("response.failed", "error"):
+                error = getattr(getattr(event, "response", None), "error", None) or getattr(event, "message", "")
+                status(f"❌ Errore durante la chiamata MCP: {error}")
+    except Exception:
+        if not printed:
+            print("⚠️ Streaming interrotto prima dell'output, uso la risposta completa.")
+            return False, None
+        raise
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+    if text_open:
+        print()
+    print(f"\n   ⏱️ completato in {time.monotonic() - started:.2f}s")
+    return True, response
+
+
+def run_mcp_cli(base_url: str, yt_token: str, stream: bool = True,
+                allowed_tools: list | None = None, model: str = YT_MCP_MODEL):
     """
     Modalità alternativa: usa la OpenAI Responses API + MCP server di YouTrack,
     invece del parser GPT custom + REST API manuali.
 
+    Con stream=True la risposta viene mostrata man mano che arriva (testo e
+    chiamate agli strumenti MCP); se lo streaming non è disponibile si ripiega
+    sulla risposta completa per il resto della sessione.
+
+    I turni sono concatenati con previous_response_id: il modello mantiene il
+    contesto e la lista di strumenti importata al primo turno resta nella
+    conversazione, quindi il server MCP non viene reinterrogato ad ogni turno.
+    'allowed_tools' limita gli strumenti esposti al modello (None = tutti).
+
     Richiede:
       - OPENAI_API_KEY (già usato dallo script)
       - YT_BASE_URL (passato come base_url)
@@ -691,15 +3784,32 @@ def run_mcp_cli(base_url: str, yt_token: str):
 
     client = OpenAI(api_key=OPENAI_API_KEY)
 
-    # Costruiamo l'URL dell'MCP server di YouTrack con qualche filtro di tool
-    # (puoi modificarlo in base a quello che ti serve).
+    # Costruiamo l'URL dell'MCP server di YouTrack con l'eventuale filtro di tool:
+    # il server elenca solo gli strumenti richiesti, così anche l'import della
+    # lista (e i token che occupa nel contesto) si riduce
     mcp_url = f"{base_url}/mcp"
-    # Esempio: limitiamo gli strumenti disponibili e abilitiamo gli output schema
-    # mcp_url += "?tools=search_issues,get_issue,create_issue,update_issue,add_issue_comment,link_issues&enableToolOutputSchema=true"
+    mcp_tool = {
+        "type": "mcp",
+        "server_label": "youtrack",
+        "server_url": mcp_url,
+        "require_approval": "never",
+        # Header di autenticazione richiesto dal server MCP di YouTrack
+        "headers": {
+            "Authorization": f"Bearer {yt_token}"
+        },
+    }
+    if allowed_tools:
+        mcp_tool["server_url"] = f"{mcp_url}?tools={','.join(allowed_tools)}"
+        mcp_tool["allowed_tools"] = list(allowed_tools)
 
     print("💡 MCP mode attiva.")
     print("   Ora il modello userà direttamente gli strumenti MCP di YouTrack.")
-    print("   Scrivi una richiesta in linguaggio naturale (o 'exit' per uscire).")
+    if allowed_tools:
+        print(f"   Strumenti abilitati: {', '.join(allowed_tools)}")
+    print("   Scrivi una richiesta in linguaggio naturale ('reset' per una nuova conversazione, 'exit' per uscire).")
+
+    # ID dell'ultima risposta: il turno successivo riparte da lì
+    previous_response_id = None
 
     while True:
         try:
@@ -713,45 +3823,609 @@ def run_mcp_cli(base_url: str, yt_token: str):
         if user_input.lower() in ("exit", "quit", "esci"):
             print("👋 Uscita dalla MCP mode.")
             break
+        if user_input.lower() in ("reset", "nuova"):
+            previous_response_id = None
+            print("🔄 Nuova conversazione.")
+            continue
+
+        # Chiamata alla Responses API con tool MCP
+        request = {
+            "model": model,
+            "input": user_input,
+            "tools": [mcp_tool],
+            "max_output_tokens": 800,
+            # Le conversazioni lunghe vengono troncate dal server invece di fallire
+            "truncation": "auto",
+        }
+        if previous_response_id:
+            request["previous_response_id"] = previous_response_id
 
         try:
-            # Chiamata alla Responses API con tool MCP
-            response = client.responses.create(
-                model="gpt-4.1",  # o "gpt-4.1-mini" se vuoi risparmiare
-                input=user_input,
-                tools=[
-                    {
-                        "type": "mcp",
-                        "server_label": "youtrack",
-                        "server_url": mcp_url,
-                        "require_approval": "never",
-                        # Header di autenticazione richiesto dal server MCP di YouTrack
-                        "headers": {
-                            "Authorization": f"Bearer {yt_token}"
-                        },
-                    }
-                ],
-                max_output_tokens=800,
-            )
+            response = None
+            streamed = False
+            if stream:
+                streamed, response = _mcp_stream_turn(client, request)
+                if not streamed:
+                    # Streaming non disponibile: non riproviamo ad ogni turno
+                    stream = False
+            if not streamed:
+                response = client.responses.create(**request)
+                _mcp_print_blocking(response)
+
+            if response is not None:
+                previous_response_id = response.id
+                _mcp_report_usage(response)
+            print()
+
+        except Exception as e:
+            print(f"\n❌ Errore durante la chiamata MCP: {e}")
+            if previous_response_id:
+                # La risposta precedente potrebbe non essere più valida (scaduta,
+                # non memorizzata): il prossimo turno riparte da zero
+                previous_response_id = None
+                print("   La conversazione è stata azzerata.")
+
+MCP_LOCAL_SYSTEM_PROMPT = (
+    "Sei un assistente per YouTrack. Usa gli strumenti disponibili per leggere e modificare "
+    "issue e progetti; quando servono più strumenti indipendenti chiamali insieme nello stesso turno. "
+    "Rispondi in modo conciso nella lingua dell'utente."
+)
+
+
+def _mcp_tool_functions(tools: list) -> list:
+    """Converte gli strumenti MCP (tools/list) nel formato 'tools' di chat/completions."""
+    functions = []
+    for tool in tools:
+        functions.append({
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "description": tool.get("description", "")[:1024],
+                "parameters": tool.get("inputSchema") or {"type": "object", "properties": {}},
+            },
+        })
+    return functions
+
+
+def _mcp_run_tool_calls(session: McpSession, tool_calls: list, max_workers: int) -> list:
+    """
+    Esegue in parallelo le chiamate a strumenti emesse dal modello in un turno e
+    ritorna i messaggi 'tool' da aggiungere alla conversazione, nello stesso ordine.
+    """
+    def run(call):
+        name = call["function"]["name"]
+        started = time.monotonic()
+        try:
+            arguments = json.loads(call["function"].get("arguments") or "{}")
+            text, is_error = session.call_tool(name, arguments)
+        except (ValueError, McpError, requests.RequestException) as e:
+            text, is_error = f"Errore: {e}", True
+        icon = "❌" if is_error else "✅"
+        print(f"   {icon} {name} ({time.monotonic() - started:.2f}s)", flush=True)
+        return {"role": "tool", "tool_call_id": call["id"], "content": text}
+
+    for call in tool_calls:
+        print(f"   🔧 {call['function']['name']} ...", flush=True)
+    if len(tool_calls) == 1:
+        return [run(tool_calls[0])]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tool_calls)))) as pool:
+        return list(pool.map(TRACER.bind(run), tool_calls))
+
+
+def run_mcp_local_cli(base_url: str, yt_token: str, parser: GPTParser,
+                      transport: HttpTransport | None = None, allowed_tools: list | None = None,
+                      max_workers: int = YT_MAX_WORKERS, max_rounds: int = 8,
+                      model: str = YT_MCP_MODEL):
+    """
+    Modalità MCP con client locale: lo script apre direttamente una sessione MCP
+    verso <base_url>/mcp, passa gli strumenti al modello come function calling
+    di chat/completions ed esegue in locale (in parallelo, se più di una) le
+    chiamate che il modello richiede. Le chiamate agli strumenti non passano
+    dal connettore ospitato da OpenAI e l'endpoint può essere anche un server
+    MCP locale.
+
+    La conversazione resta in memoria tra un turno e l'altro ('reset' la azzera).
+    """
+    if not base_url or not yt_token:
+        print("⚠️ Per MCP servono YT_BASE_URL e YT_TOKEN (o --yt-url / --yt-token).")
+        return
+
+    session = McpSession(f"{base_url}/mcp", yt_token, transport=transport, allowed_tools=allowed_tools)
+    try:
+        started = time.monotonic()
+        tools = session.list_tools()
+    except (McpError, requests.RequestException) as e:
+        print(f"❌ Impossibile collegarsi al server MCP: {e}")
+        return
+    functions = _mcp_tool_functions(tools)
+
+    server = session.server_info.get("name", "YouTrack")
+    print(f"💡 MCP mode (client locale) attiva: {server}, {len(tools)} strumenti "
+          f"({time.monotonic() - started:.2f}s).")
+    print("   Scrivi una richiesta in linguaggio naturale ('reset' per una nuova conversazione, 'exit' per uscire).")
+
+    messages = [{"role": "system", "content": MCP_LOCAL_SYSTEM_PROMPT}]
+
+    try:
+        while True:
+            try:
+                user_input = input("MCP> ")
+            except (EOFError, KeyboardInterrupt):
+                print("\n👋 Uscita dalla MCP mode.")
+                break
+
+            if not user_input:
+                continue
+            if user_input.lower() in ("exit", "quit", "esci"):
+                print("👋 Uscita dalla MCP mode.")
+                break
+            if user_input.lower() in ("reset", "nuova"):
+                messages = messages[:1]
+                print("🔄 Nuova conversazione.")
+                continue
+
+            turn_start = len(messages)
+            messages.append({"role": "user", "content": user_input})
+            started = time.monotonic()
+            try:
+                for _ in range(max_rounds):
+                    data = {"model": model, "messages": messages, "max_tokens": 800}
+                    if functions:
+                        data["tools"] = functions
+                    message = parser.chat_completion(data)["choices"][0]["message"]
+                    # Il messaggio dell'assistente (con eventuali tool_calls) resta nella storia
+                    messages.append({k: v for k, v in message.items() if v is not None})
+
+                    tool_calls = message.get("tool_calls") or []
+                    if not tool_calls:
+                        print()
+                        print(message.get("content") or "")
+                        break
+                    messages.extend(_mcp_run_tool_calls(session, tool_calls, max_workers))
+                else:
+                    print(f"⚠️ Interrotto dopo {max_rounds} giri di chiamate a strumenti.")
+                print(f"\n   ⏱️ completato in {time.monotonic() - started:.2f}s\n")
+            except (requests.RequestException, KeyError, IndexError) as e:
+                # Il turno fallito non deve lasciare nella storia tool_calls senza risposta
+                del messages[turn_start:]
+                print(f"\n❌ Errore durante la chiamata MCP: {e}")
+    finally:
+        session.close()
+
+
+class ActionError(ValueError):
+    """Azione non eseguibile per parametri mancanti o non validi (il messaggio è già per l'utente)."""
+
+
+def execute_action(yt: YouTrackClient, parser: GPTParser, action_data: dict,
+                   max_workers: int | None = None):
+    """
+    Esegue l'azione descritta da 'action_data' (il JSON prodotto dal parser) e ne
+    restituisce il risultato: l'ID creato/aggiornato, la lista di ID per list_issues,
+    il dict di create_epic_with_children, ecc.
+    Solleva ActionError se mancano parametri obbligatori o l'azione è sconosciuta.
+    """
+    with TRACER.span(str(action_data.get("action")), kind="action"):
+        return _dispatch_action(yt, parser, action_data, max_workers)
+
+
+def _dispatch_action(yt: YouTrackClient, parser: GPTParser, action_data: dict,
+                     max_workers: int | None):
+    action = action_data.get("action")
+    if action == "create_project":
+        name = action_data.get("name") or action_data.get("project_name")
+        key = action_data.get("key") or action_data.get("project_key")
+        description = action_data.get("description", "")
+        if not name or not key:
+            raise ActionError("Il comando non specifica nome e chiave del progetto.")
+        return yt.create_project(name, key, description)
+
+    elif action == "create_issue":
+        fields = action_data.get("fields") or {}
+        # project può stare top-level oppure dentro fields
+        project = (
+            action_data.get("project")
+            or action_data.get("project_key")
+            or fields.get("project")
+        )
+        summary = (
+            action_data.get("summary")
+            or fields.get("summary")
+            or action_data.get("title")
+            or "Nuovo Issue"
+        )
+        description = (
+            action_data.get("description")
+            or fields.get("description")
+            or ""
+        )
+        assignee = (
+            action_data.get("assignee")
+            or fields.get("assignee")
+            or ""
+        )
+        priority = (
+            action_data.get("priority")
+            or fields.get("Priority")  # GPT spesso usa 'Priority' maiuscolo
+            or fields.get("priority")
+            or ""
+        )
+        if not project:
+            raise ActionError("Il comando non specifica il progetto per create_issue.")
+        return yt.create_issue(project, summary, description, assignee, priority)
+
+    elif action == "create_epic":
+        fields = action_data.get("fields") or {}
+        project = (
+            action_data.get("project")
+            or action_data.get("project_key")
+            or fields.get("project")
+        )
+        summary = (
+            action_data.get("summary")
+            or fields.get("summary")
+            or action_data.get("title")
+        )
+        description = (
+            action_data.get("description")
+            or fields.get("description")
+            or ""
+        )
+        assignee = (
+            action_data.get("assignee")
+            or fields.get("assignee")
+            or ""
+        )
+        priority = (
+            action_data.get("priority")
+            or fields.get("Priority")
+            or fields.get("priority")
+            or ""
+        )
+        if not project or not summary:
+            raise ActionError("Per create_epic servono almeno project e summary.")
+        return yt.create_epic(project, summary, description, assignee, priority)
+
+    elif action == "create_epic_with_children":
+        project = action_data.get("project") or action_data.get("project_key")
+        epic = action_data.get("epic") or {}
+        children = action_data.get("children") or []
+        link_type = action_data.get("link_type") or "subtask"
+
+        if not project:
+            raise ActionError("Per create_epic_with_children serve il project.")
+        if not epic:
+            raise ActionError("Per create_epic_with_children serve l'oggetto 'epic'.")
+        return yt.create_epic_with_children(project, epic, children, child_link_type=link_type,
+                                            max_workers=max_workers)
+
+    elif action == "update_issue":
+        issue = action_data.get("issue") or action_data.get("issue_id")
+        fields = action_data.get("fields") or {}
+        custom_fields = action_data.get("customFields") or []
+
+        if not issue:
+            raise ActionError("Il comando non specifica l'issue da aggiornare.")
+        if not fields and not custom_fields:
+            raise ActionError("Nessun campo da aggiornare per update_issue.")
+        return yt.update_issue(issue, fields=fields, custom_fields=custom_fields)
+
+    elif action == "bulk_update":
+        filters = action_data.get("filters") or {}
+        fields = action_data.get("fields") or {}
+        if not filters:
+            # senza filtri il comando verrebbe applicato a tutti gli issue dell'istanza
+            raise ActionError("bulk_update richiede almeno un filtro (es. il progetto).")
+        if not fields:
+            raise ActionError("Nessun campo da aggiornare per bulk_update.")
+        dry_run = bool(action_data.get("dry_run"))
+        try:
+            result = yt.bulk_update(filters, fields, dry_run=dry_run, max_workers=max_workers)
+        except ValueError as e:
+            raise ActionError(str(e)) from e
+        if dry_run:
+            print(f"🔍 Simulazione: '{result['command']}' verrebbe applicato a {result['matched']} issue.")
+            if result["issues"]:
+                more = " ..." if result["matched"] > 10 else ""
+                print(f"   {', '.join(result['issues'][:10])}{more}")
+        elif not result["matched"]:
+            print("📋 Nessun issue corrisponde ai filtri: niente da aggiornare.")
+        else:
+            print(f"✅ '{result['command']}' applicato a {result['updated']}/{result['matched']} issue.")
+            if result["failures"]:
+                print(f"⚠️ {len(result['failures'])} blocchi non aggiornati.")
+        return result
+
+    elif action == "change_issue_assignee":
+        issue = action_data.get("issue") or action_data.get("issue_id")
+        assignee = action_data.get("assignee") or action_data.get("new_assignee")
+        if not issue or not assignee:
+            raise ActionError("Specificare sia l'issue che il nuovo assegnatario.")
+        return yt.change_issue_assignee(issue, assignee)
+
+    elif action == "delete_issue":
+        issue = action_data.get("issue") or action_data.get("issue_id")
+        if not issue:
+            raise ActionError("Specificare l'ID dell'issue da eliminare.")
+        return yt.delete_issue(issue)
+
+    elif action == "list_issues":
+        filters = action_data.get("filters") or {}
+        limit = action_data.get("limit", 20)
+        if isinstance(limit, str) and limit.strip().lower() != "all":
+            # lo schema ammette anche stringhe come "10"
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise ActionError(f"Limite non valido: {limit!r} (un numero o \"all\").") from None
+        if limit in (None, "all", 0):
+            # Nessun limite: scorriamo tutte le pagine in streaming
+            issues = yt.iter_issues(filters=filters)
+        else:
+            issues = yt.list_issues(filters=filters, limit=limit)
+        print("📋 Lista issue:")
+        # teniamo solo gli ID: in streaming la lista completa non resta in memoria
+        issue_ids = []
+        for i in issues:
+            issue_ids.append(i.id)
+            print(f" - {i.id} [{i.project}] {i.summary}")
+        if not issue_ids:
+            print("   (nessun issue trovato)")
+        return issue_ids
+
+    elif action == "summarize_project":
+        project = action_data.get("project")
+        if not project:
+            raise ActionError("Il comando non specifica il progetto da riassumere.")
+        # Tutti gli issue del progetto, in streaming: map-reduce a blocchi entro il budget di token
+        summarizer = MapReduceSummarizer(parser)
+        # il progetto è già nel prompt: per ogni issue bastano ID, titolo, stato e priorità
+        issues = yt.iter_issues(filters={"project": project}, fields=("id", "summary", "state", "priority"))
+        summary = summarizer.summarize(project, issues)
+        if summary is None:
+            print(f"📋 Nessun issue trovato per il progetto {project}.")
+            return None
+        stats = summarizer.stats
+        print("📊 Riassunto stato progetto", project)
+        print(summary)
+        print(f"   ({stats['issues']} issue in {stats['chunks']} blocchi, "
+              f"{stats['llm_calls']} chiamate LLM, {stats['total_tokens']} token"
+              + (f", {stats['dropped']} issue esclusi" if stats["dropped"] else "") + ")")
+        return {"summary": summary, "stats": stats}
+
+    elif action == "link_issues":
+        from_issue = action_data.get("from")
+        to_issue = action_data.get("to")
+        link_type = action_data.get("link_type") or "relates"
+        if not from_issue or not to_issue:
+            raise ActionError("Per link_issues servono 'from' e 'to'.")
+        return yt.link_issues(from_issue, to_issue, link_type)
+
+    elif action == "show_epic_hierarchy":
+        epic_id = (
+            action_data.get("epic")
+            or action_data.get("issue")
+            or action_data.get("issue_id")
+        )
+        if not epic_id:
+            raise ActionError("Devi specificare l'Epic, es: SUP-17")
+        max_depth = int(action_data.get("max_depth") or 5)
+        tree = yt.get_epic_tree(epic_id, max_depth=max_depth)
+
+        print(f"\n📂 Gerarchia per Epic {epic_id}\n")
+        if not tree["children"]:
+            print(f"{epic_id}")
+            print("   (Nessun subtask presente)")
+        else:
+            for line in yt.render_epic_tree(tree):
+                print(line)
+        if tree["truncated"]:
+            print(f"   … (gerarchia troncata a profondità {max_depth})")
+        for parent_id, child_id in tree["cycles"]:
+            log.warning("Ciclo di subtask: %s è sia antenato sia subtask di %s", child_id, parent_id)
+        print("")
+        return tree
+
+    elif action == "plan":
+        steps = action_data.get("steps") or []
+        if not steps:
+            raise ActionError("Il piano non contiene passi.")
+        return execute_plan(yt, parser, steps, max_workers=max_workers)
+
+    elif action == "sync_project":
+        project = action_data.get("project")
+        if not project:
+            raise ActionError("Per sync_project serve il progetto da sincronizzare.")
+        if yt.mirror is None:
+            raise ActionError("Mirror locale non attivo: avviare con --mirror (o YT_MIRROR=1).")
+        return yt.mirror.sync(project, full=bool(action_data.get("full")))
+
+    raise ActionError(f"Azione non riconosciuta o non supportata: {action}")
+
+
+REFERENCE_PATTERN = re.compile(r"\$(\d+)(?:\.(\w+))?")
+
+
+def resolve_references(value, results: list):
+    """
+    Sostituisce i riferimenti '$N' / '$N.chiave' con il risultato del comando N (1-based)
+    già eseguito, es. "$1" -> "SUP-10" oppure "$1.epic" -> "SUP-10".
+    Lavora ricorsivamente su dict/liste; un riferimento a un comando fallito o non
+    ancora eseguito solleva ActionError.
+    """
+    if isinstance(value, dict):
+        return {k: resolve_references(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(v, results) for v in value]
+    if not isinstance(value, str) or "$" not in value:
+        return value
+
+    def lookup(match: re.Match):
+        index = int(match.group(1))
+        if index < 1 or index > len(results) or results[index - 1] is None:
+            raise ActionError(f"Riferimento {match.group(0)} a un comando fallito o non ancora eseguito.")
+        result = results[index - 1]
+        key = match.group(2)
+        if key is not None:
+            if not isinstance(result, dict) or key not in result:
+                raise ActionError(f"Riferimento {match.group(0)}: il risultato del comando {index} non ha '{key}'.")
+            result = result[key]
+        return result
+
+    full = REFERENCE_PATTERN.fullmatch(value)
+    if full:
+        # riferimento "puro": manteniamo il tipo del risultato (stringa, dict, lista...)
+        return lookup(full)
+    return REFERENCE_PATTERN.sub(lambda m: str(lookup(m)), value)
+
 
-            # La libreria Python espone direttamente response.output_text
-            # che concatena il testo finale dell'assistente.
+def plan_dependencies(steps: list) -> list[set]:
+    """
+    Per ogni passo di un piano, l'insieme dei passi (1-based) da cui dipende: quelli
+    citati con $N/$N.chiave nei parametri più quelli elencati in 'after'.
+    Solleva ActionError per riferimenti a passi inesistenti o successivi.
+    """
+    def references(value) -> set:
+        if isinstance(value, dict):
+            return set().union(*(references(v) for v in value.values())) if value else set()
+        if isinstance(value, list):
+            return set().union(*(references(v) for v in value)) if value else set()
+        if isinstance(value, str):
+            return {int(m.group(1)) for m in REFERENCE_PATTERN.finditer(value)}
+        return set()
+
+    dependencies = []
+    for index, step in enumerate(steps, start=1):
+        params = {k: v for k, v in step.items() if k != "after"}
+        deps = references(params) | {int(n) for n in step.get("after") or []}
+        invalid = sorted(n for n in deps if n < 1 or n >= index)
+        if invalid:
+            raise ActionError(f"Passo {index}: riferimento a passi non precedenti {invalid}.")
+        dependencies.append(deps)
+    return dependencies
+
+
+def execute_plan(yt: YouTrackClient, parser: GPTParser, steps: list,
+                 max_workers: int | None = None) -> list[dict]:
+    """
+    Esegue i passi di un piano come grafo di dipendenze: ogni passo parte appena i
+    passi da cui dipende (plan_dependencies) sono completati, quelli indipendenti in
+    parallelo (al più 'max_workers'). I riferimenti $N/$N.chiave vengono risolti con
+    i risultati dei passi (resolve_references); se un passo fallisce, quelli che ne
+    dipendono vengono saltati.
+
+    Ritorna un record per passo, nell'ordine del piano:
+      {"step": 1, "action": {...}, "ok": True, "result": ...}
+      {"step": 3, "action": {...}, "ok": False, "error": "..."}
+    """
+    dependencies = plan_dependencies(steps)
+    results: list = [None] * len(steps)
+    records: list = [None] * len(steps)
+    pending = set(range(len(steps)))
+    running = {}
+
+    def run(index: int):
+        step = {k: v for k, v in steps[index].items() if k != "after"}
+        action_data = resolve_references(step, results)
+        return action_data, execute_action(yt, parser, action_data, max_workers=max_workers)
+
+    if max_workers is None:
+        max_workers = YT_MAX_WORKERS
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(steps)))) as pool:
+        while pending or running:
+            # avvia (o salta, se una dipendenza è fallita) i passi pronti
+            for index in sorted(pending):
+                deps = dependencies[index]
+                if any(records[d - 1] is None for d in deps):
+                    continue
+                pending.discard(index)
+                failed = sorted(d for d in deps if not records[d - 1]["ok"])
+                if failed:
+                    records[index] = {"step": index + 1, "action": steps[index], "ok": False,
+                                      "error": f"saltato: dipende dai passi falliti {failed}"}
+                    continue
+                print(f"▶ Passo {index + 1}: {steps[index].get('action')}")
+                running[pool.submit(TRACER.bind(run), index)] = index
+
+            if not running:
+                continue
+            done = next(as_completed(running))
+            index = running.pop(done)
             try:
-                output_text = getattr(response, "output_text", None)
-            except Exception:
-                output_text = None
-
-            if output_text:
-                print()
-                print(output_text)
-                print()
+                action_data, result = done.result()
+            except Exception as e:
+                records[index] = {"step": index + 1, "action": steps[index], "ok": False, "error": str(e)}
             else:
-                # Fallback: stampiamo il raw response (utile per debug)
-                print("[DEBUG] Nessun output_text, risposta grezza:")
-                print(response)
+                results[index] = result
+                records[index] = {"step": index + 1, "action": action_data, "ok": True, "result": result}
+
+    for record in records:
+        if record["ok"]:
+            print(f"✅ Passo {record['step']} ({record['action'].get('action')}): {record['result']}")
+        else:
+            print(f"❌ Passo {record['step']} ({record['action'].get('action')}): {record['error']}")
+    return records
+
+
+def run_batch(yt: YouTrackClient, parser: GPTParser, source: str, output: str | None = None,
+              workers: int = YT_BATCH_WORKERS, max_workers: int | None = None) -> int:
+    """
+    Modalità batch: legge un comando per riga da 'source' (file o '-' per stdin; righe
+    vuote e commenti '#' ignorati), li fa interpretare a GPT in parallelo con 'workers'
+    thread, ed esegue le azioni nell'ordine del file man mano che il parsing è pronto.
+
+    I comandi possono riferirsi ai risultati dei precedenti con $N / $N.chiave
+    (vedi resolve_references). Per ogni comando viene emessa una riga JSONL su
+    'output' (o stdout); i messaggi per l'utente vanno su stderr.
+    Ritorna il numero di comandi falliti.
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    commands = [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    results: list = []
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            # Il parsing di tutti i comandi parte subito; l'esecuzione segue l'ordine del file
+            futures = [pool.submit(parser.parse_command, command) for command in commands]
+            for index, (command, future) in enumerate(zip(commands, futures), start=1):
+                record = {"index": index, "command": command}
+                result = None
+                try:
+                    action_data = future.result()
+                except Exception as e:
+                    record.update({"ok": False, "stage": "parse", "error": str(e)})
+                else:
+                    record["action"] = action_data
+                    try:
+                        # in un piano $N indica i passi del piano, non i comandi del batch
+                        if action_data.get("action") != "plan":
+                            action_data = resolve_references(action_data, results)
+                        record["action"] = action_data
+                        with redirect_stdout(sys.stderr):
+                            result = execute_action(yt, parser, action_data, max_workers=max_workers)
+                        record.update({"ok": True, "result": result})
+                    except Exception as e:
+                        record.update({"ok": False, "stage": "execute", "error": str(e)})
+
+                if not record["ok"]:
+                    failures += 1
+                    result = None
+                results.append(result)
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+    finally:
+        if output:
+            out.close()
+
+    print(f"📦 Batch completato: {len(commands)} comandi, {failures} falliti.", file=sys.stderr)
+    return failures
 
-        except Exception as e:
-            print(f"❌ Errore durante la chiamata MCP: {e}")
 
 # Esecuzione principale: loop per leggere comandi da console
 if __name__ == "__main__":
@@ -776,9 +4450,189 @@ if __name__ == "__main__":
         action="store_true",
         help="Usa OpenAI Responses API + MCP server di YouTrack invece del parser GPT custom."
     )
+    arg_parser.add_argument(
+        "--no-stream",
+        dest="no_stream",
+        action="store_true",
+        help="In modalità MCP attende la risposta completa invece di mostrarla in streaming"
+    )
+    arg_parser.add_argument(
+        "--mcp-local",
+        dest="mcp_local",
+        action="store_true",
+        help="Modalità MCP con client locale: lo script apre la sessione MCP ed esegue "
+             "le chiamate agli strumenti (implica --use-mcp)"
+    )
+    arg_parser.add_argument(
+        "--mcp-tools",
+        dest="mcp_tools",
+        default=",".join(YT_MCP_TOOLS),
+        help="Strumenti MCP abilitati, separati da virgola "
+             "(es. search_issues,get_issue,create_issue; default: YT_MCP_TOOLS o tutti)"
+    )
+
+    arg_parser.add_argument(
+        "--http-pool-size",
+        dest="http_pool_size",
+        type=int,
+        default=YT_HTTP_POOL_SIZE,
+        help="Numero di connessioni keep-alive nel pool HTTP (default: YT_HTTP_POOL_SIZE o 10)"
+    )
+    arg_parser.add_argument(
+        "--http-timeout",
+        dest="http_timeout",
+        type=float,
+        default=YT_HTTP_TIMEOUT,
+        help="Timeout in secondi per ogni chiamata REST a YouTrack (default: YT_HTTP_TIMEOUT o 30)"
+    )
+    arg_parser.add_argument(
+        "--http-retries",
+        dest="http_retries",
+        type=int,
+        default=YT_HTTP_RETRIES,
+        help="Numero massimo di retry su errori 5xx/429 (default: YT_HTTP_RETRIES o 3)"
+    )
+
+    arg_parser.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        type=int,
+        default=YT_MAX_WORKERS,
+        help="Operazioni YouTrack in parallelo, es. figli di un Epic (default: YT_MAX_WORKERS o 8; 1 = sequenziale)"
+    )
+
+    arg_parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Disabilita la cache persistente di progetti/utenti/link type (equivale a YT_CACHE_DISABLE=1)"
+    )
+    arg_parser.add_argument(
+        "--cache-invalidate",
+        dest="cache_invalidate",
+        nargs="?",
+        const="all",
+        metavar="NAMESPACE",
+        help="Svuota la cache persistente per l'istanza YouTrack corrente "
+             "(tutta, oppure un namespace: project, user, link_types, parse) ed esce"
+    )
+
+    arg_parser.add_argument(
+        "--no-parse-cache",
+        dest="no_parse_cache",
+        action="store_true",
+        help="Non usa la cache dei comandi già interpretati da GPT (equivale a YT_PARSE_CACHE=0)"
+    )
+
+    arg_parser.add_argument(
+        "--no-fast-path",
+        dest="no_fast_path",
+        action="store_true",
+        help="Invia sempre i comandi a GPT, senza il pre-parser locale a regole (equivale a YT_FAST_PATH=0)"
+    )
+
+    arg_parser.add_argument(
+        "--batch",
+        dest="batch",
+        metavar="FILE|-",
+        help="Esegue i comandi contenuti nel file (uno per riga, '-' = stdin) ed emette un risultato JSONL per comando"
+    )
+    arg_parser.add_argument(
+        "--batch-workers",
+        dest="batch_workers",
+        type=int,
+        default=YT_BATCH_WORKERS,
+        help="Comandi interpretati in parallelo da GPT in modalità --batch (default: YT_BATCH_WORKERS o 4)"
+    )
+    arg_parser.add_argument(
+        "--batch-output",
+        dest="batch_output",
+        metavar="FILE",
+        help="File JSONL dei risultati di --batch (default: stdout)"
+    )
+
+    arg_parser.add_argument(
+        "--user-directory",
+        dest="user_directory",
+        action="store_true",
+        help="Carica una volta tutti gli utenti e risolve gli assegnatari in locale (equivale a YT_USER_DIRECTORY=1)"
+    )
+    arg_parser.add_argument(
+        "--mirror",
+        dest="mirror",
+        action="store_true",
+        help="Usa il mirror locale SQLite per le letture dei progetti sincronizzati (equivale a YT_MIRROR=1)"
+    )
+    arg_parser.add_argument(
+        "--sync",
+        dest="sync",
+        action="append",
+        metavar="PROJECT",
+        help="Sincronizza il mirror locale del progetto (ripetibile) prima di avviare; implica --mirror"
+    )
+    arg_parser.add_argument(
+        "--full-sync",
+        dest="full_sync",
+        action="store_true",
+        help="Con --sync esegue una sincronizzazione completa invece del delta sync"
+    )
+    arg_parser.add_argument(
+        "--no-plan-stream",
+        dest="no_plan_stream",
+        action="store_true",
+        help="Esegue create_epic_with_children solo a risposta GPT completa, senza pipeline in streaming"
+    )
+    arg_parser.add_argument(
+        "--parse-model",
+        dest="parse_model",
+        default=YT_PARSE_MODEL,
+        help="Modello per interpretare i comandi (default: YT_PARSE_MODEL o gpt-4.1-mini)"
+    )
+    arg_parser.add_argument(
+        "--escalation-model",
+        dest="escalation_model",
+        default=YT_PARSE_ESCALATION_MODEL,
+        help="Modello usato se la risposta di --parse-model non è valida "
+             "(default: YT_PARSE_ESCALATION_MODEL o gpt-4.1; stringa vuota = nessuna escalation)"
+    )
+    arg_parser.add_argument(
+        "--summary-model",
+        dest="summary_model",
+        default=YT_SUMMARY_MODEL,
+        help="Modello per i riassunti di progetto (default: YT_SUMMARY_MODEL o gpt-4.1)"
+    )
+    arg_parser.add_argument(
+        "--mcp-model",
+        dest="mcp_model",
+        default=YT_MCP_MODEL,
+        help="Modello per la modalità MCP (default: YT_MCP_MODEL o gpt-4.1)"
+    )
+    arg_parser.add_argument(
+        "--log-level",
+        dest="log_level",
+        default=YT_LOG_LEVEL,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        type=str.upper,
+        help="Livello dei messaggi diagnostici su stderr (default: YT_LOG_LEVEL o WARNING)"
+    )
+    arg_parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Traccia azioni e chiamate HTTP/LLM e mostra l'albero degli span dopo ogni comando"
+    )
+    arg_parser.add_argument(
+        "--metrics-out",
+        dest="metrics_out",
+        metavar="FILE",
+        help="All'uscita salva le metriche del tracing (Prometheus se FILE termina con .prom, altrimenti JSON)"
+    )
 
     args = arg_parser.parse_args()
 
+    logging.basicConfig(level=args.log_level, format="[%(levelname)s] %(message)s")
+    if args.trace or args.metrics_out:
+        TRACER.enabled = True
+
     base_url = (args.yt_url or YT_BASE_URL or "").rstrip("/")
     token = args.yt_token or YT_TOKEN
 
@@ -788,17 +4642,82 @@ if __name__ == "__main__":
             "d'ambiente oppure usare --yt-url e --yt-token da riga di comando."
         )
 
+    if args.cache_invalidate:
+        cache = PersistentCache(base_url)
+        namespace = None if args.cache_invalidate == "all" else args.cache_invalidate
+        removed = cache.invalidate(namespace)
+        cache.close()
+        print(f"🧹 Cache {args.cache_invalidate} svuotata per {base_url}: {removed} voci rimosse.")
+        raise SystemExit(0)
+
     # 🔽 Leggiamo anche la variabile di ambiente USE_MCP
     use_mcp_env = os.getenv("USE_MCP") == "1"
-    use_mcp = args.use_mcp or use_mcp_env
+    mcp_local = args.mcp_local or YT_MCP_LOCAL
+    use_mcp = args.use_mcp or use_mcp_env or mcp_local
+    mcp_tools = [t.strip() for t in args.mcp_tools.split(",") if t.strip()] or None
 
-    if use_mcp:
+    if use_mcp and mcp_local:
+        # Modalità MCP con client locale: sessione MCP e chiamate agli strumenti gestite qui
+        transport = HttpTransport(
+            pool_size=max(args.http_pool_size, args.max_workers),
+            timeout=args.http_timeout,
+            retries=args.http_retries,
+        )
+        run_mcp_local_cli(
+            base_url,
+            token,
+            GPTParser(OPENAI_API_KEY),
+            transport=transport,
+            allowed_tools=mcp_tools,
+            max_workers=args.max_workers,
+            model=args.mcp_model,
+        )
+    elif use_mcp:
         # Modalità MCP: lasciamo che GPT usi direttamente gli strumenti MCP
-        run_mcp_cli(base_url, token)
+        run_mcp_cli(
+            base_url,
+            token,
+            stream=YT_MCP_STREAM and not args.no_stream,
+            allowed_tools=mcp_tools,
+            model=args.mcp_model,
+        )
     else:
-        parser = GPTParser(OPENAI_API_KEY)
-        yt = YouTrackClient(base_url, token)
+        transport = HttpTransport(
+            # il pool deve coprire almeno i worker paralleli
+            pool_size=max(args.http_pool_size, args.max_workers),
+            timeout=args.http_timeout,
+            retries=args.http_retries,
+        )
+        cache = None if (args.no_cache or YT_CACHE_DISABLE) else PersistentCache(base_url)
+        yt = YouTrackClient(base_url, token, transport=transport, cache=cache)
+        if args.mirror or args.sync or YT_MIRROR:
+            yt.mirror = IssueMirror(yt)
+            for project in args.sync or []:
+                yt.mirror.sync(project, full=args.full_sync)
+        if args.user_directory or YT_USER_DIRECTORY:
+            yt.users = UserDirectory(yt)
+
+        parse_cache = None
+        if YT_PARSE_CACHE and not args.no_parse_cache:
+            # Livello su disco solo se la cache persistente è attiva
+            parse_cache = ParseCache(disk=cache)
+        fast_path = FastPathParser() if (YT_FAST_PATH and not args.no_fast_path) else None
+        parser = GPTParser(
+            OPENAI_API_KEY,
+            parse_cache=parse_cache,
+            fast_path=fast_path,
+            parse_models=[args.parse_model, args.escalation_model],
+            summary_model=args.summary_model,
+        )
+
+        if args.batch:
+            failed = run_batch(yt, parser, args.batch, output=args.batch_output,
+                               workers=args.batch_workers, max_workers=args.max_workers)
+            if args.metrics_out:
+                TRACER.export(args.metrics_out)
+            raise SystemExit(1 if failed else 0)
 
+        plan_stream = YT_PLAN_STREAM and not args.no_plan_stream
         print("💡 Applicazione YouTrack Natural Language pronta. Inserisci un comando (o 'exit' per uscire).")
         while True:
             try:
@@ -810,190 +4729,55 @@ if __name__ == "__main__":
             if user_input.lower() in ("exit", "quit", "esci"):
                 print("👋 Uscita dall'applicazione.")
                 break
+            if user_input.lower() in ("stats", ":stats"):
+                print("📈 Statistiche:")
+                stats = parser.stats()
+                if yt.users is not None:
+                    stats["user_directory"] = yt.users.stats()
+                print(json.dumps(stats, indent=2, ensure_ascii=False))
+                continue
+            if user_input.lower() in ("trace", ":trace", "metrics", ":metrics"):
+                if not TRACER.enabled:
+                    print("⚠️ Tracing non attivo: avviare con --trace (o YT_TRACE=1).")
+                elif "trace" in user_input.lower():
+                    for span in list(TRACER.traces)[-2:]:
+                        print("\n".join(TRACER.render(span)))
+                else:
+                    print(json.dumps(TRACER.summary(), indent=2, ensure_ascii=False))
+                continue
+            # Con la pipeline attiva gli Epic con figli vengono creati mentre GPT genera il piano
+            plan = StreamedEpicPlan(yt, max_workers=args.max_workers) if plan_stream else None
             try:
                 # Passa il comando a GPT-4 per l'interpretazione
-                action_data = parser.parse_command(user_input)
-                print("[DEBUG] JSON interpretato da GPT:")
-                print(json.dumps(action_data, indent=2, ensure_ascii=False))
+                action_data = parser.parse_command(
+                    user_input,
+                    on_value=plan.on_value if plan else None,
+                    on_discard=plan.discard if plan else None,
+                )
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("JSON interpretato da GPT:\n%s", json.dumps(action_data, indent=2, ensure_ascii=False))
             except Exception as e:
                 print(f"Errore nell'interpretazione del comando: {e}")
+                if plan is not None:
+                    plan.abort()
                 continue
 
             # Esegue l'azione appropriata in base al JSON ricevuto
-            action = action_data.get("action")
             try:
-                if action == "create_project":
-                    name = action_data.get("name") or action_data.get("project_name")
-                    key = action_data.get("key") or action_data.get("project_key")
-                    description = action_data.get("description", "")
-                    if not name or not key:
-                        print("⚠️ Il comando non specifica nome e chiave del progetto.")
-                    else:
-                        yt.create_project(name, key, description)
-
-                elif action == "create_issue":
-                    fields = action_data.get("fields") or {}
-                    # project può stare top-level oppure dentro fields
-                    project = (
-                        action_data.get("project")
-                        or action_data.get("project_key")
-                        or fields.get("project")
-                    )
-                    summary = (
-                        action_data.get("summary")
-                        or fields.get("summary")
-                        or action_data.get("title")
-                        or "Nuovo Issue"
-                    )
-                    description = (
-                        action_data.get("description")
-                        or fields.get("description")
-                        or ""
-                    )
-                    assignee = (
-                        action_data.get("assignee")
-                        or fields.get("assignee")
-                        or ""
-                    )
-                    priority = (
-                        action_data.get("priority")
-                        or fields.get("Priority")  # GPT spesso usa 'Priority' maiuscolo
-                        or fields.get("priority")
-                        or ""
-                    )
-                    if not project:
-                        print("⚠️ Il comando non specifica il progetto per create_issue.")
-                    else:
-                        yt.create_issue(project, summary, description, assignee, priority)
-
-                elif action == "create_epic":
-                    fields = action_data.get("fields") or {}
-                    project = (
-                        action_data.get("project")
-                        or action_data.get("project_key")
-                        or fields.get("project")
-                    )
-                    summary = (
-                        action_data.get("summary")
-                        or fields.get("summary")
-                        or action_data.get("title")
-                    )
-                    description = (
-                        action_data.get("description")
-                        or fields.get("description")
-                        or ""
-                    )
-                    assignee = (
-                        action_data.get("assignee")
-                        or fields.get("assignee")
-                        or ""
-                    )
-                    priority = (
-                        action_data.get("priority")
-                        or fields.get("Priority")
-                        or fields.get("priority")
-                        or ""
-                    )
-                    if not project or not summary:
-                        print("⚠️ Per create_epic servono almeno project e summary.")
-                    else:
-                        yt.create_epic(project, summary, description, assignee, priority)
-
-                elif action == "create_epic_with_children":
-                    project = action_data.get("project") or action_data.get("project_key")
-                    epic = action_data.get("epic") or {}
-                    children = action_data.get("children") or []
-                    link_type = action_data.get("link_type") or "subtask"
-
-                    if not project:
-                        print("⚠️ Per create_epic_with_children serve il project.")
-                    elif not epic:
-                        print("⚠️ Per create_epic_with_children serve l'oggetto 'epic'.")
-                    else:
-                        yt.create_epic_with_children(project, epic, children, child_link_type=link_type)
-
-                elif action == "update_issue":
-                    issue = action_data.get("issue") or action_data.get("issue_id")
-                    fields = action_data.get("fields") or {}
-                    custom_fields = action_data.get("customFields") or []
-
-                    if not issue:
-                        print("⚠️ Il comando non specifica l'issue da aggiornare.")
-                    elif not fields and not custom_fields:
-                        print("⚠️ Nessun campo da aggiornare per update_issue.")
-                    else:
-                        yt.update_issue(issue, fields=fields, custom_fields=custom_fields)
-
-                elif action == "change_issue_assignee":
-                    issue = action_data.get("issue") or action_data.get("issue_id")
-                    assignee = action_data.get("assignee") or action_data.get("new_assignee")
-                    if not issue or not assignee:
-                        print("⚠️ Specificare sia l'issue che il nuovo assegnatario.")
-                    else:
-                        yt.change_issue_assignee(issue, assignee)
-
-                elif action == "delete_issue":
-                    issue = action_data.get("issue") or action_data.get("issue_id")
-                    if not issue:
-                        print("⚠️ Specificare l'ID dell'issue da eliminare.")
-                    else:
-                        yt.delete_issue(issue)
-
-                elif action == "list_issues":
-                    filters = action_data.get("filters") or {}
-                    limit = action_data.get("limit", 20)
-                    issues = yt.list_issues(filters=filters, limit=limit)
-                    print("📋 Lista issue:")
-                    if not issues:
-                        print("   (nessun issue trovato)")
-                    for i in issues:
-                        print(f" - {i['id']} [{i['project']}] {i['summary']}")
-
-                elif action == "summarize_project":
-                    project = action_data.get("project")
-                    if not project:
-                        print("⚠️ Il comando non specifica il progetto da riassumere.")
-                    else:
-                        filters = {"project": project}
-                        issues = yt.list_issues(filters=filters, limit=50)
-                        if not issues:
-                            print(f"📋 Nessun issue trovato per il progetto {project}.")
-                        else:
-                            summary = parser.summarize_issues(project, issues)
-                            print("📊 Riassunto stato progetto", project)
-                            print(summary)
-
-                elif action == "link_issues":
-                    from_issue = action_data.get("from")
-                    to_issue = action_data.get("to")
-                    link_type = action_data.get("link_type") or "relates"
-                    if not from_issue or not to_issue:
-                        print("⚠️ Per link_issues servono 'from' e 'to'.")
-                    else:
-                        yt.link_issues(from_issue, to_issue, link_type)
-                elif action == "show_epic_hierarchy":
-                    epic_id = (
-                        action_data.get("epic")
-                        or action_data.get("issue")
-                        or action_data.get("issue_id")
-                    )
-                    if not epic_id:
-                        print("⚠️ Devi specificare l'Epic, es: SUP-17")
-                    else:
-                        children = yt.get_children_of_epic(epic_id)
-
-                        print(f"\n📂 Gerarchia per Epic {epic_id}\n")
-                        print(f"{epic_id}")
-
-                        if not children:
-                            print("   (Nessun subtask presente)")
-                        else:
-                            for c in children:
-                                print(f"   └── {c['id']} {c['summary']} ({c['type']} – {c['priority']})")
-                        print("")
-
+                if plan is not None and plan.started and action_data.get("action") == plan.ACTION:
+                    plan.finish(action_data)
                 else:
-                    print(f"⚠️ Azione non riconosciuta o non supportata: {action}")
-
+                    if plan is not None:
+                        # piano avviato ma azione finale diversa: si chiude quanto avviato
+                        plan.abort()
+                    execute_action(yt, parser, action_data, max_workers=args.max_workers)
+            except ActionError as e:
+                print(f"⚠️ {e}")
             except Exception as e:
                 print(f"❌ Errore durante l'esecuzione dell'azione: {e}")
+            if args.trace and TRACER.traces:
+                print("🔎 " + "\n   ".join(TRACER.render(TRACER.traces[-1])))
+
+        if args.metrics_out:
+            TRACER.export(args.metrics_out)
+            print(f"💾 Metriche salvate in {args.metrics_out}")